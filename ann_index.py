@@ -0,0 +1,234 @@
+# ann_index.py
+"""
+FAISS index types for the chunk vectors, picked by corpus size.
+
+- flat:   exact inner product. Best up to ~20k vectors.
+- hnsw:   graph index. Fast, high recall, but keeps float32 vectors plus the graph.
+- ivf:    inverted lists over k-means cells (IVF-Flat). Cheaper to build than HNSW.
+- ivfpq:  IVF with product-quantized codes. ~30x less RAM, approximate scores.
+
+`resolve_params` fills in defaults for the chosen type. Any value can be
+overridden from build_index.py (--index-type, --nlist, --nprobe, --hnsw-m,
+--ef-search, ...). The build measures recall@k against exact search and saves
+everything to index_params.json next to faiss.index. FAISS does not persist
+search-time knobs (nprobe, efSearch), so the engine reapplies them with
+`apply_search_params` after loading the index.
+
+All index types are addressed by the stable chunk vector ids. Flat and HNSW
+sit behind an IndexIDMap2; IVF indexes store the ids themselves and keep a
+hash-table direct map so `reconstruct(vid)` and `remove_ids` still work.
+"""
+import os
+import json
+import math
+
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+# Auto selection: the first type whose vector-count limit is above the corpus size
+AUTO_LIMITS = (
+    ("flat", 20_000),
+    ("hnsw", 200_000),
+    ("ivf", 2_000_000),
+    ("ivfpq", None),
+)
+
+# Search-time overrides applied when the index is loaded (0 = keep the build value)
+NPROBE = int(os.environ.get("CEYLONTRIP_NPROBE", "0"))
+EF_SEARCH = int(os.environ.get("CEYLONTRIP_EF_SEARCH", "0"))
+
+RECALL_K = 10
+RECALL_QUERIES = 200
+# k-means wants roughly this many training points per centroid
+POINTS_PER_CENTROID = 39
+# Train on at most this many points per centroid
+MAX_TRAIN_PER_CENTROID = 256
+
+
+def choose_index_type(n_vectors: int) -> str:
+    for kind, limit in AUTO_LIMITS:
+        if limit is None or n_vectors < limit:
+            return kind
+    return AUTO_LIMITS[-1][0]
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # Largest divisor of dim with at least 8 dimensions per sub-quantizer
+    for m in range(max(1, dim // 8), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def resolve_params(kind: str, n_vectors: int, dim: int, overrides: dict = None) -> dict:
+    """Full parameter set for `kind` ("auto" picks by size); `None` overrides are ignored."""
+    overrides = {k: v for k, v in (overrides or {}).items() if v is not None}
+    if kind == "auto":
+        kind = choose_index_type(n_vectors)
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}; choose from {', '.join(INDEX_TYPES)}")
+
+    params = {"type": kind, "dim": dim}
+    if kind == "hnsw":
+        params.update({"M": 32, "ef_construction": 80, "ef_search": 64})
+    elif kind in ("ivf", "ivfpq"):
+        nlist = max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // POINTS_PER_CENTROID))
+        params.update({"nlist": nlist, "nprobe": min(nlist, max(8, nlist // 16))})
+        if kind == "ivfpq":
+            # 2^nbits centroids per sub-quantizer need enough training points too
+            nbits = int(math.log2(max(2, n_vectors // POINTS_PER_CENTROID)))
+            params.update({"pq_m": _pq_subquantizers(dim), "pq_nbits": max(1, min(8, nbits))})
+    params.update({k: v for k, v in overrides.items() if k in params and k not in ("type", "dim")})
+    if kind in ("ivf", "ivfpq"):
+        params["nprobe"] = min(params["nprobe"], params["nlist"])
+    if kind == "ivfpq" and dim % params["pq_m"]:
+        raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dimension {dim}")
+    return params
+
+
+# ---------- Building ----------
+def training_rows(params: dict, n_vectors: int) -> np.ndarray:
+    """Sorted row numbers to train an IVF index on (empty for other types)."""
+    if params["type"] not in ("ivf", "ivfpq"):
+        return np.empty(0, dtype="int64")
+    n_centroids = params["nlist"]
+    if params["type"] == "ivfpq":
+        n_centroids = max(n_centroids, 1 << params["pq_nbits"])
+    n_train = min(n_vectors, n_centroids * MAX_TRAIN_PER_CENTROID)
+    rng = np.random.default_rng(0)
+    return np.sort(rng.choice(n_vectors, n_train, replace=False))
+
+
+def build_index(shards, params: dict, train_vectors: np.ndarray = None):
+    """
+    Build the index described by `params` (see `resolve_params`) and add
+    the (vids, vectors) `shards` one at a time. IVF types are trained on
+    `train_vectors` first (see `training_rows`).
+    """
+    import faiss
+
+    dim, kind = params["dim"], params["type"]
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    elif kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, params["M"], faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = params["ef_construction"]
+        index = faiss.IndexIDMap2(hnsw)
+    else:
+        quantizer = faiss.IndexFlatIP(dim)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(
+                quantizer, dim, params["nlist"], params["pq_m"], params["pq_nbits"],
+                faiss.METRIC_INNER_PRODUCT,
+            )
+        index.train(train_vectors)
+        # Lets reconstruct(vid) and remove_ids work on arbitrary ids
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    for vids, vectors in shards:
+        index.add_with_ids(vectors, vids)
+    apply_search_params(index, params)
+    return index
+
+
+def can_update(previous: dict, params: dict) -> bool:
+    """Whether an index built with `previous` can be patched in place for `params`."""
+    if previous is None or previous["type"] != params["type"]:
+        return False
+    kind = params["type"]
+    if kind == "flat":
+        return True
+    if kind == "hnsw":
+        # HNSW graphs don't support removals
+        return False
+    # IVF: keep the trained cells while the corpus stays in the same size range
+    if kind == "ivfpq" and (previous["pq_m"], previous["pq_nbits"]) != (params["pq_m"], params["pq_nbits"]):
+        return False
+    return params["nlist"] / 2 <= previous["nlist"] <= params["nlist"] * 2
+
+
+# ---------- Search-time parameters ----------
+def _inner(index):
+    import faiss
+
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def search_overrides(params: dict) -> dict:
+    """`params` with CEYLONTRIP_NPROBE / CEYLONTRIP_EF_SEARCH applied, for serving."""
+    params = dict(params)
+    if NPROBE:
+        params["nprobe"] = NPROBE
+    if EF_SEARCH:
+        params["ef_search"] = EF_SEARCH
+    return params
+
+
+def apply_search_params(index, params: dict):
+    """Set nprobe / efSearch on a built or freshly loaded index."""
+    import faiss
+
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = params.get("nprobe", inner.nprobe)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = params.get("ef_search", inner.hnsw.efSearch)
+
+
+def search_parameters(index, selector):
+    """SearchParameters carrying `selector` plus the index's current nprobe / efSearch."""
+    import faiss
+
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+# ---------- Recall ----------
+def recall_query_rows(n_vectors: int, n_queries: int = RECALL_QUERIES) -> np.ndarray:
+    """Fixed sample of corpus rows used as recall queries."""
+    rng = np.random.default_rng(0)
+    return np.sort(rng.choice(n_vectors, min(n_queries, n_vectors), replace=False))
+
+
+def measure_recall(index, queries: np.ndarray, shards, k: int = RECALL_K) -> float:
+    """
+    recall@k of `index` for `queries` against exact inner-product search
+    over the (vids, vectors) `shards`, streamed so the corpus is never
+    stacked into one matrix.
+    """
+    k = min(k, index.ntotal)
+    best_scores = np.full((len(queries), k), -np.inf, dtype="float32")
+    best_ids = np.full((len(queries), k), -1, dtype="int64")
+    for vids, vectors in shards:
+        scores = np.concatenate([best_scores, queries @ vectors.T], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(vids, (len(queries), len(vids)))], axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+
+    _, found = index.search(queries, k)
+    hits = sum(len(set(e.tolist()) & set(f.tolist())) for e, f in zip(best_ids, found))
+    return hits / best_ids.size
+
+
+# ---------- Persistence ----------
+def save_params(path: str, params: dict):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def load_params(path: str) -> dict:
+    # Builds from before index types existed are always exact flat indexes
+    if not os.path.exists(path):
+        return {"type": "flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
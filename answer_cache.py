@@ -0,0 +1,164 @@
+# answer_cache.py
+"""
+Semantic answer cache that sits in front of answer_question.
+
+A stored answer is reused when the new query embedding is within a cosine
+similarity threshold of a previous query. Entries are evicted LRU-first once
+the entry count or memory cap is exceeded, and expire after a TTL.
+
+Every entry belongs to a namespace built from the LLM model name and a hash
+of the index files, so rebuilding the index (or switching models) empties the
+cache on the next lookup.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_THRESHOLD = float(os.environ.get("CEYLONTRIP_CACHE_THRESHOLD", "0.95"))
+CACHE_MAX_ENTRIES = int(os.environ.get("CEYLONTRIP_CACHE_MAX_ENTRIES", "512"))
+CACHE_MAX_MB = float(os.environ.get("CEYLONTRIP_CACHE_MAX_MB", "32"))
+CACHE_TTL_S = float(os.environ.get("CEYLONTRIP_CACHE_TTL_S", str(24 * 3600)))
+
+# Rough per-entry bookkeeping cost on top of the vector and answer bytes.
+_ENTRY_OVERHEAD = 256
+
+
+# ---------- Namespace (model + index version) ----------
+_file_hashes = {}
+
+
+def file_hash(path: str) -> str:
+    """
+    Content hash of a file, recomputed only when its size or mtime changes,
+    so calling this on every query costs one stat().
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = _file_hashes.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    _file_hashes[path] = (stamp, digest)
+    return digest
+
+
+def make_namespace(model_name: str, *paths: str) -> str:
+    h = hashlib.sha1(model_name.encode("utf-8"))
+    for path in paths:
+        h.update(file_hash(path).encode("ascii"))
+    return h.hexdigest()
+
+
+# ---------- Cache ----------
+class SemanticCache:
+    def __init__(
+        self,
+        threshold: float = CACHE_THRESHOLD,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_mb: float = CACHE_MAX_MB,
+        ttl_s: float = CACHE_TTL_S,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttl_s = ttl_s
+
+        self.namespace = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # key -> (unit vector, answer, created_at, size_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        vec = np.asarray(vec, dtype="float32").reshape(-1)
+        return vec / (np.linalg.norm(vec) + 1e-12)
+
+    def _switch_namespace(self, namespace: str):
+        if namespace != self.namespace:
+            self._entries.clear()
+            self._bytes = 0
+            self.namespace = namespace
+
+    def _drop(self, key):
+        _, _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _purge_expired(self, now: float):
+        expired = [
+            k for k, (_, _, created, _) in self._entries.items()
+            if now - created > self.ttl_s
+        ]
+        for k in expired:
+            self._drop(k)
+
+    def get(self, query_vec, namespace: str):
+        """Return the cached answer for the closest query above threshold, or None."""
+        q = self._unit(query_vec)
+        with self._lock:
+            self._switch_namespace(namespace)
+            self._purge_expired(time.time())
+
+            best_key, best_sim = None, self.threshold
+            for key, (vec, _, _, _) in self._entries.items():
+                sim = float(np.dot(q, vec))
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][1]
+
+    def put(self, query_vec, answer: str, namespace: str):
+        vec = self._unit(query_vec)
+        size = vec.nbytes + len(answer.encode("utf-8")) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if namespace != self.namespace:
+                # Generated against an index version `get` has since moved past
+                return
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (vec, answer, time.time(), size)
+            self._bytes += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
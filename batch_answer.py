@@ -0,0 +1,217 @@
+# batch_answer.py
+"""
+Precompute answers for a JSONL file of questions.
+
+Input lines look like {"id": "faq-1", "question": "..."} ("id" defaults to
+the line number). Questions are read lazily in batches; each batch is
+embedded with one `encode` call and searched with one `index.search` over
+the whole query matrix (engine.prepare_turns), then sent to the LLM with at
+most --concurrency calls in flight while the next batch is prepared.
+
+Answers are appended to the output JSONL as they arrive, and
+`<out>.ckpt` records how many input lines are fully done. A killed run
+picks up where it stopped when started again with the same arguments;
+failed questions go to `<out>.errors.jsonl` and are retried on resume.
+
+LLM replies also land in the persistent response cache (response_cache.py),
+so a run over the FAQ before a release leaves the apps a warm cache.
+
+    python batch_answer.py faq.jsonl answers.jsonl [--batch-size 256] [--concurrency 4]
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import engine
+
+
+def read_questions(path: str, skip_lines: int = 0):
+    """Yield (line_no, id, question) lazily, starting after `skip_lines` lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            if line_no < skip_lines or not line.strip():
+                continue
+            item = json.loads(line)
+            yield line_no, str(item.get("id", line_no)), item["question"]
+
+
+def truncate_partial_line(path: str):
+    """Drop a half-written last line left by a killed run."""
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def load_records(path: str):
+    if not os.path.exists(path):
+        return []
+    truncate_partial_line(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compact_errors(path: str, done_ids):
+    """Keep only the failures that are still unanswered."""
+    left = {r["id"]: r for r in load_records(path) if r["id"] not in done_ids}
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for r in left.values():
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+    return len(left)
+
+
+class Checkpointer:
+    """
+    Appends results and advances `lines_done` once every question up to a
+    batch boundary has been written. Called from worker threads.
+    """
+
+    def __init__(self, out_path: str, input_path: str, lines_done: int):
+        self.out_path = out_path
+        self.ckpt_path = out_path + ".ckpt"
+        self.input_path = os.path.abspath(input_path)
+        self.lines_done = lines_done
+        self._out = open(out_path, "a", encoding="utf-8")
+        self._errors = open(out_path + ".errors.jsonl", "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._batches = []  # [end_line, remaining] in input order
+        self.counts = {"answered": 0, "canned": 0, "errors": 0}
+
+    def add_batch(self, end_line: int, size: int) -> list:
+        """Register the next `size` results as ending at input line `end_line`."""
+        batch = [end_line, size]
+        with self._lock:
+            self._batches.append(batch)
+            self._advance()
+        return batch
+
+    def record(self, batch: list, item: dict, kind: str):
+        with self._lock:
+            target = self._errors if kind == "errors" else self._out
+            target.write(json.dumps(item, ensure_ascii=False) + "\n")
+            target.flush()
+            self.counts[kind] += 1
+            batch[1] -= 1
+            self._advance()
+
+    def _advance(self):
+        moved = False
+        while self._batches and self._batches[0][1] == 0:
+            self.lines_done = self._batches.pop(0)[0]
+            moved = True
+        if moved:
+            tmp = self.ckpt_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"input": self.input_path, "lines_done": self.lines_done}, f)
+            os.replace(tmp, self.ckpt_path)
+
+    def close(self):
+        self._out.close()
+        self._errors.close()
+
+
+def load_checkpoint(out_path: str, input_path: str) -> int:
+    path = out_path + ".ckpt"
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        ckpt = json.load(f)
+    if ckpt.get("input") != os.path.abspath(input_path):
+        raise SystemExit(f"{path} belongs to another input file; remove it to start over.")
+    return ckpt["lines_done"]
+
+
+def run(input_path: str, out_path: str, batch_size: int, concurrency: int, voice: str):
+    errors_path = out_path + ".errors.jsonl"
+    lines_done = load_checkpoint(out_path, input_path)
+    done_ids = {r["id"] for r in load_records(out_path)}
+    # Failures behind the checkpoint are retried first
+    retry = {
+        r["id"]: r["question"] for r in load_records(errors_path) if r["id"] not in done_ids
+    }
+    if lines_done or done_ids:
+        print(f"Resuming: {lines_done} input lines checkpointed, {len(done_ids)} answers on disk, "
+              f"{len(retry)} failures to retry")
+
+    engine.load_all()
+    # --concurrency already bounds LLM calls, and a batch job should wait for
+    # the LLM rather than get the scheduler's "busy" reply
+    engine.llm_scheduler = None
+    ckpt = Checkpointer(out_path, input_path, lines_done)
+    # Bounds memory: at most this many prepared questions waiting for the LLM
+    slots = threading.BoundedSemaphore(concurrency * 4)
+    stats = {"prepare_s": 0.0, "questions": 0}
+
+    def generate(batch, qid, question, messages, q_vec, namespace):
+        try:
+            answer = engine.call_ollama(messages, namespace)
+            engine.answer_cache.put(q_vec, answer, namespace)
+            ckpt.record(batch, {"id": qid, "question": question, "answer": answer}, "answered")
+        except Exception as e:
+            ckpt.record(batch, {"id": qid, "question": question, "error": repr(e)}, "errors")
+        finally:
+            slots.release()
+
+    def batches():
+        retry_items = list(retry.items())
+        for i in range(0, len(retry_items), batch_size):
+            yield lines_done, retry_items[i:i + batch_size]
+        rows = read_questions(input_path, skip_lines=lines_done)
+        while True:
+            chunk = list(itertools.islice(rows, batch_size))
+            if not chunk:
+                return
+            todo = [(qid, q) for _, qid, q in chunk if qid not in done_ids and qid not in retry]
+            yield chunk[-1][0] + 1, todo
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for end_line, todo in batches():
+            stats["questions"] += len(todo)
+            t = time.perf_counter()
+            turns = engine.prepare_turns([q for _, q in todo], voice)
+            stats["prepare_s"] += time.perf_counter() - t
+
+            batch = ckpt.add_batch(end_line, len(todo))
+            for (qid, question), (reply, messages, q_vec, namespace) in zip(todo, turns):
+                if reply is not None:
+                    ckpt.record(batch, {"id": qid, "question": question, "answer": reply}, "canned")
+                    continue
+                slots.acquire()
+                pool.submit(generate, batch, qid, question, messages, q_vec, namespace)
+    ckpt.close()
+    n_failed = compact_errors(errors_path, {r["id"] for r in load_records(out_path)})
+
+    elapsed = time.perf_counter() - start
+    n = stats["questions"]
+    counts = ckpt.counts
+    print(f"\nQuestions processed: {n} in {elapsed:.1f}s ({n / elapsed if elapsed else 0:.2f} q/s)")
+    print(f"- LLM answers: {counts['answered']}  canned/cached: {counts['canned']}  "
+          f"errors: {counts['errors']}")
+    if n:
+        print(f"- embed + retrieve + prompt: {stats['prepare_s']:.2f}s total, "
+              f"{1000 * stats['prepare_s'] / n:.2f} ms/question")
+    print(f"- output: {out_path} (checkpoint at input line {ckpt.lines_done})")
+    if n_failed:
+        print(f"- {n_failed} failed question(s) in {errors_path} (rerun to retry them)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-answer a JSONL file of questions.")
+    parser.add_argument("input", help="JSONL with one {\"id\", \"question\"} per line")
+    parser.add_argument("output", help="answers JSONL (appended to; resumable)")
+    parser.add_argument("--batch-size", type=int, default=256, help="questions per encode/search")
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM calls in flight")
+    parser.add_argument("--voice", choices=sorted(engine.REPLIES), default="web")
+    args = parser.parse_args()
+    run(args.input, args.output, args.batch_size, args.concurrency, args.voice)
+
+
+if __name__ == "__main__":
+    main()
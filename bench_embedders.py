@@ -0,0 +1,137 @@
+# bench_embedders.py
+"""
+Compare embedding backends on the CeylonTrip corpus: load time, single-query
+encode latency, peak resident memory, and recall@k of each backend's
+top-k chunks against the float32 sentence-transformers baseline.
+
+Each backend runs in its own subprocess so RSS numbers are not polluted by
+the others. Needs a built index (reads meta.json of the live index version).
+
+Usage:
+    python bench_embedders.py [--backends sentence-transformers onnx onnx-int8 hashing]
+                              [--top-k 5] [--repeat 20]
+"""
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+import numpy as np
+
+from embedders import BACKENDS, DEFAULT_BACKEND, create_embedder
+from index_versions import current_dir
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+META_PATH = os.path.join(current_dir(os.path.join(BASE_DIR, "data", "index")), "meta.json")
+
+QUERIES = [
+    "Best surf spots in July",
+    "Kandy to Ella train",
+    "I have 7 days in August, I like nature and beaches",
+    "Where can I see leopards?",
+    "Temple etiquette and dress code",
+    "How do I climb Adam's Peak?",
+    "Whale watching in Mirissa",
+    "Quiet beaches on the east coast",
+    "Is tap water safe to drink?",
+    "How much should I tip?",
+    "Getting from the airport to Negombo",
+    "Ancient cities in the Cultural Triangle",
+    "Tea plantations and cool climate",
+    "Snorkeling near Galle",
+    "Jaffna food and culture",
+    "Kitesurfing in Kalpitiya",
+]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(backend: str, top_k: int, repeat: int):
+    with open(META_PATH, "r", encoding="utf-8") as f:
+        texts = [c["text"] for c in json.load(f)]
+
+    t = time.perf_counter()
+    embedder = create_embedder(backend).load()
+    load_s = time.perf_counter() - t
+
+    corpus = embedder.encode(texts, batch_size=64)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True) + 1e-12
+
+    embedder.encode([QUERIES[0]])  # warm-up
+    latencies, rankings = [], []
+    for _ in range(repeat):
+        for q in QUERIES:
+            t = time.perf_counter()
+            embedder.encode([q])
+            latencies.append((time.perf_counter() - t) * 1000)
+
+    queries = embedder.encode(QUERIES)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12
+    for row in queries @ corpus.T:
+        rankings.append(np.argsort(-row)[:top_k].tolist())
+
+    print(json.dumps({
+        "backend": backend,
+        "load_s": load_s,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "peak_rss_mb": peak_rss_mb(),
+        "rankings": rankings,
+    }))
+
+
+def recall_at_k(rankings, baseline) -> float:
+    return float(np.mean([
+        len(set(r) & set(b)) / len(b) for r, b in zip(rankings, baseline)
+    ]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends.")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.top_k, args.repeat)
+        return
+
+    if not os.path.exists(META_PATH):
+        raise SystemExit("Index not found. Run `python build_index.py` first.")
+
+    backends = [DEFAULT_BACKEND] + [b for b in args.backends if b != DEFAULT_BACKEND]
+    results = {}
+    for backend in backends:
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", backend,
+             "--top-k", str(args.top_k), "--repeat", str(args.repeat)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            last_line = (proc.stderr.strip().splitlines() or ["failed"])[-1]
+            print(f"{backend:<22} skipped: {last_line}")
+            continue
+        results[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    baseline = results.get(DEFAULT_BACKEND)
+    print(f"\n{'backend':<22}{'load s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'peak RSS MB':>13}{f'recall@{args.top_k}':>11}")
+    for backend, r in results.items():
+        recall = recall_at_k(r["rankings"], baseline["rankings"]) if baseline else float("nan")
+        print(f"{backend:<22}{r['load_s']:>8.2f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['peak_rss_mb']:>13.0f}{recall:>11.3f}")
+    if baseline is None:
+        print("(recall needs the sentence-transformers baseline)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench_hybrid.py
+"""
+Latency of hybrid (dense + BM25, RRF-fused) retrieval against dense-only
+search on the built index. Query embedding is done once up front so the
+numbers isolate the search + fusion cost.
+
+Usage:
+    python bench_hybrid.py [--repeat 200] [--top-k 3]
+"""
+import time
+import argparse
+
+import numpy as np
+
+from engine import embed_query, retrieve, get_lexical_index
+
+SAMPLE_QUERIES = [
+    "Hiriketiya",
+    "How do I climb Sri Pada?",
+    "CMB airport to Negombo",
+    "Kandy to Ella train",
+    "Best surf spots in July",
+    "I have 7 days in August, I like nature and beaches",
+    "Temple etiquette in Sri Lanka",
+    "Whale watching in Mirissa",
+]
+
+
+def time_retrieval(queries, vectors, repeat: int, top_k: int, hybrid: bool):
+    samples = []
+    for _ in range(repeat):
+        for query, q_vec in zip(queries, vectors):
+            start = time.perf_counter()
+            retrieve(query, top_k=top_k, q_vec=q_vec, hybrid=hybrid)
+            samples.append((time.perf_counter() - start) * 1000)
+    return np.array(samples)
+
+
+def first_lines(chunks):
+    return [c.splitlines()[0] for c in chunks]
+
+
+def describe(samples: np.ndarray) -> str:
+    return (
+        f"mean {samples.mean():.3f} ms · p50 {np.percentile(samples, 50):.3f} ms · "
+        f"p95 {np.percentile(samples, 95):.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    if get_lexical_index() is None:
+        raise SystemExit("bm25.json not found. Run `python build_index.py` first.")
+
+    vectors = [embed_query(q) for q in SAMPLE_QUERIES]
+
+    # Warm both paths before timing
+    time_retrieval(SAMPLE_QUERIES, vectors, 1, args.top_k, hybrid=False)
+    time_retrieval(SAMPLE_QUERIES, vectors, 1, args.top_k, hybrid=True)
+
+    dense = time_retrieval(SAMPLE_QUERIES, vectors, args.repeat, args.top_k, hybrid=False)
+    hybrid = time_retrieval(SAMPLE_QUERIES, vectors, args.repeat, args.top_k, hybrid=True)
+
+    print(f"Dense only : {describe(dense)}")
+    print(f"Hybrid RRF : {describe(hybrid)}")
+    print(f"Added (p50): {np.percentile(hybrid, 50) - np.percentile(dense, 50):.3f} ms")
+
+    print(f"\nTop-{args.top_k} per query (dense | hybrid):")
+    for query, q_vec in zip(SAMPLE_QUERIES, vectors):
+        print(f"- {query}")
+        print(f"    dense : {first_lines(retrieve(query, args.top_k, q_vec, hybrid=False))}")
+        print(f"    hybrid: {first_lines(retrieve(query, args.top_k, q_vec, hybrid=True))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# bench_ttft.py
+"""
+Time-to-first-token for cold and warm Ollama starts, comparing the old
+prompt layout (instructions inside the per-turn user message) with the
+prefix-stable one (all static text in the system message).
+
+For each layout:
+- cold:          model unloaded (keep_alive 0), then the first question
+- cold+warm-up:  model unloaded, engine-style warm-up, then the first question
+- warm:          follow-up questions with the model loaded (p50 / max)
+
+    python bench_ttft.py                              # against $OLLAMA_URL
+    python bench_ttft.py --spawn-mock --mock-args "--load-time 3 --prefill-ms 40"
+
+Keep-alive itself can't be shown in a short run: without it Ollama unloads
+the model after its default 5 minutes idle and the next question pays the
+"cold" number again.
+"""
+import json
+import time
+import argparse
+
+import numpy as np
+
+import engine
+import llm_client
+from llm_client import OllamaClient
+from loadgen import load_questions, spawn_mock, QUERY_SET_PATH
+
+
+def legacy_messages(user_question: str, context_chunks):
+    """The prompt layout before the prefix-stable restructuring."""
+    context_text = "\n\n---\n\n".join(context_chunks)
+    user_block = f"""
+Use the following CONTEXT about Sri Lanka to answer the QUESTION.
+If the CONTEXT is insufficient, say you are not sure and explain what the traveler
+should check locally (e.g. with accommodation, official sites, or operators).
+
+CONTEXT:
+{context_text}
+
+QUESTION:
+{user_question}
+""".strip()
+    return [
+        {"role": "system", "content": engine.SYSTEM_PROMPT},
+        {"role": "user", "content": user_block},
+    ]
+
+
+LAYOUTS = {
+    "legacy": legacy_messages,
+    "stable": engine.build_messages,
+}
+
+
+def time_to_first_token(client, messages) -> float:
+    start = time.perf_counter()
+    ttft = None
+    for _ in client.chat_stream(messages):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+    return ttft if ttft is not None else time.perf_counter() - start
+
+
+def contexts_for(questions):
+    out = []
+    for q in questions:
+        scored = engine.retrieve_scored_batch([q], engine.embed_query(q), engine.CONTEXT_CANDIDATES)[0]
+        out.append((q, engine.build_context(q, scored)))
+    return out
+
+
+def run_layout(client, build, turns) -> dict:
+    first_q, first_ctx = turns[0]
+
+    client.unload()
+    cold = time_to_first_token(client, build(first_q, first_ctx))
+
+    client.unload()
+    warm_up_s = client.warm_up(build("Reply with OK.", []))
+    primed = time_to_first_token(client, build(first_q, first_ctx))
+
+    warm = [time_to_first_token(client, build(q, ctx)) for q, ctx in turns[1:]]
+    return {
+        "cold_ttft_s": cold,
+        "warm_up_s": warm_up_s,
+        "cold_warmed_ttft_s": primed,
+        "warm_ttft_p50_s": float(np.percentile(warm, 50)) if warm else None,
+        "warm_ttft_max_s": max(warm) if warm else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold / warm TTFT per prompt layout.")
+    parser.add_argument("--questions", type=int, default=8, help="questions per layout")
+    parser.add_argument("--queries", default=QUERY_SET_PATH)
+    parser.add_argument("--ollama-url", default=llm_client.OLLAMA_URL)
+    parser.add_argument("--spawn-mock", action="store_true", help="start mock_ollama.py")
+    parser.add_argument("--mock-port", type=int, default=11435)
+    parser.add_argument("--mock-args", default="--load-time 2 --prefill-ms 40")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    mock, url = None, args.ollama_url
+    if args.spawn_mock:
+        mock, url = spawn_mock(args.mock_port, args.mock_args)
+    try:
+        client = OllamaClient(base_url=url)
+        engine.load_all()
+        turns = contexts_for(load_questions(args.queries)["travel"][:args.questions])
+
+        results = {name: run_layout(client, build, turns) for name, build in LAYOUTS.items()}
+
+        print(f"\n{'layout':<8}{'cold':>9}{'warm-up':>10}{'cold+wu':>10}{'warm p50':>10}{'warm max':>10}")
+        for name, r in results.items():
+            print(
+                f"{name:<8}{r['cold_ttft_s']:>9.2f}{r['warm_up_s']:>10.2f}"
+                f"{r['cold_warmed_ttft_s']:>10.2f}{r['warm_ttft_p50_s'] or 0:>10.2f}"
+                f"{r['warm_ttft_max_s'] or 0:>10.2f}"
+            )
+        print("(seconds; 'cold+wu' = first question after the startup warm-up)")
+
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump({"url": url, "model": client.model, "results": results}, f, indent=2)
+            print(f"\nSaved results to {args.out}")
+    finally:
+        if mock is not None:
+            mock.terminate()
+            mock.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# benchmark.py
+"""
+Retrieval-quality and latency benchmark for CeylonTrip.
+
+Runs the versioned labelled query set (data/eval/queries_v1.json: question
+-> expected chunk ids) through the engine and reports:
+
+- retrieval quality (recall@1/3/5, MRR) and mean CONTEXT size in tokens
+- latency percentiles (p50/p95/p99) for query embedding, search, prompt
+  building and end-to-end answers against an in-process fake LLM
+- index size on disk, and with --build the time of a full index rebuild
+
+Results are written as JSON so runs can be compared:
+
+    python benchmark.py --out bench/main.json
+    python benchmark.py --compare bench/main.json [--thresholds thresholds.json]
+
+--compare exits with status 1 when a metric regresses past its threshold.
+"""
+import os
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import subprocess
+
+import numpy as np
+
+import engine
+import llm_client
+from answer_cache import SemanticCache
+from ann_index import load_params
+from context_budget import estimate_tokens
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERY_SET_PATH = os.path.join(BASE_DIR, "data", "eval", "queries_v1.json")
+
+RECALL_KS = (1, 3, 5)
+MRR_DEPTH = 10
+
+# Metric name pattern -> allowed regression. Latencies also need to move by
+# more than `min_delta` (ms) so sub-millisecond jitter doesn't fail a run.
+DEFAULT_THRESHOLDS = {
+    "recall@*": {"max_drop": 0.02},
+    "mrr": {"max_drop": 0.02},
+    "*_ms_p*": {"max_increase_pct": 25.0, "min_delta": 0.5},
+    "build_s": {"max_increase_pct": 50.0, "min_delta": 1.0},
+    "index*_bytes": {"max_increase_pct": 10.0},
+    "context_tokens_mean": {"max_increase_pct": 15.0},
+}
+
+
+# ---------- Fake LLM ----------
+class FakeLLMClient:
+    """
+    Stand-in for OllamaClient: waits `ttft_s`, then emits `n_tokens` tokens
+    at `tokens_per_s`. Lets end-to-end latency run without a GPU box.
+    """
+
+    model = "fake-llm"
+
+    def __init__(self, ttft_s: float = 0.05, tokens_per_s: float = 400.0, n_tokens: int = 40):
+        self.ttft_s = ttft_s
+        self.tokens_per_s = tokens_per_s
+        self.n_tokens = n_tokens
+
+    def chat_stream(self, messages, **options):
+        time.sleep(self.ttft_s)
+        for i in range(self.n_tokens):
+            if i:
+                time.sleep(1.0 / self.tokens_per_s)
+            yield "token "
+
+    def chat(self, messages, **options) -> str:
+        return "".join(self.chat_stream(messages))
+
+
+# ---------- Measurements ----------
+def percentiles(name: str, samples_ms) -> dict:
+    samples = np.asarray(samples_ms)
+    return {f"{name}_ms_p{p}": float(np.percentile(samples, p)) for p in (50, 95, 99)}
+
+
+def load_query_set(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_retrieval(queries, repeat: int) -> dict:
+    embed_ms, search_ms, prompt_ms, context_tokens = [], [], [], []
+    recalls = {k: [] for k in RECALL_KS}
+    reciprocal_ranks = []
+
+    for rep in range(repeat):
+        for q in queries:
+            t = time.perf_counter()
+            q_vec = engine.embed_query(q["question"])
+            embed_ms.append((time.perf_counter() - t) * 1000)
+
+            t = time.perf_counter()
+            scored = engine.retrieve_scored_batch([q["question"]], q_vec, top_k=MRR_DEPTH)[0]
+            search_ms.append((time.perf_counter() - t) * 1000)
+
+            t = time.perf_counter()
+            context = engine.build_context(q["question"], scored[:engine.CONTEXT_CANDIDATES])
+            engine.build_messages(q["question"], context)
+            prompt_ms.append((time.perf_counter() - t) * 1000)
+
+            if rep:
+                continue
+            context_tokens.append(sum(estimate_tokens(text) for text in context))
+            ids = [c["id"] for c, _ in scored]
+            expected = set(q["expected"])
+            for k in RECALL_KS:
+                recalls[k].append(len(expected & set(ids[:k])) / len(expected))
+            rank = next((i for i, cid in enumerate(ids, start=1) if cid in expected), None)
+            reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    metrics = {f"recall@{k}": float(np.mean(v)) for k, v in recalls.items()}
+    metrics["mrr"] = float(np.mean(reciprocal_ranks))
+    metrics["context_tokens_mean"] = float(np.mean(context_tokens))
+    metrics.update(percentiles("embed", embed_ms))
+    metrics.update(percentiles("search", search_ms))
+    metrics.update(percentiles("prompt", prompt_ms))
+    return metrics
+
+
+def run_end_to_end(queries, fake: FakeLLMClient) -> dict:
+    # Fresh, disabled answer caches so every question reaches the fake LLM
+    llm_client.set_client(fake)
+    engine.answer_cache = SemanticCache(max_entries=0)
+    engine.response_cache = None
+    samples = []
+    for q in queries:
+        t = time.perf_counter()
+        engine.answer_question(q["question"])
+        samples.append((time.perf_counter() - t) * 1000)
+    return percentiles("e2e", samples)
+
+
+def index_sizes() -> dict:
+    index_dir = engine.current_bundle().dir
+    sizes = {"index_bytes": os.path.getsize(os.path.join(index_dir, engine.INDEX_FILE))}
+    sizes["index_dir_bytes"] = sum(
+        os.path.getsize(os.path.join(index_dir, name))
+        for name in os.listdir(index_dir)
+        if os.path.isfile(os.path.join(index_dir, name))
+    )
+    return sizes
+
+
+def time_full_build() -> dict:
+    t = time.perf_counter()
+    subprocess.run(
+        [sys.executable, os.path.join(BASE_DIR, "build_index.py"), "--full", "--no-embed-cache"],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    return {"build_s": time.perf_counter() - t}
+
+
+# ---------- Regression check ----------
+def find_threshold(metric: str, thresholds: dict):
+    for pattern, rule in thresholds.items():
+        if fnmatch.fnmatch(metric, pattern):
+            return rule
+    return None
+
+
+def compare(current: dict, baseline: dict, thresholds: dict):
+    """Return a list of (metric, baseline, current, reason) regressions."""
+    regressions = []
+    for metric, value in current.items():
+        if metric not in baseline:
+            continue
+        base = baseline[metric]
+        rule = find_threshold(metric, thresholds)
+        if rule is None:
+            continue
+        if "max_drop" in rule and base - value > rule["max_drop"]:
+            regressions.append((metric, base, value, f"dropped by more than {rule['max_drop']}"))
+        if "max_increase_pct" in rule and value > base:
+            delta = value - base
+            pct = 100.0 * delta / base if base else float("inf")
+            if pct > rule["max_increase_pct"] and delta > rule.get("min_delta", 0.0):
+                regressions.append(
+                    (metric, base, value, f"+{pct:.0f}% (limit {rule['max_increase_pct']}%)")
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CeylonTrip retrieval & latency benchmark.")
+    parser.add_argument("--queries", default=QUERY_SET_PATH, help="labelled query set (JSON)")
+    parser.add_argument("--repeat", type=int, default=5, help="timing passes over the query set")
+    parser.add_argument("--build", action="store_true", help="also time a full index rebuild")
+    parser.add_argument("--fake-ttft", type=float, default=0.05, help="fake LLM TTFT (s)")
+    parser.add_argument("--fake-tps", type=float, default=400.0, help="fake LLM tokens/s")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to check for regressions")
+    parser.add_argument("--thresholds", help="JSON {metric pattern: rule} overriding the defaults")
+    args = parser.parse_args()
+
+    query_set = load_query_set(args.queries)
+    queries = query_set["queries"]
+
+    metrics = {}
+    if args.build:
+        metrics.update(time_full_build())
+    engine.load_all()
+    metrics.update(run_retrieval(queries, args.repeat))
+    metrics.update(run_end_to_end(queries, FakeLLMClient(args.fake_ttft, args.fake_tps)))
+    metrics.update(index_sizes())
+
+    results = {
+        "query_set": os.path.basename(args.queries),
+        "query_set_version": query_set.get("version"),
+        "n_queries": len(queries),
+        "embedder": engine.get_embedder().name,
+        "index": load_params(engine.current_bundle().path(engine.INDEX_PARAMS_FILE)),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "metrics": metrics,
+    }
+
+    for name, value in metrics.items():
+        print(f"{name:<22} {value:14.4f}")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        thresholds = dict(DEFAULT_THRESHOLDS)
+        if args.thresholds:
+            with open(args.thresholds, "r", encoding="utf-8") as f:
+                overrides = json.load(f)
+            # Overrides are matched first, defaults fill in the rest
+            thresholds = {**overrides, **{k: v for k, v in thresholds.items() if k not in overrides}}
+        if baseline.get("query_set_version") != results["query_set_version"]:
+            print("⚠️ Baseline used a different query set version; quality metrics may not compare.")
+        regressions = compare(metrics, baseline["metrics"], thresholds)
+        if regressions:
+            print("\n❌ Regressions:")
+            for metric, base, value, reason in regressions:
+                print(f"- {metric}: {base:.4f} -> {value:.4f} ({reason})")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,118 +1,64 @@
 # build_index.py
 import os
-import re
 import json
+import shutil
+import argparse
 import numpy as np
-import pandas as pd
 import faiss
-from sentence_transformers import SentenceTransformer
+
+from embedders import create_embedder, save_manifest, load_manifest, BACKENDS
+from lexical import build_bm25, save_bm25
+from route_graph import build_route_graph, save_route_graph
+from facets import build_facets, save_facets
+from intent_router import build_intents, save_intents
+from fast_path import build_lookup, save_lookup
+from meta_store import write_meta_store
+from index_versions import create_version, publish, prune_versions, current_dir, KEEP_VERSIONS
+from ann_index import (
+    INDEX_TYPES, resolve_params, build_index, can_update, measure_recall, training_rows,
+    recall_query_rows, apply_search_params, save_params, load_params, RECALL_K,
+)
+from ingest import (
+    iter_chunks, encode_batches, IngestStats, Timer, CHUNK_ROWS, INGEST_WORKERS,
+)
 
 # Paths
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "data")
+# Holds CURRENT, versions/ and the embedding cache (see index_versions.py)
 INDEX_DIR = os.path.join(DATA_DIR, "index")
 os.makedirs(INDEX_DIR, exist_ok=True)
 
 DEST_PATH = os.path.join(DATA_DIR, "destinations.csv")
 ROUTES_PATH = os.path.join(DATA_DIR, "routes.csv")
-TIPS_PATH = os.path.join(DATA_DIR, "tips.md")
-
-EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-
-
-def slug(text: str) -> str:
-    text = text.lower().strip()
-    text = re.sub(r"[^a-z0-9]+", "_", text)
-    return text.strip("_")
-
-
-def load_destinations(path: str):
-    df = pd.read_csv(path)
-    chunks = []
-    for _, row in df.iterrows():
-        text = (
-            f"[DESTINATION] {row['name']}\n"
-            f"Region: {row['region']}\n"
-            f"Types: {row['types']}\n"
-            f"Best months: {row['best_months']}\n"
-            f"Recommended days: {row['recommended_days']}\n"
-            f"Highlights: {row['highlights']}\n"
-            f"Vibe: {row['vibe']}\n"
-            f"Details: {row['description']}"
-        )
-        chunks.append(
-            {
-                "id": f"dest_{slug(str(row['name']))}",
-                "source": "destinations",
-                "text": text,
-            }
-        )
-    return chunks
-
-
-def load_routes(path: str):
-    df = pd.read_csv(path)
-    chunks = []
-    for _, row in df.iterrows():
-        text = (
-            f"[ROUTE] {row['from']} → {row['to']}\n"
-            f"Transport: {row['transport']}\n"
-            f"Approx time: {row['hours_min']}–{row['hours_max']} hours\n"
-            f"Scenic: {row['scenic']}\n"
-            f"Notes: {row['notes']}"
-        )
-        chunks.append(
-            {
-                "id": f"route_{slug(str(row['from']))}_{slug(str(row['to']))}",
-                "source": "routes",
-                "text": text,
-            }
-        )
-    return chunks
-
-
-def load_tips(path: str):
-    with open(path, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    # Split by "## " to make sections
-    sections = content.split("\n## ")
-    chunks = []
-    for i, sec in enumerate(sections):
-        sec = sec.strip()
-        if not sec:
-            continue
-
-        # Re-add "## " to all except possibly first
-        if i == 0:
-            title = "General travel tips"
-            text = sec
-        else:
-            if "\n" in sec:
-                title_line, body = sec.split("\n", 1)
-            else:
-                title_line, body = sec, ""
-            title = title_line.strip("# ").strip()
-            text = f"## {title}\n{body}"
-
-        chunks.append(
-            {
-                "id": f"tips_{i:02d}",
-                "source": "tips",
-                "text": f"[TIPS] {title}\n{text}",
-            }
-        )
-    return chunks
 
+# Shared by every index version
+EMBED_CACHE_PATH = os.path.join(INDEX_DIR, "embed_cache.npz")
 
-def build_corpus():
+# File names inside an index version directory
+INDEX_FILE = "faiss.index"
+META_FILE = "meta.json"
+BM25_FILE = "bm25.json"
+ROUTE_GRAPH_FILE = "route_graph.json"
+FACETS_FILE = "facets.npz"
+INTENTS_FILE = "intents.npz"
+LOOKUP_FILE = "lookup.json"
+EMBEDDER_MANIFEST_FILE = "embedder.json"
+INDEX_PARAMS_FILE = "index_params.json"
+
+# Vectors per encode batch / index.add call
+SHARD_SIZE = int(os.environ.get("CEYLONTRIP_SHARD_SIZE", "4096"))
+
+
+def build_corpus(stats: IngestStats = None, chunk_rows: int = CHUNK_ROWS):
+    """
+    Every chunk under data/ (see ingest.py), each with its content hash and
+    vector id. Chunk dicts are kept: metadata, BM25 and facets need them all.
+    """
     corpus = []
-    if os.path.exists(DEST_PATH):
-        corpus.extend(load_destinations(DEST_PATH))
-    if os.path.exists(ROUTES_PATH):
-        corpus.extend(load_routes(ROUTES_PATH))
-    if os.path.exists(TIPS_PATH):
-        corpus.extend(load_tips(TIPS_PATH))
+    with Timer(stats or IngestStats(), "read_s"):
+        for batch in iter_chunks(DATA_DIR, chunk_rows, stats):
+            corpus.extend(batch)
 
     if not corpus:
         raise RuntimeError(
@@ -126,36 +72,251 @@ def normalize(vectors: np.ndarray) -> np.ndarray:
     return vectors / norms
 
 
+# ---------- Embedding cache (content hash -> vector) ----------
+def load_embed_cache(path: str, embedder_name: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    data = np.load(path)
+    if str(data["model"]) != embedder_name:
+        # Vectors from another model/backend live in a different space
+        return {}
+    return dict(zip(data["hashes"].tolist(), data["vectors"]))
+
+
+def save_embed_cache(path: str, embedder_name: str, cache: dict, keep_hashes):
+    # Only keep vectors still referenced by the corpus so the cache stays bounded
+    hashes = [h for h in dict.fromkeys(keep_hashes) if h in cache]
+    vectors = np.stack([cache[h] for h in hashes]).astype("float32", copy=False)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, model=np.array(embedder_name), hashes=np.array(hashes), vectors=vectors)
+    os.replace(tmp_path, path)
+
+
+def embed_corpus(corpus, embedder, use_cache: bool = True, workers: int = INGEST_WORKERS,
+                 stats: IngestStats = None) -> dict:
+    """
+    Return the {content hash: normalized vector} cache covering every chunk,
+    encoding only chunks whose hash is not in the on-disk cache, one shard
+    at a time. The model is not even loaded when nothing changed.
+    """
+    stats = stats or IngestStats()
+    cache = load_embed_cache(EMBED_CACHE_PATH, embedder.name) if use_cache else {}
+    missing = list({c["hash"]: c["text"] for c in corpus if c["hash"] not in cache}.items())
+    print(f"Embedding cache: {len(corpus) - len(missing)} reused, {len(missing)} to encode")
+
+    if missing:
+        where = f"{workers} worker processes" if workers > 0 else "this process"
+        print(f"Encoding embeddings with {embedder.name} in {where}...")
+        starts = range(0, len(missing), SHARD_SIZE)
+        text_batches = ([text for _, text in missing[s:s + SHARD_SIZE]] for s in starts)
+        with Timer(stats, "encode_s"):
+            for start, vecs in zip(starts, encode_batches(embedder, text_batches, workers)):
+                shard = missing[start:start + SHARD_SIZE]
+                for (h, _), vec in zip(shard, normalize(vecs.astype("float32"))):
+                    cache[h] = vec
+                stats.encoded += len(shard)
+                print(f"  encoded {stats.encoded}/{len(missing)}")
+
+    hashes = [c["hash"] for c in corpus]
+    if missing or len(cache) != len(set(hashes)) or not use_cache:
+        save_embed_cache(EMBED_CACHE_PATH, embedder.name, cache, hashes)
+    return cache
+
+
+def vector_shards(corpus, cache: dict, rows=None):
+    """Yield (vids, vectors) for `corpus` (or just `rows` of it), SHARD_SIZE at a time."""
+    rows = range(len(corpus)) if rows is None else rows
+    for start in range(0, len(rows), SHARD_SIZE):
+        chunks = [corpus[i] for i in rows[start:start + SHARD_SIZE]]
+        yield (
+            np.array([c["vid"] for c in chunks], dtype="int64"),
+            np.stack([cache[c["hash"]] for c in chunks]).astype("float32", copy=False),
+        )
+
+
+def stack_rows(corpus, cache: dict, rows) -> np.ndarray:
+    return np.stack([cache[corpus[i]["hash"]] for i in rows]).astype("float32", copy=False)
+
+
+# ---------- ID-mapped index maintenance ----------
+def load_previous_build(previous_dir: str, embedder, params: dict):
+    """Return (index, {chunk_id: chunk}) from the build in `previous_dir`, or (None, {})."""
+    index_path = os.path.join(previous_dir, INDEX_FILE)
+    meta_path = os.path.join(previous_dir, META_FILE)
+    if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+        return None, {}
+    manifest = load_manifest(os.path.join(previous_dir, EMBEDDER_MANIFEST_FILE))
+    if manifest is None or manifest["name"] != embedder.name:
+        # Vectors in the old index come from another backend: rebuild
+        return None, {}
+    if not can_update(load_params(os.path.join(previous_dir, INDEX_PARAMS_FILE)), params):
+        # Different index type, or IVF cells trained for a very different size
+        return None, {}
+    index = faiss.read_index(index_path)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    id_mapped = isinstance(index, (faiss.IndexIDMap2, faiss.IndexIVF))
+    if not id_mapped or any("vid" not in c for c in meta):
+        # Built by an older, position-based version: rebuild from scratch
+        return None, {}
+    return index, {c["id"]: c for c in meta}
+
+
+def update_index(index, previous: dict, corpus, cache: dict):
+    """Drop removed/changed chunks from `index` and add new/changed ones."""
+    current = {c["id"]: c for c in corpus}
+    stale = [
+        old["vid"] for cid, old in previous.items()
+        if cid not in current or current[cid]["hash"] != old["hash"]
+    ]
+    fresh = [
+        i for i, c in enumerate(corpus)
+        if c["id"] not in previous or previous[c["id"]]["hash"] != c["hash"]
+    ]
+
+    if stale:
+        index.remove_ids(np.array(stale, dtype="int64"))
+    for vids, vectors in vector_shards(corpus, cache, fresh):
+        index.add_with_ids(vectors, vids)
+    print(f"Index update: {len(stale)} removed, {len(fresh)} added")
+    return index
+
+
+def build_fresh_index(corpus, cache: dict, params: dict):
+    train = training_rows(params, len(corpus))
+    train_vectors = stack_rows(corpus, cache, train) if len(train) else None
+    return build_index(vector_shards(corpus, cache), params, train_vectors)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Build the CeylonTrip RAG index.")
+    parser.add_argument(
+        "--full", action="store_true",
+        help="ignore the previous index and rebuild it from scratch",
+    )
+    parser.add_argument(
+        "--no-embed-cache", action="store_true",
+        help="re-encode every chunk instead of reusing cached embeddings",
+    )
+    parser.add_argument(
+        "--backend", choices=sorted(BACKENDS), default=None,
+        help="embedding backend (default: $CEYLONTRIP_EMBED_BACKEND or sentence-transformers)",
+    )
+    parser.add_argument(
+        "--index-type", choices=("auto",) + INDEX_TYPES,
+        default=os.environ.get("CEYLONTRIP_INDEX_TYPE", "auto"),
+        help="FAISS index type (default: $CEYLONTRIP_INDEX_TYPE or auto by corpus size)",
+    )
+    parser.add_argument("--nlist", type=int, help="IVF: number of k-means cells")
+    parser.add_argument("--nprobe", type=int, help="IVF: cells visited per query")
+    parser.add_argument("--pq-m", type=int, help="IVF-PQ: sub-quantizers (must divide the dim)")
+    parser.add_argument("--pq-nbits", type=int, help="IVF-PQ: bits per sub-quantizer code")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW: graph neighbours per node")
+    parser.add_argument("--ef-construction", type=int, help="HNSW: build-time search depth")
+    parser.add_argument("--ef-search", type=int, help="HNSW: query-time search depth")
+    parser.add_argument(
+        "--workers", type=int, default=INGEST_WORKERS,
+        help="encoder processes (default: $CEYLONTRIP_INGEST_WORKERS or 0 = in-process)",
+    )
+    parser.add_argument(
+        "--chunk-rows", type=int, default=CHUNK_ROWS, help="CSV rows read per batch",
+    )
+    args = parser.parse_args()
+    embedder = create_embedder(args.backend)
+    stats = IngestStats()
+    stats.workers = args.workers
+
     print("Loading corpus...")
-    corpus = build_corpus()
-    texts = [c["text"] for c in corpus]
-    print(f"Total chunks: {len(texts)}")
+    corpus = build_corpus(stats, args.chunk_rows)
+    print(f"Total chunks: {len(corpus)} from {stats.files} files")
 
-    print(f"Loading embedding model: {EMBED_MODEL_NAME}")
-    model = SentenceTransformer(EMBED_MODEL_NAME)
+    cache = embed_corpus(
+        corpus, embedder, use_cache=not args.no_embed_cache, workers=args.workers, stats=stats
+    )
+    dim = len(cache[corpus[0]["hash"]])
 
-    print("Encoding embeddings...")
-    embeddings = model.encode(texts, show_progress_bar=True, batch_size=64)
-    embeddings = embeddings.astype("float32")
-    embeddings = normalize(embeddings)
+    params = resolve_params(
+        args.index_type, len(corpus), dim,
+        {
+            "nlist": args.nlist, "nprobe": args.nprobe, "pq_m": args.pq_m,
+            "pq_nbits": args.pq_nbits, "M": args.hnsw_m,
+            "ef_construction": args.ef_construction, "ef_search": args.ef_search,
+        },
+    )
+    version, out_dir = create_version(INDEX_DIR)
+    try:
+        build_version(out_dir, corpus, cache, params, embedder, stats, full=args.full)
+    except BaseException:
+        # Never leave a half-written version behind; CURRENT still points at the old one
+        shutil.rmtree(out_dir, ignore_errors=True)
+        raise
 
-    print("Building FAISS index (cosine similarity via dot product)...")
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
+    # Running apps pick the new version up from here (see engine.current_bundle)
+    publish(INDEX_DIR, version)
+    print(f"Published index version {version}")
+    removed = prune_versions(INDEX_DIR, KEEP_VERSIONS)
+    if removed:
+        print(f"Removed {len(removed)} old index version(s)")
 
-    index_path = os.path.join(INDEX_DIR, "faiss.index")
-    meta_path = os.path.join(INDEX_DIR, "meta.json")
+    print(stats.report())
+    print("✅ Done building RAG index.")
 
-    print(f"Saving index to {index_path}")
-    faiss.write_index(index, index_path)
 
-    print(f"Saving metadata to {meta_path}")
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(corpus, f, ensure_ascii=False, indent=2)
+def build_version(out_dir: str, corpus, cache: dict, params: dict, embedder,
+                  stats: IngestStats, full: bool = False):
+    """Write every index file for `corpus` into the (unpublished) version `out_dir`."""
+    path = lambda name: os.path.join(out_dir, name)  # noqa: E731
+    dim = params["dim"]
 
-    print("✅ Done building RAG index.")
+    print(f"Building FAISS {params['type']} index (cosine similarity via dot product)...")
+    with Timer(stats, "index_s"):
+        index, previous = (None, {}) if full else load_previous_build(
+            current_dir(INDEX_DIR), embedder, params
+        )
+        if index is not None and index.d == dim:
+            index = update_index(index, previous, corpus, cache)
+        if index is None or index.d != dim or index.ntotal != len(corpus):
+            index = build_fresh_index(corpus, cache, params)
+    if isinstance(index, faiss.IndexIVF):
+        # An updated index keeps the cells it was trained with
+        params["nlist"] = int(index.nlist)
+        params["nprobe"] = min(params["nprobe"], params["nlist"])
+    apply_search_params(index, params)
+
+    if params["type"] == "flat":
+        params["recall"] = 1.0
+    else:
+        queries = stack_rows(corpus, cache, recall_query_rows(len(corpus)))
+        params["recall"] = measure_recall(index, queries, vector_shards(corpus, cache))
+    params.update({"recall_k": RECALL_K, "ntotal": int(index.ntotal)})
+    print(f"Index {params['type']}: recall@{RECALL_K} vs exact search = {params['recall']:.3f}")
+
+    print(f"Saving index to {out_dir}")
+    faiss.write_index(index, path(INDEX_FILE))
+
+    with open(path(META_FILE), "w", encoding="utf-8") as f:
+        json.dump(corpus, f, ensure_ascii=False, separators=(",", ":"))
+    write_meta_store(corpus, out_dir)
+    save_params(path(INDEX_PARAMS_FILE), params)
+    save_manifest(path(EMBEDDER_MANIFEST_FILE), embedder, dim)
+
+    print("Saving BM25 lexical index")
+    save_bm25(build_bm25(corpus), path(BM25_FILE))
+
+    if os.path.exists(ROUTES_PATH):
+        print("Saving route graph (all-pairs shortest travel times)")
+        dest_path = DEST_PATH if os.path.exists(DEST_PATH) else None
+        save_route_graph(build_route_graph(ROUTES_PATH, dest_path), path(ROUTE_GRAPH_FILE))
+
+    print("Saving month/region/type facets")
+    dest_rows = {c["id"]: c["facets"] for c in corpus if "facets" in c}
+    save_facets(build_facets(corpus, dest_rows), path(FACETS_FILE))
+
+    print("Saving fast-path lookup tables (routes, destinations, place aliases)")
+    save_lookup(build_lookup(ROUTES_PATH, DEST_PATH), path(LOOKUP_FILE))
+
+    print("Saving intent router prototypes")
+    save_intents(build_intents(embedder), path(INTENTS_FILE))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+# context_budget.py
+"""
+Context assembly: decide which retrieved chunks go into the prompt.
+
+Steps, applied to (chunk, cosine score) candidates in retrieval order:
+
+1. Similarity floor per source (destinations / routes / tips). Anything
+   below it is noise and is dropped; if nothing survives the caller should
+   give the "no context" reply instead of calling the LLM.
+2. Dynamic top_k: keep chunks scoring at least RELATIVE_FLOOR x the best
+   score, between MIN_CHUNKS and MAX_CHUNKS.
+3. Dedup: one chunk per route pair (A → B and B → A), route chunks already
+   covered by the precomputed route plan, and near-identical texts.
+4. Token budget: whole chunks until the budget is spent, then the next
+   chunk cut at a line boundary.
+
+Token counts are estimates (about 4 characters per token for English with
+Llama-family tokenizers); they're used for budgeting and for reporting how
+many prompt tokens were saved versus sending the fixed top-5.
+"""
+import os
+import re
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_floors(text: str) -> dict:
+    """'destinations=0.3,routes=0.35' -> {'destinations': 0.3, 'routes': 0.35}"""
+    floors = {}
+    for part in filter(None, text.split(",")):
+        source, _, value = part.partition("=")
+        floors[source.strip()] = float(value)
+    return floors
+
+
+# ---------- Config ----------
+DEFAULT_SCORE_FLOOR = float(os.environ.get("CEYLONTRIP_SCORE_FLOOR", "0.25"))
+SCORE_FLOORS = {"destinations": 0.25, "routes": 0.30, "tips": 0.25}
+SCORE_FLOORS.update(_parse_floors(os.environ.get("CEYLONTRIP_SCORE_FLOORS", "")))
+RELATIVE_FLOOR = float(os.environ.get("CEYLONTRIP_RELATIVE_FLOOR", "0.6"))
+MIN_CHUNKS = int(os.environ.get("CEYLONTRIP_MIN_CHUNKS", "1"))
+MAX_CHUNKS = int(os.environ.get("CEYLONTRIP_MAX_CHUNKS", "6"))
+TOKEN_BUDGET = int(os.environ.get("CEYLONTRIP_CONTEXT_TOKENS", "900"))
+
+# What the prompt used to carry: the fixed top-5 whole chunks
+BASELINE_TOP_K = 5
+CHARS_PER_TOKEN = 4
+# Don't bother with a truncated tail shorter than this
+MIN_TAIL_TOKENS = 48
+NEAR_DUPLICATE_JACCARD = 0.8
+
+_ROUTE_HEADER = re.compile(r"^\[ROUTE\] (.+?) → (.+)$", re.MULTILINE)
+_PLAN_LEG = re.compile(r"^- (.+?) → (.+?):", re.MULTILINE)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+# ---------- Selection ----------
+def score_floor(source: str) -> float:
+    return SCORE_FLOORS.get(source, DEFAULT_SCORE_FLOOR)
+
+
+def select(scored):
+    """Floor + dynamic top_k over [(chunk, score)] in retrieval order."""
+    passing = [(c, s) for c, s in scored if s >= score_floor(c.get("source", ""))]
+    if not passing:
+        return []
+    best = max(s for _, s in passing)
+    kept = [
+        (c, s) for i, (c, s) in enumerate(passing)
+        if i < MIN_CHUNKS or s >= best * RELATIVE_FLOOR
+    ]
+    return kept[:MAX_CHUNKS]
+
+
+# ---------- Dedup ----------
+def _route_pair(text: str):
+    m = _ROUTE_HEADER.search(text)
+    return frozenset((m.group(1).strip(), m.group(2).strip())) if m else None
+
+
+def _shingles(text: str):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def dedupe(chunks, plan_text: str = None):
+    """Drop route duplicates, routes the plan already covers, and near-copies."""
+    covered = set()
+    if plan_text:
+        covered = {frozenset((a.strip(), b.strip())) for a, b in _PLAN_LEG.findall(plan_text)}
+
+    kept, seen_pairs, seen_shingles = [], set(), []
+    for chunk, score in chunks:
+        pair = _route_pair(chunk["text"])
+        if pair is not None:
+            if pair in covered or pair in seen_pairs:
+                continue
+            seen_pairs.add(pair)
+        shingles = _shingles(chunk["text"])
+        if any(
+            len(shingles & other) / len(shingles | other) >= NEAR_DUPLICATE_JACCARD
+            for other in seen_shingles
+        ):
+            continue
+        seen_shingles.append(shingles)
+        kept.append((chunk, score))
+    return kept
+
+
+# ---------- Budget ----------
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` at the last line break that fits `max_tokens`."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    return text[:cut if cut > 0 else limit].rstrip() + " …"
+
+
+def fit_budget(texts, budget: int = TOKEN_BUDGET):
+    out, used = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if used + tokens <= budget:
+            out.append(text)
+            used += tokens
+            continue
+        remaining = budget - used
+        if remaining >= MIN_TAIL_TOKENS:
+            out.append(truncate_to_tokens(text, remaining))
+        break
+    return out
+
+
+def assemble(scored, plan_text: str = None, budget: int = TOKEN_BUDGET):
+    """
+    Return (context_texts, report) for [(chunk, score)] candidates. The
+    route plan, when given, goes first and counts against the budget.
+    """
+    chunks = dedupe(select(scored), plan_text)
+    texts = ([plan_text] if plan_text else []) + [c["text"] for c, _ in chunks]
+    texts = fit_budget(texts, budget)
+
+    baseline = ([plan_text] if plan_text else []) + [c["text"] for c, _ in scored[:BASELINE_TOP_K]]
+    report = {
+        "candidates": len(scored),
+        "kept": len(texts) - (1 if plan_text and texts else 0),
+        "tokens": sum(estimate_tokens(t) for t in texts),
+        "baseline_tokens": sum(estimate_tokens(t) for t in baseline),
+    }
+    report["saved_tokens"] = max(0, report["baseline_tokens"] - report["tokens"])
+    logger.info(
+        "context: kept %d/%d chunks, ~%d prompt tokens (saved ~%d vs top-%d)",
+        report["kept"], report["candidates"], report["tokens"],
+        report["saved_tokens"], BASELINE_TOP_K,
+    )
+    return texts, report
+
+
+class BudgetStats:
+    """Running totals of `assemble` reports, shared across threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.tokens = 0
+        self.saved_tokens = 0
+
+    def record(self, report: dict):
+        with self._lock:
+            self.turns += 1
+            self.tokens += report["tokens"]
+            self.saved_tokens += report["saved_tokens"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "prompt_tokens": self.tokens,
+                "saved_tokens": self.saved_tokens,
+                "avg_prompt_tokens": self.tokens / self.turns if self.turns else 0.0,
+            }
@@ -0,0 +1,247 @@
+# embedders.py
+"""
+Interchangeable text embedding backends.
+
+- "sentence-transformers": the reference PyTorch MiniLM model (float32)
+- "onnx":       the same model exported to ONNX Runtime (float32)
+- "onnx-int8":  the ONNX export with dynamically quantized int8 weights
+- "hashing":    deterministic feature-hashing embedder for offline tests
+
+build_index.py and the engine pick a backend with CEYLONTRIP_EMBED_BACKEND.
+The backend used for a build is recorded in the index version's embedder.json, and the
+engine uses the same one for queries unless told otherwise. Heavy imports
+(torch, onnxruntime, transformers) happen in `load()`, not at import time.
+
+Export the ONNX models once with:
+    python embedders.py export [--out data/models/minilm-onnx]
+"""
+import os
+import re
+import json
+import hashlib
+import argparse
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(__file__)
+
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_BACKEND = os.environ.get("CEYLONTRIP_EMBED_BACKEND", "")
+ONNX_DIR = os.environ.get(
+    "CEYLONTRIP_ONNX_DIR", os.path.join(BASE_DIR, "data", "models", "minilm-onnx")
+)
+DEFAULT_BACKEND = "sentence-transformers"
+ONNX_MAX_LENGTH = 256
+
+
+class Embedder:
+    """Common interface: `encode(texts)` -> float32 array of shape (n, dim)."""
+
+    backend = ""
+
+    def __init__(self, model_name: str = EMBED_MODEL_NAME):
+        self.model_name = model_name
+        self._loaded = False
+
+    @property
+    def name(self) -> str:
+        # Identifies the vector space; embedding caches are keyed by it
+        return f"{self.backend}:{self.model_name}"
+
+    def load(self):
+        if not self._loaded:
+            self._load()
+            self._loaded = True
+        return self
+
+    def _load(self):
+        pass
+
+    def encode(self, texts, batch_size: int = 64, show_progress_bar: bool = False) -> np.ndarray:
+        self.load()
+        return self._encode(list(texts), batch_size, show_progress_bar).astype("float32")
+
+    def _encode(self, texts, batch_size, show_progress_bar):
+        raise NotImplementedError
+
+
+class SentenceTransformerEmbedder(Embedder):
+    backend = "sentence-transformers"
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(self.model_name)
+
+    def _encode(self, texts, batch_size, show_progress_bar):
+        return self.model.encode(
+            texts, batch_size=batch_size, show_progress_bar=show_progress_bar
+        )
+
+
+class OnnxEmbedder(Embedder):
+    """
+    ONNX Runtime encoder for a MiniLM export: token embeddings are mean-pooled
+    over the attention mask and L2-normalized, as the sentence-transformers
+    pipeline for all-MiniLM-L6-v2 does.
+    """
+
+    backend = "onnx"
+    model_file = "model.onnx"
+
+    def __init__(self, model_name: str = EMBED_MODEL_NAME, model_dir: str = ONNX_DIR):
+        super().__init__(model_name)
+        self.model_dir = model_dir
+
+    def _load(self):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = os.path.join(self.model_dir, self.model_file)
+        if not os.path.exists(path):
+            raise RuntimeError(
+                f"{path} not found. Run `python embedders.py export` first."
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+
+    def _encode(self, texts, batch_size, show_progress_bar):
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=ONNX_MAX_LENGTH,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype("int64") for k, v in batch.items() if k in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            mask = batch["attention_mask"][..., None].astype("float32")
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append(pooled / (np.linalg.norm(pooled, axis=1, keepdims=True) + 1e-12))
+        return np.concatenate(out) if out else np.zeros((0, 0), dtype="float32")
+
+
+class OnnxInt8Embedder(OnnxEmbedder):
+    backend = "onnx-int8"
+    model_file = "model_int8.onnx"
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic signed feature hashing of word unigrams and bigrams. No
+    model download, identical output on every machine: meant for tests and
+    offline benchmarks, not for answer quality.
+    """
+
+    backend = "hashing"
+
+    def __init__(self, model_name: str = "hashing", dim: int = 384):
+        super().__init__(model_name)
+        self.dim = dim
+
+    @property
+    def name(self) -> str:
+        return f"hashing:{self.dim}"
+
+    def _features(self, text: str):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def _encode(self, texts, batch_size, show_progress_bar):
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.md5(feature.encode("utf-8")).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+
+BACKENDS = {
+    "sentence-transformers": SentenceTransformerEmbedder,
+    "onnx": OnnxEmbedder,
+    "onnx-int8": OnnxInt8Embedder,
+    "hashing": HashingEmbedder,
+}
+
+
+def create_embedder(backend: str = None) -> Embedder:
+    """Instantiate (but don't load) the configured backend."""
+    backend = backend or EMBED_BACKEND or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; choose from {sorted(BACKENDS)}")
+    return BACKENDS[backend]()
+
+
+# ---------- Build manifest (which backend built the index) ----------
+def save_manifest(path: str, embedder: Embedder, dim: int):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"backend": embedder.backend, "name": embedder.name, "dim": dim}, f, indent=2)
+
+
+def load_manifest(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ---------- ONNX export ----------
+def export_onnx(model_name: str = EMBED_MODEL_NAME, out_dir: str = ONNX_DIR, quantize: bool = True):
+    """Export the transformer to ONNX (+ tokenizer) and an int8 dynamic-quantized copy."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["Kandy to Ella by train"], return_tensors="pt")
+    names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample]
+    dynamic = {k: {0: "batch", 1: "seq"} for k in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    fp32_path = os.path.join(out_dir, OnnxEmbedder.model_file)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[k] for k in names),
+            fp32_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=14,
+        )
+    print(f"Saved {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(out_dir, OnnxInt8Embedder.model_file)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Saved {int8_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="export MiniLM to ONNX and int8 ONNX")
+    export.add_argument("--model", default=EMBED_MODEL_NAME)
+    export.add_argument("--out", default=ONNX_DIR)
+    export.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args.model, args.out, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,926 @@
+# engine.py
+"""
+CeylonTrip core engine shared by the CLI, the Streamlit app and scripts.
+
+faiss and sentence-transformers (and with it torch) are only imported on
+the first retrieval, so starting the app or answering small talk ("hi")
+costs no heavy imports. `warm_up()` can load the model and index on a
+background thread while the UI draws, and also loads the Ollama model and
+primes it with the static prompt prefix. `python engine.py --startup`
+measures import and cold-start time.
+
+The index is read from the version data/index/CURRENT points at. When
+build_index.py publishes a new one, the next turns notice, load it in the
+background and switch over without a restart (see `current_bundle`).
+
+LLM calls go through `llm_scheduler` (see llm_scheduler.py). When its queue
+is full, or a turn waits past its deadline, the turn gets the "busy" reply
+right away and nothing is cached.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+
+import numpy as np
+
+from llm_client import get_client
+from answer_cache import SemanticCache, make_namespace
+from response_cache import ResponseCache, response_key, RESPONSE_CACHE_ENABLED
+from llm_scheduler import LLMScheduler, SchedulerBusy, MAX_CONCURRENCY
+from lexical import BM25Index, rrf_fuse, DENSE_WEIGHT, LEXICAL_WEIGHT
+from route_graph import RouteGraph, route_facts
+from facets import FacetIndex
+from intent_router import IntentRouter, IntentStats, ROUTER_ENABLED
+from fast_path import LookupEngine, LookupStats
+from embedders import create_embedder, load_manifest, EMBED_BACKEND
+from meta_store import MetaStore, has_meta_store
+from index_versions import VersionWatcher, Lease, current_version, version_dir
+from ann_index import load_params, search_overrides, apply_search_params, search_parameters
+import metrics
+from metrics import span
+from context_budget import assemble as assemble_context, BudgetStats, MAX_CHUNKS, BASELINE_TOP_K
+
+# ---------- Paths ----------
+BASE_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.join(BASE_DIR, "data")
+# Holds CURRENT and versions/ (see index_versions.py)
+INDEX_DIR = os.path.join(DATA_DIR, "index")
+
+# File names inside an index version directory
+INDEX_FILE = "faiss.index"
+META_FILE = "meta.json"
+BM25_FILE = "bm25.json"
+ROUTE_GRAPH_FILE = "route_graph.json"
+FACETS_FILE = "facets.npz"
+INTENTS_FILE = "intents.npz"
+LOOKUP_FILE = "lookup.json"
+EMBEDDER_MANIFEST_FILE = "embedder.json"
+INDEX_PARAMS_FILE = "index_params.json"
+
+# ---------- System prompt (persona + rules) ----------
+SYSTEM_PROMPT = """
+You are CeylonTrip, an AI travel assistant specialized ONLY in Sri Lanka.
+
+RULES:
+- You MUST answer ONLY questions related to travel in Sri Lanka.
+- If the user asks about another country (India, Thailand, etc.), reply:
+  "I can only answer questions about traveling in Sri Lanka."
+- Use the provided CONTEXT when possible (destinations, routes, tips).
+- Do NOT invent live prices, real-time schedules, or current weather.
+- If something is not covered in the context, say you are not sure and suggest
+  what the traveler can check locally (guesthouses, official sites, operators).
+- Keep itineraries geographically sensible and mention approximate travel times when relevant.
+- Prefer clear bullet points and day-by-day plans when the user asks for itineraries.
+- If the user message is small talk (e.g. "ok", "thanks", "hi"), respond briefly and naturally
+  without giving extra Sri Lanka information.
+""".strip()
+
+# How to use the CONTEXT. Static, so it lives in the system message: the
+# system message is then byte-identical on every turn and Ollama can reuse
+# its KV cache instead of re-processing it. Only the user message varies.
+CONTEXT_INSTRUCTIONS = """
+Each user message has a CONTEXT section about Sri Lanka followed by the QUESTION.
+Use the CONTEXT to answer the QUESTION.
+If the CONTEXT is insufficient, say you are not sure and explain what the traveler
+should check locally (e.g. with accommodation, official sites, or operators).
+""".strip()
+
+SYSTEM_MESSAGE = {"role": "system", "content": f"{SYSTEM_PROMPT}\n\n{CONTEXT_INSTRUCTIONS}"}
+
+# Memory-map faiss.index and the binary chunk metadata when it exists
+USE_MMAP = os.environ.get("CEYLONTRIP_MMAP", "1") == "1"
+
+# Load the Ollama model (and prime the prompt prefix) during warm_up()
+LLM_WARMUP = os.environ.get("CEYLONTRIP_LLM_WARMUP", "1") == "1"
+
+
+# ---------- Lazy loaders (index, embedder, side indexes) ----------
+# Embedders by backend, shared by every index version that uses them
+_embedders = {}
+# The index version new turns are answered from (see `current_bundle`)
+_bundle = None
+_watcher = None
+_reload_thread = None
+
+# Serialises loading between the warm-up thread and the first request
+_load_lock = threading.RLock()
+_warmup_thread = None
+
+# Semantic answer cache shared by every turn of this process
+answer_cache = SemanticCache()
+# LLM replies on disk, shared with other processes (None = off)
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+# Concurrency cap + bounded queue in front of the LLM (None = call the client directly)
+llm_scheduler = LLMScheduler() if MAX_CONCURRENCY > 0 else None
+# Prompt tokens sent / saved by the context budgeter
+context_stats = BudgetStats()
+# Turns answered without the LLM because of their intent
+intent_stats = IntentStats()
+# Questions answered straight from routes.csv / destinations.csv rows
+lookup_stats = LookupStats()
+# Candidates handed to the budgeter (it picks the actual top_k)
+CONTEXT_CANDIDATES = max(MAX_CHUNKS, BASELINE_TOP_K)
+
+
+def import_faiss():
+    # Deferred: importing faiss is only paid on the first retrieval
+    import faiss
+
+    return faiss
+
+
+def faiss_mmap_flags(faiss) -> int:
+    # IO_FLAG_MMAP_IFC maps flat vector codes (faiss >= 1.8); IO_FLAG_MMAP
+    # alone only covers IVF inverted lists
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class IndexBundle:
+    """
+    One index version: the FAISS index, chunk metadata, side indexes and the
+    embedder that matches them, each loaded on first use. A turn takes one
+    bundle at its start and uses it throughout, so a hot reload never mixes
+    two versions within a turn. A versioned bundle holds a lease on its
+    directory, so build_index.py does not prune it while it is in use.
+    """
+
+    def __init__(self, directory: str, version: str = None):
+        self.dir = directory
+        self.version = version
+        self._lock = threading.RLock()
+        self._index = None
+        self._meta = None
+        self._embedder = None
+        self._side = {}
+        self._namespaces = {}
+        self.lease = Lease(directory) if version else None
+        self.renew_lease()
+
+    def renew_lease(self):
+        if self.lease is not None:
+            self.lease.renew()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def index_and_meta(self):
+        if self._index is None or self._meta is None:
+            with self._lock:
+                if self._index is None or self._meta is None:
+                    self._index, self._meta = self._load_index_and_meta()
+        return self._index, self._meta
+
+    def _load_index_and_meta(self):
+        index_path, meta_path = self.path(INDEX_FILE), self.path(META_FILE)
+        if not (os.path.exists(index_path) and os.path.exists(meta_path)):
+            raise RuntimeError("Index not found. Run `python build_index.py` first.")
+        faiss = import_faiss()
+        if USE_MMAP and has_meta_store(self.dir):
+            # Zero-copy: vectors and chunk texts stay in the shared page cache
+            index = faiss.read_index(index_path, faiss_mmap_flags(faiss))
+            meta = MetaStore(self.dir)
+        else:
+            index = faiss.read_index(index_path)
+            with open(meta_path, "r", encoding="utf-8") as f:
+                # Keyed by FAISS vector id; older position-based builds fall back to the row number
+                meta = {c.get("vid", i): c for i, c in enumerate(json.load(f))}
+        # nprobe / efSearch aren't stored in faiss.index
+        apply_search_params(index, search_overrides(load_params(self.path(INDEX_PARAMS_FILE))))
+        return index, meta
+
+    def namespace(self, model: str) -> str:
+        """Answer-cache namespace for `model` (see `cache_namespace`)."""
+        if self.version is None:
+            # Unversioned files can be rebuilt in place: re-check every time
+            return make_namespace(model, self.path(INDEX_FILE), self.path(META_FILE))
+        # A published version never changes, so it is hashed once
+        namespace = self._namespaces.get(model)
+        if namespace is None:
+            namespace = self._namespaces[model] = make_namespace(
+                model, self.path(INDEX_FILE), self.path(META_FILE)
+            )
+        return namespace
+
+    def embedder(self):
+        if self._embedder is None:
+            with _load_lock:
+                if self._embedder is None:
+                    # Query with the backend that built the index unless
+                    # CEYLONTRIP_EMBED_BACKEND says otherwise. Heavy imports
+                    # (torch / onnxruntime) happen inside load().
+                    manifest = load_manifest(self.path(EMBEDDER_MANIFEST_FILE)) or {}
+                    backend = EMBED_BACKEND or manifest.get("backend")
+                    if backend not in _embedders:
+                        _embedders[backend] = create_embedder(backend).load()
+                    self._embedder = _embedders[backend]
+        return self._embedder
+
+    def _side_index(self, name: str, load):
+        # None when this build predates the file; callers then skip that feature
+        if name not in self._side:
+            with self._lock:
+                if name not in self._side:
+                    path = self.path(name)
+                    self._side[name] = load(path) if os.path.exists(path) else None
+        return self._side[name]
+
+    def lexical_index(self):
+        # Without bm25.json retrieval falls back to dense only
+        return self._side_index(BM25_FILE, BM25Index.load)
+
+    def route_graph(self):
+        return self._side_index(ROUTE_GRAPH_FILE, RouteGraph.load)
+
+    def facet_index(self):
+        return self._side_index(FACETS_FILE, FacetIndex.load)
+
+    def lookup(self):
+        return self._side_index(LOOKUP_FILE, LookupEngine.load)
+
+    def intent_router(self):
+        # None when routing is off, the build predates intents.npz, or the
+        # query embedder's dimension doesn't match the prototypes
+        if not ROUTER_ENABLED:
+            return None
+
+        def load(path):
+            router = IntentRouter.load(path)
+            return router if router.dim == self.index_and_meta()[0].d else None
+
+        return self._side_index(INTENTS_FILE, load)
+
+    def load_all(self):
+        self.embedder()
+        self.index_and_meta()
+        self.lexical_index()
+        self.route_graph()
+        self.facet_index()
+        self.lookup()
+        self.intent_router()
+        return self
+
+
+def current_bundle() -> IndexBundle:
+    """
+    The live index version. Every call may notice that build_index.py has
+    published a new one (one stat() every CEYLONTRIP_RELOAD_CHECK_S at most);
+    it is then loaded on a background thread and swapped in when complete,
+    while turns that already hold the old bundle finish on it.
+    """
+    global _bundle, _watcher
+    if _bundle is None:
+        with _load_lock:
+            if _bundle is None:
+                # Watch before reading CURRENT so no publish can slip in between
+                _watcher = VersionWatcher(INDEX_DIR)
+                version = current_version(INDEX_DIR)
+                _bundle = IndexBundle(version_dir(INDEX_DIR, version), version)
+    elif _watcher.changed():
+        _start_reload()
+    _bundle.renew_lease()
+    return _bundle
+
+
+def _start_reload():
+    global _reload_thread
+    with _load_lock:
+        if _reload_thread is not None and _reload_thread.is_alive():
+            # Already loading; the watcher fires again if CURRENT moves on meanwhile
+            _watcher.force_check()
+            return
+        _reload_thread = threading.Thread(target=_reload, name="ceylontrip-reload", daemon=True)
+        _reload_thread.start()
+
+
+def _reload():
+    global _bundle
+    version = current_version(INDEX_DIR)
+    if version == _bundle.version:
+        return
+    try:
+        bundle = IndexBundle(version_dir(INDEX_DIR, version), version).load_all()
+    except Exception as e:
+        # Keep serving the old version; a newer publish triggers another attempt
+        print(f"[reload] index version {version}: {e}", file=sys.stderr)
+        return
+    # A single reference assignment: new turns see either bundle, whole
+    _bundle = bundle
+    print(f"[reload] now serving index version {version}", file=sys.stderr)
+
+
+def reload_index(wait: bool = True):
+    """Pick up the published index version now instead of at the next check."""
+    current_bundle()
+    _start_reload()
+    if wait and _reload_thread is not None:
+        _reload_thread.join()
+    return _bundle
+
+
+def load_index_and_meta():
+    return current_bundle().index_and_meta()
+
+
+def get_embedder():
+    return current_bundle().embedder()
+
+
+def get_lexical_index():
+    return current_bundle().lexical_index()
+
+
+def get_route_graph():
+    return current_bundle().route_graph()
+
+
+def get_facet_index():
+    return current_bundle().facet_index()
+
+
+def get_intent_router():
+    return current_bundle().intent_router()
+
+
+def load_all():
+    """Load the embedder, the FAISS index and every side index."""
+    current_bundle().load_all()
+
+
+def warm_up(background: bool = True):
+    """
+    Load everything retrieval needs ahead of the first question, then the
+    Ollama model (unless CEYLONTRIP_LLM_WARMUP=0). With `background`, runs
+    on a daemon thread (started once per process) so the UI can draw
+    meanwhile; returns that thread.
+    """
+    global _warmup_thread
+    if not background:
+        load_all()
+        if LLM_WARMUP:
+            warm_up_llm()
+        return None
+
+    with _load_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(
+                target=_warm_up_quietly, name="ceylontrip-warmup", daemon=True
+            )
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def _warm_up_quietly():
+    try:
+        load_all()
+    except Exception as e:
+        # The first real question will raise the same error where it can be shown
+        print(f"[warm-up] {e}", file=sys.stderr)
+    if LLM_WARMUP:
+        try:
+            warm_up_llm()
+        except Exception as e:
+            print(f"[warm-up] Ollama: {e}", file=sys.stderr)
+
+
+def priming_messages():
+    """A minimal turn sharing the static prompt prefix with real questions."""
+    return build_messages("Reply with OK.", [])
+
+
+def warm_up_llm() -> float:
+    """
+    Load the Ollama model with the configured keep_alive, prime the KV cache
+    with the system message, and start the idle heartbeat if configured.
+    Returns the seconds the warm-up request took (0 if the client can't).
+    """
+    client = get_client()
+    if not hasattr(client, "warm_up"):
+        return 0.0
+    seconds = client.warm_up(priming_messages())
+    client.start_heartbeat()
+    return seconds
+
+
+# ---------- Small-talk detection ----------
+def is_small_talk(message: str) -> bool:
+    message = message.lower().strip()
+    smalltalk_phrases = {
+        "ok", "okay", "kk", "k",
+        "thanks", "thank you", "tnx", "thx",
+        "great", "nice", "cool", "awesome",
+        "hi", "hello", "hey",
+        "good", "good job", "well done",
+        "bye", "goodbye", "see you"
+    }
+    return message in smalltalk_phrases
+
+
+# Canned replies per front end: "cli" (terminal) and "web" (Streamlit)
+REPLIES = {
+    "cli": {
+        "thanks": "You’re welcome! If you want, I can help you plan more Sri Lanka trips 😊",
+        "hello": "Hi! I’m CeylonTrip. Ask me anything about traveling in Sri Lanka 🌴",
+        "bye": "Bye! Hope you have an amazing trip in Sri Lanka someday 🇱🇰",
+        "default": "Got it! Whenever you’re ready, ask me about Sri Lanka travel plans 😊",
+        "no_context": "I can only help with travel questions related to Sri Lanka.",
+        "off_topic": "I only know about traveling in Sri Lanka, so I can’t help with that one. "
+                     "Ask me about beaches, trains, wildlife or itineraries in Sri Lanka 😊",
+        "busy": "I’m answering a lot of travellers right now. Please ask again in a minute 🙏",
+    },
+    "web": {
+        "thanks": "You’re welcome! If you like, I can help you plan more Sri Lanka trips 🥥🌴",
+        "hello": "Ayubowan! 🙏 I’m CeylonTrip. Ask me anything about traveling in Sri Lanka 🇱🇰",
+        "bye": "Goodbye! Hope you have a beautiful journey in Sri Lanka one day 🐘🏝️",
+        "default": "Got it! Whenever you’re ready, ask me about Sri Lanka travel plans 🌴",
+        "no_context": "I can only help with travel questions related to Sri Lanka 🇱🇰.",
+        "off_topic": "I only know about traveling in Sri Lanka 🇱🇰, so I can’t help with that one. "
+                     "Ask me about beaches, trains, wildlife or itineraries on the island 🌴",
+        "busy": "So many travellers are planning trips right now 🐘 Please ask again in a minute.",
+    },
+}
+
+
+def small_talk_reply(message: str, voice: str = "cli") -> str:
+    replies = REPLIES[voice]
+    msg = message.lower().strip()
+    if msg in {"thanks", "thank you", "tnx", "thx"}:
+        return replies["thanks"]
+    if msg in {"hi", "hello", "hey"}:
+        return replies["hello"]
+    if msg in {"bye", "goodbye", "see you"}:
+        return replies["bye"]
+    # default generic
+    return replies["default"]
+
+
+# ---------- Retrieval ----------
+def _normalize(vectors):
+    # Same L2 normalization build_index applies to the corpus, so inner
+    # product scores are cosine similarities
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+
+def embed_query(query: str, bundle: IndexBundle = None):
+    return _normalize((bundle or current_bundle()).embedder().encode([query]))
+
+
+def embed_queries(queries, batch_size: int = 256, bundle: IndexBundle = None):
+    """(n, dim) normalized query matrix from a single `encode` call."""
+    embedder = (bundle or current_bundle()).embedder()
+    return _normalize(embedder.encode(list(queries), batch_size=batch_size))
+
+
+def _dense_search(index, q_vecs, k: int, allowed=None):
+    """[(ids, {id: score})] per query row, optionally restricted to `allowed` ids."""
+    search_kwargs = {}
+    if allowed is not None:
+        faiss = import_faiss()
+        # Per-call parameters replace the index's own, so carry nprobe / efSearch over
+        search_kwargs["params"] = search_parameters(index, faiss.IDSelectorBatch(allowed))
+    D, I = index.search(q_vecs, k=k, **search_kwargs)
+    return [
+        ([int(idx) for idx in ids if idx >= 0],
+         {int(idx): float(d) for idx, d in zip(ids, dists) if idx >= 0})
+        for ids, dists in zip(I, D)
+    ]
+
+
+def _rank(query: str, dense_ranked, allowed, lexical_index, n_candidates: int):
+    if lexical_index is None:
+        return dense_ranked
+    allowed_set = set(allowed.tolist()) if allowed is not None else None
+    lexical_ranked = [
+        vid for vid, _ in lexical_index.search(query, top_k=n_candidates, allowed=allowed_set)
+    ]
+    return rrf_fuse([dense_ranked, lexical_ranked], [DENSE_WEIGHT, LEXICAL_WEIGHT])
+
+
+def _cosine(index, q_vec, vid: int, dense_scores: dict) -> float:
+    """Dense score of `vid`, reconstructing lexical-only hits from the index."""
+    if vid in dense_scores:
+        return dense_scores[vid]
+    try:
+        return float(index.reconstruct(vid) @ q_vec)
+    except RuntimeError:
+        # Index without a direct map: rank it like the weakest dense hit
+        return min(dense_scores.values(), default=0.0)
+
+
+def retrieve_chunks(
+    query: str, top_k: int = 5, q_vec=None, hybrid: bool = True, use_facets: bool = True
+):
+    """
+    Top-k chunks (meta dicts) for `query`. With `hybrid`, dense (FAISS) and lexical
+    (BM25) candidate lists are merged with reciprocal rank fusion. With
+    `use_facets`, months/regions/types named in the query restrict the
+    candidates before ranking.
+    """
+    if q_vec is None:
+        q_vec = embed_query(query)
+    return retrieve_chunks_batch([query], q_vec, top_k, hybrid, use_facets)[0]
+
+
+def retrieve_chunks_batch(
+    queries, q_vecs, top_k: int = 5, hybrid: bool = True, use_facets: bool = True
+):
+    """`retrieve_chunks` for many queries at once; see `retrieve_scored_batch`."""
+    scored = retrieve_scored_batch(queries, q_vecs, top_k, hybrid, use_facets)
+    return [[c for c, _ in chunks] for chunks in scored]
+
+
+def retrieve_scored_batch(
+    queries, q_vecs, top_k: int = 5, hybrid: bool = True, use_facets: bool = True,
+    bundle: IndexBundle = None,
+):
+    """
+    [(chunk, cosine score)] lists in fused rank order, one per query, from
+    `bundle` (default: the live index version). Queries without facet
+    constraints share one `index.search` over the whole (n, dim) matrix;
+    filtered queries need their own selector and are searched one by one.
+    """
+    bundle = bundle or current_bundle()
+    index, meta = bundle.index_and_meta()
+    lexical_index = bundle.lexical_index() if hybrid else None
+    facet_index = bundle.facet_index() if use_facets else None
+
+    allowed = [None] * len(queries)
+    if facet_index is not None:
+        allowed = [facet_index.allowed_ids(facet_index.parse(q)) for q in queries]
+
+    # Over-fetch when fusing so each retriever can promote the other's misses
+    n_candidates = max(top_k * 4, 20) if lexical_index is not None else top_k
+    k = min(n_candidates, len(meta))
+
+    dense = [None] * len(queries)
+    plain = [i for i, a in enumerate(allowed) if a is None]
+    with span("search"):
+        if plain:
+            for i, hits in zip(plain, _dense_search(index, q_vecs[plain], k)):
+                dense[i] = hits
+        for i, a in enumerate(allowed):
+            if a is not None:
+                dense[i] = _dense_search(index, q_vecs[i:i + 1], k, a)[0]
+
+    results = []
+    with span("rank"):
+        for row, (query, (ranked, scores), a) in enumerate(zip(queries, dense, allowed)):
+            ranked = _rank(query, [idx for idx in ranked if idx in meta], a, lexical_index, n_candidates)
+            results.append([
+                (meta[idx], _cosine(index, q_vecs[row], idx, scores))
+                for idx in ranked[:top_k] if idx in meta
+            ])
+    return results
+
+
+def retrieve(query: str, top_k: int = 5, q_vec=None, **kwargs):
+    """Top-k chunk texts for `query`; see `retrieve_chunks` for the options."""
+    return [c["text"] for c in retrieve_chunks(query, top_k, q_vec, **kwargs)]
+
+
+# ---------- Call Ollama ----------
+def cached_response(messages, namespace: str = None):
+    """
+    (key, reply) from the persistent response cache; reply is None on a
+    miss, and key is None when the cache is off. Store with `store_response`.
+    `namespace` defaults to the current index version's (see `prepare_turn`).
+    """
+    if response_cache is None:
+        return None, None
+    with span("response_cache"):
+        key = response_key(namespace or cache_namespace(), messages)
+        reply = response_cache.get(key)
+    if reply is not None:
+        metrics.mark_path("response_cache")
+    return key, reply
+
+
+def store_response(key, reply: str):
+    if key is not None:
+        response_cache.put(key, reply)
+
+
+def llm():
+    """The LLM scheduler, or the client itself when the scheduler is off."""
+    return llm_scheduler or get_client()
+
+
+def call_ollama(messages, namespace: str = None):
+    """Raises SchedulerBusy when the LLM queue turns the request away."""
+    key, reply = cached_response(messages, namespace)
+    if reply is None:
+        reply = llm().chat(messages)
+        store_response(key, reply)
+    return reply
+
+
+def call_ollama_stream(messages, namespace: str = None):
+    """Yield reply text pieces as Ollama produces them (NDJSON stream)."""
+    key, reply = cached_response(messages, namespace)
+    if reply is not None:
+        yield reply
+        return
+    parts = []
+    for piece in llm().chat_stream(messages):
+        parts.append(piece)
+        yield piece
+    # Only complete generations are stored
+    store_response(key, "".join(parts))
+
+
+# ---------- Build answer ----------
+def cache_namespace(bundle: IndexBundle = None) -> str:
+    # Rebuilding the index or switching models invalidates cached answers.
+    bundle = bundle or current_bundle()
+    return bundle.namespace(get_client().model)
+
+
+def build_context(user_question: str, scored, bundle: IndexBundle = None):
+    """
+    CONTEXT texts for the prompt from [(chunk, score)] candidates: similarity
+    floors, dynamic top_k, dedup and the token budget (context_budget.py).
+    Empty when nothing relevant was retrieved.
+    """
+    # Multi-stop questions: precomputed route plan as structured facts
+    route_graph = (bundle or current_bundle()).route_graph()
+    plan_text = route_facts(route_graph, user_question) if route_graph else None
+    texts, report = assemble_context(scored, plan_text)
+    context_stats.record(report)
+    return texts
+
+
+def build_messages(user_question: str, context_chunks):
+    """
+    Chat messages for Ollama: the constant system message, then CONTEXT +
+    QUESTION. Everything that changes per turn comes after the static prefix.
+    """
+    context_text = "\n\n---\n\n".join(context_chunks)
+    user_block = f"CONTEXT:\n{context_text}\n\nQUESTION:\n{user_question}"
+    return [SYSTEM_MESSAGE, {"role": "user", "content": user_block}]
+
+
+def lookup_answer(bundle: IndexBundle, user_question: str):
+    """Templated answer from the fast-path lookup tables, or None (see fast_path.py)."""
+    lookup = bundle.lookup()
+    if lookup is None:
+        return None
+    with span("lookup"):
+        start = time.perf_counter()
+        hit = lookup.answer(user_question)
+        lookup_stats.record(hit is not None, time.perf_counter() - start)
+    return hit[0] if hit is not None else None
+
+
+def prepare_turn(user_question: str, voice: str = "cli"):
+    """
+    Return (canned_reply, messages, q_vec, namespace). Small talk, exact
+    lookups, off-topic questions, cache hits and empty retrieval get a canned
+    reply (the rest is None); everything else gets the chat messages to send
+    to Ollama plus the query vector and cache namespace to file the reply
+    under. The namespace is that of the index version the turn retrieved
+    from, even if a reload lands while the reply is generated.
+    """
+    # 1) Small talk: answer naturally, no RAG
+    with span("small_talk"):
+        small_talk = is_small_talk(user_question)
+    if small_talk:
+        intent_stats.record("small_talk")
+        metrics.mark_path("small_talk")
+        return small_talk_reply(user_question, voice), None, None, None
+
+    # The whole turn uses one index version, even if a reload lands meanwhile
+    bundle = current_bundle()
+
+    # 2) Exact lookups ("Kandy to Ella by train?"): answered from the CSV rows
+    fast = lookup_answer(bundle, user_question)
+    if fast is not None:
+        metrics.mark_path("lookup")
+        return fast, None, None, None
+
+    # 3) Intent router: looser small talk and off-topic questions, same query vector
+    with span("embed"):
+        q_vec = embed_query(user_question, bundle)
+    router = bundle.intent_router()
+    if router is not None:
+        with span("route"):
+            route = router.route(user_question, q_vec)
+        if route is not None:
+            intent, reply_key, _ = route
+            intent_stats.record(intent)
+            metrics.mark_path(intent)
+            return REPLIES[voice][reply_key], None, None, None
+    intent_stats.record()
+
+    # 4) Semantic cache: a near-identical question was already answered
+    namespace = cache_namespace(bundle)
+    with span("cache"):
+        cached = answer_cache.get(q_vec, namespace)
+    if cached is not None:
+        metrics.mark_path("cache")
+        return cached, None, None, None
+
+    # 5) Retrieve Sri Lanka context, keeping only what clears the budgeter
+    scored = retrieve_scored_batch(
+        [user_question], q_vec, top_k=CONTEXT_CANDIDATES, bundle=bundle
+    )[0]
+    with span("context"):
+        context_chunks = build_context(user_question, scored, bundle)
+
+    # If no context found, likely not about Sri Lanka or too vague
+    if not context_chunks:
+        metrics.mark_path("no_context")
+        return REPLIES[voice]["no_context"], None, None, None
+
+    with span("prompt"):
+        messages = build_messages(user_question, context_chunks)
+    metrics.mark_path("llm")
+    return None, messages, q_vec, namespace
+
+
+def prepare_turns(user_questions, voice: str = "cli"):
+    """
+    Batch version of `prepare_turn`: one `encode` call and one dense search
+    for every non-small-talk question. Returns a list of
+    (canned_reply, messages, q_vec, namespace) in input order.
+    """
+    turns = [None] * len(user_questions)
+    questions = []
+    with span("small_talk"):
+        for i, q in enumerate(user_questions):
+            if is_small_talk(q):
+                intent_stats.record("small_talk")
+                turns[i] = (small_talk_reply(q, voice), None, None, None)
+            else:
+                questions.append(i)
+
+    bundle = current_bundle()
+    rag = []
+    for i in questions:
+        fast = lookup_answer(bundle, user_questions[i])
+        if fast is not None:
+            turns[i] = (fast, None, None, None)
+        else:
+            rag.append(i)
+    if not rag:
+        return turns
+
+    with span("embed"):
+        q_vecs = embed_queries([user_questions[i] for i in rag], bundle=bundle)
+    routes = [None] * len(rag)
+    router = bundle.intent_router()
+    if router is not None:
+        with span("route"):
+            routes = router.route_batch([user_questions[i] for i in rag], q_vecs)
+    namespace = cache_namespace(bundle)
+    pending = []
+    with span("cache"):
+        for row, i in enumerate(rag):
+            if routes[row] is not None:
+                intent, reply_key, _ = routes[row]
+                intent_stats.record(intent)
+                turns[i] = (REPLIES[voice][reply_key], None, None, None)
+                continue
+            intent_stats.record()
+            cached = answer_cache.get(q_vecs[row], namespace)
+            if cached is not None:
+                turns[i] = (cached, None, None, None)
+            else:
+                pending.append(row)
+
+    if pending:
+        questions = [user_questions[rag[row]] for row in pending]
+        batches = retrieve_scored_batch(
+            questions, q_vecs[pending], top_k=CONTEXT_CANDIDATES, bundle=bundle
+        )
+        with span("context"):
+            for row, question, scored in zip(pending, questions, batches):
+                i = rag[row]
+                context_chunks = build_context(question, scored, bundle)
+                if not context_chunks:
+                    turns[i] = (REPLIES[voice]["no_context"], None, None, None)
+                else:
+                    messages = build_messages(question, context_chunks)
+                    turns[i] = (None, messages, q_vecs[row:row + 1], namespace)
+    return turns
+
+
+def answer_question(user_question: str, voice: str = "cli", timings: dict = None) -> str:
+    """
+    Answer one question. If `timings` is given it is filled with `prepare_s`
+    (small talk / cache / retrieval / prompt), `total_s`, and the per-stage
+    seconds and LLM stats of metrics.py in `stages` / `llm`.
+    """
+    start = time.perf_counter()
+    trace = metrics.Trace()
+    with trace.activate():
+        reply, messages, q_vec, namespace = prepare_turn(user_question, voice)
+        if timings is not None:
+            timings["prepare_s"] = time.perf_counter() - start
+
+        if reply is None:
+            try:
+                with span("llm"):
+                    reply = call_ollama(messages, namespace)
+            except SchedulerBusy:
+                # Answer at once rather than wait behind a full LLM queue
+                reply = REPLIES[voice]["busy"]
+                metrics.mark_path("busy")
+            else:
+                answer_cache.put(q_vec, reply, namespace)
+
+    trace.finish()
+    if timings is not None:
+        timings["total_s"] = time.perf_counter() - start
+        timings["stages"], timings["llm"] = trace.stages, trace.llm
+    return reply
+
+
+def answer_question_stream(user_question: str, timings: dict = None, voice: str = "cli"):
+    """
+    Generator version of answer_question: yields the reply piece by piece.
+
+    If `timings` is given it is filled with `prepare_s`, `ttft_s` (seconds
+    until the first piece) as soon as that piece arrives, and `total_s`,
+    `stages` and `llm` (see `answer_question`) once generation ends.
+    """
+    start = time.perf_counter()
+    trace = metrics.Trace()
+    with trace.activate():
+        reply, messages, q_vec, namespace = prepare_turn(user_question, voice)
+    prepared = time.perf_counter()
+    if timings is not None:
+        timings["prepare_s"] = prepared - start
+    pieces = [reply] if reply is not None else metrics.traced(trace, call_ollama_stream(messages, namespace))
+
+    parts, busy = [], False
+    try:
+        for piece in pieces:
+            if not parts and messages is not None:
+                with trace.activate():
+                    metrics.observe_stage("llm_ttft", time.perf_counter() - prepared)
+            if timings is not None and "ttft_s" not in timings:
+                timings["ttft_s"] = time.perf_counter() - start
+            parts.append(piece)
+            yield piece
+    except SchedulerBusy:
+        # The LLM queue turned the turn away before its first piece
+        busy = True
+
+    if busy:
+        yield REPLIES[voice]["busy"]
+    elif messages is not None:
+        # Only complete generations are cached
+        with trace.activate():
+            metrics.observe_stage("llm", time.perf_counter() - prepared)
+        answer_cache.put(q_vec, "".join(parts), namespace)
+
+    trace.finish("busy" if busy else None)
+    if timings is not None:
+        timings["total_s"] = time.perf_counter() - start
+        timings.setdefault("ttft_s", timings["total_s"])
+        timings["stages"], timings["llm"] = trace.stages, trace.llm
+
+
+# ---------- Startup measurement ----------
+def measure_startup(sample_question: str = "Best surf spots in July?") -> dict:
+    """
+    Seconds spent on: importing this module in a fresh interpreter, importing
+    faiss, loading the embedding backend, loading the indexes, and the first
+    retrieval after that.
+    """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    probe = (
+        "import time; t = time.perf_counter(); import engine; "
+        "print(time.perf_counter() - t)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", probe], cwd=base_dir, capture_output=True, text=True, check=True
+    )
+    timings = {"import_engine_s": float(out.stdout.strip())}
+
+    t = time.perf_counter()
+    import_faiss()
+    timings["import_faiss_s"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    get_embedder()
+    timings["load_embedder_s"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    load_all()
+    timings["load_indexes_s"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    retrieve(sample_question)
+    timings["first_retrieval_s"] = time.perf_counter() - t
+    return timings
+
+
+if __name__ == "__main__":
+    if "--startup" in sys.argv[1:]:
+        for name, seconds in measure_startup().items():
+            print(f"{name:<20} {seconds:8.3f} s")
+    else:
+        print("Usage: python engine.py --startup")
@@ -0,0 +1,225 @@
+# facets.py
+"""
+Structured month / region / type filters for destination chunks.
+
+At build time `build_facets` parses the `best_months`, `region` and `types`
+columns that ingest carries on each destination chunk into compact per-chunk columns (12-bit month masks, region
+ids, type bitmaps) saved as `facets.npz` next to the FAISS index.
+
+At query time `parse_query` pulls months, regions and types out of the
+question, and `FacetIndex.allowed_ids` turns them into the set of FAISS ids
+that retrieval is restricted to. Non-destination chunks (routes, tips) carry
+no facets and always pass.
+"""
+import re
+
+import numpy as np
+
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+ALL_MONTHS = (1 << 12) - 1
+
+_MONTH_NAMES = {
+    "january": 0, "february": 1, "march": 2, "april": 3, "may": 4, "june": 5,
+    "july": 6, "august": 7, "september": 8, "sept": 8, "october": 9,
+    "november": 10, "december": 11,
+}
+_MONTH_NAMES.update({m: i for i, m in enumerate(MONTHS)})
+
+# Broad areas travellers ask about -> phrases found in the `region` column
+REGION_GROUPS = {
+    "west coast": ["western", "south-west coast", "north-west"],
+    "south coast": ["south coast", "south-west coast", "south-east", "south"],
+    "east coast": ["east coast"],
+    "hill country": ["hill country", "central highlands", "near kandy"],
+    "cultural triangle": ["cultural triangle"],
+    "north": ["northern", "north central", "north-west"],
+}
+
+# Query phrases -> region group
+REGION_ALIASES = {
+    "west coast": "west coast", "western": "west coast",
+    "south coast": "south coast", "southern": "south coast", "south": "south coast",
+    "east coast": "east coast", "eastern": "east coast", "east": "east coast",
+    "hill country": "hill country", "highlands": "hill country",
+    "hills": "hill country", "mountains": "hill country",
+    "cultural triangle": "cultural triangle",
+    "north": "north", "northern": "north",
+}
+
+# Query words -> type tags they should match
+TYPE_SYNONYMS = {
+    "hike": ["hiking", "hike", "trekking"],
+    "trek": ["trekking", "hiking"],
+    "wildlife": ["wildlife", "safari"],
+    "animal": ["wildlife", "safari"],
+    "elephant": ["wildlife", "safari"],
+    "leopard": ["wildlife", "safari"],
+    "temple": ["culture", "pilgrimage", "history"],
+    "ruin": ["ruins", "history"],
+    "ancient": ["ruins", "history"],
+    "kite": ["kitesurfing"],
+}
+
+
+# ---------- Parsing ----------
+def _stem(word: str) -> str:
+    for suffix in ("ing", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def month_mask(best_months: str) -> int:
+    """'Nov–Mar; Jul–Sep' -> 12-bit mask (bit 0 = January). Wraps over New Year."""
+    text = str(best_months).lower()
+    if "year-round" in text or "year round" in text:
+        return ALL_MONTHS
+    mask = 0
+    for part in re.split(r"[;,]", text):
+        found = [MONTHS.index(m) for m in re.findall(r"[a-z]{3}", part) if m in MONTHS]
+        if len(found) >= 2 and re.search(r"[–-]", part):
+            start, end = found[0], found[1]
+            i = start
+            while True:
+                mask |= 1 << i
+                if i == end:
+                    break
+                i = (i + 1) % 12
+        for m in found:
+            mask |= 1 << m
+    return mask or ALL_MONTHS
+
+
+def region_groups(region: str):
+    region = str(region).lower()
+    return [g for g, phrases in REGION_GROUPS.items() if any(p in region for p in phrases)]
+
+
+def split_types(types: str):
+    return [t.strip().lower() for t in str(types).split(";") if t.strip()]
+
+
+def parse_query(text: str, type_vocab) -> dict:
+    """
+    Extract facet constraints from a question:
+    {"months": 12-bit mask (0 = none), "regions": [group], "types": bitmask}.
+    """
+    lowered = text.lower()
+    months = 0
+    for word, i in _MONTH_NAMES.items():
+        for m in re.finditer(r"\b" + word + r"\b", lowered):
+            # "may" is usually a verb; only trust it capitalised and not as "May I ..."
+            if word == "may" and (
+                text[m.start()] != "M"
+                or re.match(r"may\s+(i|we|you|be|have)\b", lowered[m.start():])
+            ):
+                continue
+            months |= 1 << i
+
+    regions = []
+    for phrase, group in sorted(REGION_ALIASES.items(), key=lambda kv: -len(kv[0])):
+        if re.search(r"\b" + re.escape(phrase) + r"\b", lowered) and group not in regions:
+            regions.append(group)
+            lowered = lowered.replace(phrase, " ")
+
+    words = {_stem(w) for w in re.findall(r"[a-z]+", text.lower())}
+    wanted = set()
+    for word in words:
+        wanted.update(TYPE_SYNONYMS.get(word, []))
+    types = 0
+    for bit, tag in enumerate(type_vocab):
+        if tag in wanted or _stem(tag.split()[0]) in words:
+            types |= 1 << bit
+
+    return {"months": months, "regions": regions, "types": types}
+
+
+# ---------- Build time ----------
+def build_facets(corpus, destinations_rows) -> dict:
+    """
+    Per-chunk facet columns aligned with `corpus`. `destinations_rows` maps
+    a destination chunk id to its CSV fields (region, types, best_months).
+    """
+    regions = sorted({str(r["region"]) for r in destinations_rows.values()})
+    type_vocab = sorted({t for r in destinations_rows.values() for t in split_types(r["types"])})
+    if len(type_vocab) > 64:
+        raise ValueError("More than 64 destination types; widen the type bitmap.")
+
+    n = len(corpus)
+    data = {
+        "vids": np.array([c["vid"] for c in corpus], dtype="int64"),
+        "faceted": np.zeros(n, dtype=bool),
+        "months": np.full(n, ALL_MONTHS, dtype="uint16"),
+        "region_ids": np.full(n, -1, dtype="int16"),
+        "types": np.zeros(n, dtype="uint64"),
+        "region_vocab": np.array(regions),
+        "type_vocab": np.array(type_vocab),
+    }
+    for i, chunk in enumerate(corpus):
+        row = destinations_rows.get(chunk["id"])
+        if row is None:
+            continue
+        data["faceted"][i] = True
+        data["months"][i] = month_mask(row["best_months"])
+        data["region_ids"][i] = regions.index(str(row["region"]))
+        bits = 0
+        for t in split_types(row["types"]):
+            bits |= 1 << type_vocab.index(t)
+        data["types"][i] = bits
+    return data
+
+
+def save_facets(data: dict, path: str):
+    np.savez(path, **data)
+
+
+# ---------- Query time ----------
+class FacetIndex:
+    def __init__(self, data):
+        self.vids = data["vids"]
+        self.faceted = data["faceted"]
+        self.months = data["months"].astype("int64")
+        self.region_ids = data["region_ids"]
+        self.types = data["types"]
+        self.region_vocab = data["region_vocab"].tolist()
+        self.type_vocab = data["type_vocab"].tolist()
+
+        # region group -> region ids that belong to it
+        self.group_region_ids = {
+            g: np.array(
+                [i for i, r in enumerate(self.region_vocab) if g in region_groups(r)],
+                dtype="int16",
+            )
+            for g in REGION_GROUPS
+        }
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls({k: data[k] for k in data.files})
+
+    def parse(self, text: str) -> dict:
+        return parse_query(text, self.type_vocab)
+
+    def allowed_ids(self, query_filter: dict):
+        """
+        FAISS ids that satisfy every constraint in `query_filter`, plus all
+        unfaceted chunks. None when there is no constraint, or when no
+        destination matches (better to search unfiltered than return nothing).
+        """
+        mask = self.faceted.copy()
+        constrained = False
+        if query_filter["months"]:
+            mask &= (self.months & query_filter["months"]) != 0
+            constrained = True
+        if query_filter["regions"]:
+            ids = np.concatenate([self.group_region_ids[g] for g in query_filter["regions"]])
+            mask &= np.isin(self.region_ids, ids)
+            constrained = True
+        if query_filter["types"]:
+            mask &= (self.types & np.uint64(query_filter["types"])) != 0
+            constrained = True
+
+        if not constrained or not mask.any():
+            return None
+        return self.vids[mask | ~self.faceted]
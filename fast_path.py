@@ -0,0 +1,283 @@
+# fast_path.py
+"""
+Deterministic answers for single-row lookups, with no retrieval or LLM.
+
+"How long is Kandy to Ella by train?" or "Best months for Arugam Bay?" have
+exact answers in one row of routes.csv or destinations.csv. build_index.py
+packs those rows into lookup.json with an alias table of every way a place
+is written ("Galle" -> "Galle (Fort)", "Nilaveli" -> "Trincomalee / Nilaveli").
+
+At query time `LookupEngine.answer` normalizes the question and matches it
+against a few whole-question patterns (travel time / how to get there,
+best months, days to spend). Place slots resolve through the alias table,
+then by fuzzy match for typos. Anything not fully understood returns None
+and goes through RAG + the LLM as before: extra clauses, an unknown place,
+no direct route row, or a transport mode the row doesn't have. A travel-time
+question with no mode, for a pair with several transport rows, lists every
+option, fastest first.
+
+    python fast_path.py bench    # hit rate and latency on sample questions
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import difflib
+import argparse
+import threading
+
+from route_graph import name_variants
+
+# Minimum difflib ratio for a misspelled place name
+FUZZY_CUTOFF = float(os.environ.get("CEYLONTRIP_LOOKUP_FUZZY", "0.85"))
+
+# Common names that name_variants() can't derive from the CSV
+EXTRA_ALIASES = {
+    "galle fort": "Galle (Fort)",
+    "trinco": "Trincomalee / Nilaveli",
+    "trincomalee": "Trincomalee / Nilaveli",
+    "pasikuda": "Passikudah / Kalkudah",
+    "adams peak": "Adam’s Peak (Sri Pada)",
+    "sri paada": "Adam’s Peak (Sri Pada)",
+    "horton plains": "Horton Plains National Park",
+    "worlds end": "Horton Plains National Park",
+    "yala": "Yala National Park (Tissamaharama)",
+    "tissa": "Yala National Park (Tissamaharama)",
+    "udawalawe": "Udawalawe National Park",
+    "uda walawe": "Udawalawe National Park",
+    "knuckles": "Knuckles Mountain Range",
+    "arugambay": "Arugam Bay",
+    "airport": "Bandaranaike Airport (CMB)",
+    "cmb": "Bandaranaike Airport (CMB)",
+    "katunayake": "Bandaranaike Airport (CMB)",
+}
+
+_MODE = r"(?: by (?P<mode>train|car|road|bus|tuk tuk|tuk-tuk|tuktuk))?"
+_NAME = r"(?P<{}>[a-z'/()\- ]+?)"
+_A, _B = _NAME.format("a"), _NAME.format("b")
+
+# (kind, whole-question pattern); `a` / `b` are place slots
+PATTERNS = [(kind, re.compile(pattern)) for kind, pattern in (
+    ("route", rf"how long (?:is it |does it take |will it take |is the (?:trip|journey|ride|drive) )?"
+              rf"(?:to (?:get|go|travel) )?from {_A} to {_B}{_MODE}"),
+    ("route", rf"how long is (?:the (?:trip|journey|ride|drive) )?{_A} to {_B}{_MODE}"),
+    ("route", rf"how many hours (?:is it |does it take )?(?:to (?:get|go|travel) )?(?:from )?{_A} to {_B}{_MODE}"),
+    ("route", rf"(?:what is |what's )?(?:the )?(?:travel|journey|driving|train|bus) time "
+              rf"(?:from |between )?{_A} (?:to|and) {_B}{_MODE}"),
+    ("route", rf"how (?:do i|to|can i|should i|do you) (?:get|go|travel) from {_A} to {_B}{_MODE}"),
+    ("months", rf"(?:what is |what's |what are |when is )?(?:the )?best (?:time|months?|season) "
+               rf"(?:to (?:visit|go to|go|travel to) |for (?:visiting )?|in |at )?{_A}"),
+    ("months", rf"when (?:should i|to|is it best to|is the best time to|can i) (?:visit|go to|go) {_A}"),
+    ("days", rf"how many (?:days|nights) (?:should i (?:spend|stay) |do i need |to spend |is enough |are enough )?"
+             rf"(?:in|at|for) {_A}"),
+    ("days", rf"how long (?:should i |to )?(?:stay|spend) (?:in|at) {_A}"),
+)]
+
+_PREFIXES = re.compile(r"^(?:please |hey |hi |ok |so |can you tell me |do you know |tell me )+")
+_SUFFIXES = re.compile(r"(?:,? (?:in )?sri lanka|,? please)+$")
+_MODE_TRANSPORT = {"train": "train", "bus": "bus", "car": "car", "road": "car",
+                   "tuk tuk": "tuk-tuk", "tuk-tuk": "tuk-tuk", "tuktuk": "tuk-tuk"}
+
+
+# ---------- Build ----------
+def _read_csv(path: str):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def build_lookup(routes_path: str = None, destinations_path: str = None) -> dict:
+    places, routes = {}, {}
+    if destinations_path and os.path.exists(destinations_path):
+        for row in _read_csv(destinations_path):
+            places[row["name"]] = {
+                "region": row["region"],
+                "best_months": row["best_months"],
+                "recommended_days": row["recommended_days"],
+            }
+    if routes_path and os.path.exists(routes_path):
+        for row in _read_csv(routes_path):
+            # Routes are undirected, as in the route graph
+            key = "|".join(sorted((row["from"], row["to"])))
+            routes.setdefault(key, []).append({
+                "from": row["from"], "to": row["to"], "transport": row["transport"],
+                "hours_min": float(row["hours_min"]), "hours_max": float(row["hours_max"]),
+                "scenic": row["scenic"].strip().lower() == "yes", "notes": row["notes"],
+            })
+            places.setdefault(row["from"], {})
+            places.setdefault(row["to"], {})
+
+    aliases = {}
+    for name in sorted(places):
+        for variant in name_variants(name):
+            aliases.setdefault(variant, name)
+    for alias, name in EXTRA_ALIASES.items():
+        if name in places:
+            aliases.setdefault(alias, name)
+    return {"places": places, "routes": routes, "aliases": aliases}
+
+
+def save_lookup(data: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+# ---------- Answering ----------
+def _hours(lo: float, hi: float) -> str:
+    if hi < 1:
+        return f"{round(lo * 60)}–{round(hi * 60)} minutes"
+    return f"{lo:g}–{hi:g} hours"
+
+
+class LookupEngine:
+    def __init__(self, data: dict):
+        self.places = data["places"]
+        self.routes = data["routes"]
+        self.aliases = data["aliases"]
+        self._alias_names = sorted(self.aliases)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        text = question.lower().replace("’", "'").strip()
+        text = re.sub(r"[?!.]+$", "", text)
+        text = re.sub(r"\s+", " ", text).strip()
+        text = _PREFIXES.sub("", text)
+        return _SUFFIXES.sub("", text).strip()
+
+    def resolve(self, text: str):
+        """Canonical place name for a slot, or None."""
+        text = re.sub(r"^the ", "", text.strip(" ,"))
+        name = self.aliases.get(text) or self.aliases.get(text.replace("'", ""))
+        if name is None:
+            close = difflib.get_close_matches(text, self._alias_names, n=1, cutoff=FUZZY_CUTOFF)
+            name = self.aliases[close[0]] if close else None
+        return name
+
+    def answer(self, question: str):
+        """(reply, kind) when the question is a lookup we can answer exactly, else None."""
+        text = self.normalize(question)
+        for kind, pattern in PATTERNS:
+            m = pattern.fullmatch(text)
+            if m is None:
+                continue
+            a = self.resolve(m.group("a"))
+            if a is None:
+                return None
+            if kind == "route":
+                b = self.resolve(m.group("b"))
+                reply = self._route(a, b, m.group("mode")) if b is not None and b != a else None
+            else:
+                reply = self._destination(kind, a)
+            return (reply, kind) if reply is not None else None
+        return None
+
+    def _route(self, a: str, b: str, mode: str = None):
+        rows = self.routes.get("|".join(sorted((a, b))))
+        if not rows:
+            # Multi-leg trips are left to the route graph + LLM
+            return None
+        if mode is not None:
+            rows = [r for r in rows if r["transport"] == _MODE_TRANSPORT[mode]]
+            if not rows:
+                return None
+        if len(rows) == 1:
+            r = rows[0]
+            scenic = " (scenic route)" if r["scenic"] else ""
+            notes = f" {r['notes']}" if r["notes"] else ""
+            return f"{a} → {b}: about {_hours(r['hours_min'], r['hours_max'])} by {r['transport']}{scenic}.{notes}"
+        # No mode asked and several rows: list every option, fastest first
+        lines = [f"{a} → {b}, fastest first:"]
+        for r in sorted(rows, key=lambda r: (r["hours_min"], r["hours_max"])):
+            scenic = " (scenic route)" if r["scenic"] else ""
+            notes = f" {r['notes']}" if r["notes"] else ""
+            lines.append(f"- {r['transport']}: about {_hours(r['hours_min'], r['hours_max'])}{scenic}.{notes}")
+        return "\n".join(lines)
+
+    def _destination(self, kind: str, name: str):
+        place = self.places.get(name) or {}
+        if kind == "months" and place.get("best_months"):
+            return f"Best time to visit {name}: {place['best_months']} ({place['region']})."
+        if kind == "days" and place.get("recommended_days"):
+            days = place["recommended_days"]
+            unit = "day" if days == "1" else "days"
+            return f"Plan about {days} {unit} in {name}. Best months: {place['best_months']}."
+        return None
+
+
+class LookupStats:
+    """Fast-path hit rate and lookup latency, shared across threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.questions = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def record(self, hit: bool, seconds: float):
+        with self._lock:
+            self.questions += 1
+            self.hits += int(hit)
+            self.seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "questions": self.questions,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.questions if self.questions else 0.0,
+                "avg_lookup_ms": self.seconds / self.questions * 1000 if self.questions else 0.0,
+            }
+
+
+# ---------- Benchmark ----------
+SAMPLE_LOOKUPS = [
+    "How long is Kandy to Ella by train?",
+    "how long does it take from Colombo to Galle?",
+    "Travel time between Ella and Arugam Bay",
+    "How do I get from Colombo to Trinco?",
+    "How long from the airport to Negombo?",
+    "Best months for Arugam Bay?",
+    "When should I visit Nilaveli?",
+    "What is the best time to visit Yala?",
+    "Best time to visit Nuwara Elia",
+    "How many days in Ella?",
+    "How long should I stay in Mirissa?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic fast-path lookups.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="hit rate and latency on sample + benchmark questions")
+    bench.add_argument("--queries", default=os.path.join(os.path.dirname(__file__), "data", "eval", "queries_v1.json"))
+    bench.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    data_dir = os.path.join(os.path.dirname(__file__), "data")
+    lookup = LookupEngine(build_lookup(
+        os.path.join(data_dir, "routes.csv"), os.path.join(data_dir, "destinations.csv")
+    ))
+    with open(args.queries, "r", encoding="utf-8") as f:
+        eval_questions = [q["question"] for q in json.load(f)["queries"]]
+
+    for label, questions in (("sample lookups", SAMPLE_LOOKUPS), ("benchmark set", eval_questions)):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            results = [lookup.answer(q) for q in questions]
+        per_question_us = (time.perf_counter() - start) / (args.repeat * len(questions)) * 1e6
+        hits = sum(r is not None for r in results)
+        print(f"{label}: {hits}/{len(questions)} answered ({hits / len(questions):.0%}), "
+              f"{per_question_us:.1f} µs per question")
+        for q, r in zip(questions, results):
+            if label == "sample lookups" or r is not None:
+                print(f"  {q!r}\n    -> {r[0] if r else '(RAG + LLM)'}", file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
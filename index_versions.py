@@ -0,0 +1,182 @@
+# index_versions.py
+"""
+Versioned index directories with an atomically switched CURRENT pointer.
+
+Each build_index.py run writes a complete index into its own directory and
+only then points CURRENT at it:
+
+    data/index/
+        CURRENT                    name of the live version (one line)
+        versions/20250101-120000-123456789-ab12cd/
+            faiss.index, meta.*, bm25.json, facets.npz, ...
+            .leases/<host>-<pid>   touched by engines serving this version
+        embed_cache.npz            shared by every version
+
+CURRENT is replaced with os.replace, so a reader sees either the old or the
+new version, never a half-written one. Running engines notice the change
+with `VersionWatcher`: one stat() of CURRENT every few seconds at most.
+
+`prune_versions` keeps the newest KEEP_VERSIONS, the live one, and any
+version an engine has used within LEASE_S: a long-running process that
+fell a few builds behind still finds its files.
+
+An index built before versioning (files directly in data/index) is used
+as-is until the first versioned build publishes CURRENT.
+"""
+import os
+import time
+import socket
+import shutil
+import secrets
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+LEASES_DIR = ".leases"
+
+# Versions kept on disk, the live one included. Engines that have not
+# reloaded yet may still be reading the previous one.
+KEEP_VERSIONS = int(os.environ.get("CEYLONTRIP_KEEP_VERSIONS", "3"))
+# How often a running engine may stat CURRENT (0 disables hot reload)
+RELOAD_CHECK_S = float(os.environ.get("CEYLONTRIP_RELOAD_CHECK_S", "2"))
+# A version some engine used within this many seconds is never pruned
+LEASE_S = float(os.environ.get("CEYLONTRIP_VERSION_LEASE_S", "3600"))
+
+
+# ---------- Writing ----------
+def create_version(index_root: str):
+    """Make an empty, unpublished version directory; returns (name, path)."""
+    # Names sort by creation time, to the nanosecond (UTC, so no DST jumps)
+    now_ns = time.time_ns()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now_ns // 1_000_000_000))
+    name = f"{stamp}-{now_ns % 1_000_000_000:09d}-{secrets.token_hex(3)}"
+    path = os.path.join(index_root, VERSIONS_DIR, name)
+    os.makedirs(path)
+    return name, path
+
+
+def publish(index_root: str, name: str):
+    """Atomically make `name` the live version."""
+    path = os.path.join(index_root, CURRENT_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def list_versions(index_root: str):
+    versions_dir = os.path.join(index_root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(versions_dir)
+        if os.path.isdir(os.path.join(versions_dir, name))
+    )
+
+
+def prune_versions(index_root: str, keep: int = KEEP_VERSIONS, lease_s: float = LEASE_S):
+    """
+    Delete all but the newest `keep` versions; returns their names. The live
+    version and versions leased within `lease_s` seconds are never deleted.
+    """
+    current = current_version(index_root)
+    old = [
+        name for name in list_versions(index_root)[:-max(1, keep)]
+        if name != current and not leased(version_dir(index_root, name), lease_s)
+    ]
+    for name in old:
+        # Processes still mapping these files keep reading them until they let go
+        shutil.rmtree(os.path.join(index_root, VERSIONS_DIR, name), ignore_errors=True)
+    return old
+
+
+# ---------- Leases ----------
+class Lease:
+    """
+    Marks a version directory as in use by this process: one file per
+    process under .leases/, its mtime refreshed by `renew` at most every
+    LEASE_S / 4. A process that exits simply stops renewing.
+    """
+
+    def __init__(self, directory: str, lease_s: float = LEASE_S):
+        self.path = os.path.join(directory, LEASES_DIR, f"{socket.gethostname()}-{os.getpid()}")
+        self.every_s = lease_s / 4
+        self._next = 0.0
+
+    def renew(self):
+        now = time.monotonic()
+        if now < self._next:
+            return
+        self._next = now + self.every_s
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8"):
+                pass
+            os.utime(self.path)
+        except OSError:
+            # Read-only checkout, or the version is already gone
+            pass
+
+
+def leased(directory: str, lease_s: float = LEASE_S) -> bool:
+    """True when some process renewed a lease on `directory` within `lease_s`."""
+    try:
+        entries = os.scandir(os.path.join(directory, LEASES_DIR))
+    except FileNotFoundError:
+        return False
+    now = time.time()
+    with entries:
+        return any(now - entry.stat().st_mtime < lease_s for entry in entries)
+
+
+# ---------- Reading ----------
+def current_version(index_root: str):
+    """Name of the live version, or None for an unversioned (legacy) index."""
+    try:
+        with open(os.path.join(index_root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_dir(index_root: str, name: str) -> str:
+    return os.path.join(index_root, VERSIONS_DIR, name) if name else index_root
+
+
+def current_dir(index_root: str) -> str:
+    return version_dir(index_root, current_version(index_root))
+
+
+class VersionWatcher:
+    """Cheap change detection for CURRENT: at most one stat() per `interval_s`."""
+
+    def __init__(self, index_root: str, interval_s: float = RELOAD_CHECK_S):
+        self.path = os.path.join(index_root, CURRENT_FILE)
+        self.interval_s = interval_s
+        self._next_check = 0.0
+        self._stamp = self._stat()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def changed(self) -> bool:
+        """True once per change of CURRENT since the last call that returned True."""
+        if self.interval_s <= 0:
+            return False
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + self.interval_s
+        stamp = self._stat()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return True
+
+    def force_check(self):
+        """Make the next due check report a change (to retry while a reload is busy)."""
+        self._stamp = ()
@@ -0,0 +1,322 @@
+# ingest.py
+"""
+Streaming ingestion for build_index.py: sources -> chunks -> embeddings.
+
+Each stage is a generator, so only one batch per stage is alive at a time:
+
+1. `discover_sources` walks data/ (or any directory) for CSV and markdown
+   files. Generated and evaluation folders (index/, eval/, models/) are skipped.
+2. `iter_csv_chunks` reads a CSV `chunk_rows` rows at a time and formats
+   whole columns at once instead of calling `iterrows`. The formatter depends
+   on the columns: the destination schema, the route schema, or a generic
+   "Column: value" layout for any other table (guesthouses, restaurants, ...).
+3. `iter_markdown_chunks` splits a markdown file into "## " sections.
+   `iter_chunks` chains the sources and makes chunk ids unique: the FAISS id
+   is a hash of the chunk id, so two rows whose names slug the same would
+   otherwise share a vector id and a metadata entry.
+4. `encode_batches` encodes text batches in a process pool. At most
+   `max_pending` batches are in flight, so a slow encoder throttles reading
+   instead of queueing the whole corpus in memory.
+
+`IngestStats` collects rows/s, chunks/s and peak RSS for the build report.
+"""
+import os
+import re
+import sys
+import time
+import hashlib
+import resource
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from embedders import create_embedder
+
+CHUNK_ROWS = int(os.environ.get("CEYLONTRIP_INGEST_CHUNK_ROWS", "10000"))
+INGEST_WORKERS = int(os.environ.get("CEYLONTRIP_INGEST_WORKERS", "0"))
+
+SKIP_DIRS = {"index", "eval", "models"}
+
+DESTINATION_COLUMNS = {
+    "name", "region", "types", "best_months", "recommended_days", "highlights", "vibe", "description",
+}
+FACET_COLUMNS = ("region", "types", "best_months")
+ROUTE_COLUMNS = {"from", "to", "transport", "hours_min", "hours_max", "scenic", "notes"}
+# Generic tables: the first of these columns becomes the chunk title and id
+TITLE_COLUMNS = ("name", "title")
+# Title of a markdown file's text before its first "## " section
+INTRO_TITLES = {"tips": "General travel tips"}
+
+
+def slug(text: str) -> str:
+    text = text.lower().strip()
+    text = re.sub(r"[^a-z0-9]+", "_", text)
+    return text.strip("_")
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def vector_id(chunk_id: str) -> int:
+    # Stable, positive int64 FAISS id derived from the chunk id, so a chunk
+    # keeps its vector id across rebuilds and can be removed individually.
+    return int(hashlib.sha1(chunk_id.encode("utf-8")).hexdigest()[:15], 16)
+
+
+def make_chunk(chunk_id: str, source: str, text: str) -> dict:
+    return {
+        "id": chunk_id, "source": source, "text": text,
+        "hash": chunk_hash(text), "vid": vector_id(chunk_id),
+    }
+
+
+# ---------- Sources ----------
+def discover_sources(data_dir: str):
+    """Sorted CSV and markdown paths under `data_dir`."""
+    paths = []
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith("."))
+        paths.extend(
+            os.path.join(root, name) for name in files if name.endswith((".csv", ".md"))
+        )
+    return sorted(paths, key=lambda p: os.path.relpath(p, data_dir))
+
+
+def source_name(path: str) -> str:
+    return slug(os.path.splitext(os.path.basename(path))[0])
+
+
+# ---------- CSV ----------
+def _slugs(column: pd.Series) -> pd.Series:
+    return (
+        column.astype(str).str.lower().str.strip()
+        .str.replace(r"[^a-z0-9]+", "_", regex=True).str.strip("_")
+    )
+
+
+def format_destinations(df: pd.DataFrame):
+    col = lambda name: df[name].astype(str)  # noqa: E731
+    texts = (
+        "[DESTINATION] " + col("name")
+        + "\nRegion: " + col("region")
+        + "\nTypes: " + col("types")
+        + "\nBest months: " + col("best_months")
+        + "\nRecommended days: " + col("recommended_days")
+        + "\nHighlights: " + col("highlights")
+        + "\nVibe: " + col("vibe")
+        + "\nDetails: " + col("description")
+    )
+    return "destinations", "dest_" + _slugs(df["name"]), texts
+
+
+def format_routes(df: pd.DataFrame):
+    col = lambda name: df[name].astype(str)  # noqa: E731
+    texts = (
+        "[ROUTE] " + col("from") + " → " + col("to")
+        + "\nTransport: " + col("transport")
+        + "\nApprox time: " + col("hours_min") + "–" + col("hours_max") + " hours"
+        + "\nScenic: " + col("scenic")
+        + "\nNotes: " + col("notes")
+    )
+    return "routes", "route_" + _slugs(df["from"]) + "_" + _slugs(df["to"]), texts
+
+
+def format_table(df: pd.DataFrame, source: str, row_offset: int):
+    """Any other table: '[SOURCE] title' then one 'Column: value' line per column."""
+    title = next((c for c in df.columns if str(c).lower() in TITLE_COLUMNS), None)
+    texts = pd.Series(f"[{source.upper()}]", index=df.index)
+    if title is not None:
+        texts = texts + " " + df[title].astype(str)
+        ids = f"{source}_" + _slugs(df[title])
+    else:
+        ids = pd.Series(
+            [f"{source}_{row:06d}" for row in range(row_offset, row_offset + len(df))],
+            index=df.index,
+        )
+    for column in df.columns:
+        if column == title:
+            continue
+        label = str(column).replace("_", " ").capitalize()
+        texts = texts + f"\n{label}: " + df[column].astype(str)
+    return source, ids, texts
+
+
+def iter_csv_chunks(path: str, chunk_rows: int = CHUNK_ROWS):
+    """Yield lists of chunk dicts, `chunk_rows` CSV rows at a time."""
+    row_offset = 0
+    for df in pd.read_csv(path, chunksize=chunk_rows):
+        columns = set(df.columns)
+        if DESTINATION_COLUMNS <= columns:
+            source, ids, texts = format_destinations(df)
+        elif ROUTE_COLUMNS <= columns:
+            source, ids, texts = format_routes(df)
+        else:
+            source, ids, texts = format_table(df, source_name(path), row_offset)
+        row_offset += len(df)
+        chunks = [make_chunk(cid, source, text) for cid, text in zip(ids, texts)]
+        if source == "destinations":
+            # Facet columns ride on the chunk, so they follow it through any id suffixing
+            for chunk, row in zip(chunks, df[list(FACET_COLUMNS)].astype(str).to_dict("records")):
+                chunk["facets"] = row
+        yield chunks
+
+
+# ---------- Markdown ----------
+def iter_markdown_chunks(path: str):
+    """Yield one list of section chunks; a markdown file is read whole."""
+    source = source_name(path)
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    # Split by "## " to make sections
+    chunks = []
+    for i, sec in enumerate(content.split("\n## ")):
+        sec = sec.strip()
+        if not sec:
+            continue
+
+        # Re-add "## " to all except possibly first
+        if i == 0:
+            title = INTRO_TITLES.get(source, f"{source.replace('_', ' ').capitalize()} overview")
+            text = sec
+        else:
+            title_line, _, body = sec.partition("\n")
+            title = title_line.strip("# ").strip()
+            text = f"## {title}\n{body}"
+        chunks.append(make_chunk(f"{source}_{i:02d}", source, f"[{source.upper()}] {title}\n{text}"))
+    yield chunks
+
+
+class ChunkIds:
+    """Keeps chunk ids (and the vector ids hashed from them) unique across a build."""
+
+    def __init__(self):
+        self.ids = set()
+        self.vids = {}  # vector id -> chunk id
+        self.ordinals = {}  # repeated id -> last suffix handed out
+        self.renamed = 0
+
+    def claim(self, chunk: dict) -> dict:
+        cid = chunk["id"]
+        if cid in self.ids:
+            # "_2", "_3", ... in source order, so the same data gets the same
+            # ids (and vector ids) on every rebuild
+            base, n = cid, self.ordinals.get(cid, 1)
+            while cid in self.ids:
+                n += 1
+                cid = f"{base}_{n}"
+            self.ordinals[base] = n
+            chunk = {**chunk, "id": cid, "vid": vector_id(cid)}
+            self.renamed += 1
+        other = self.vids.setdefault(chunk["vid"], cid)
+        if other != cid:
+            raise ValueError(f"chunk ids {other!r} and {cid!r} hash to the same vector id")
+        self.ids.add(cid)
+        return chunk
+
+
+def iter_chunks(data_dir: str, chunk_rows: int = CHUNK_ROWS, stats=None):
+    """Chunk batches from every source under `data_dir`, in a stable order, with unique ids."""
+    ids = ChunkIds()
+    for path in discover_sources(data_dir):
+        if stats is not None:
+            stats.files += 1
+        batches = iter_csv_chunks(path, chunk_rows) if path.endswith(".csv") else iter_markdown_chunks(path)
+        for batch in batches:
+            batch = [ids.claim(chunk) for chunk in batch]
+            if stats is not None:
+                stats.chunks += len(batch)
+                stats.renamed_ids = ids.renamed
+            yield batch
+
+
+# ---------- Encoding ----------
+_worker_embedder = None
+
+
+def _init_worker(backend: str):
+    global _worker_embedder
+    _worker_embedder = create_embedder(backend).load()
+
+
+def _encode_in_worker(texts, batch_size: int):
+    return _worker_embedder.encode(texts, batch_size=batch_size)
+
+
+def encode_batches(embedder, text_batches, workers: int = INGEST_WORKERS,
+                   max_pending: int = None, batch_size: int = 64):
+    """
+    Yield one float32 array per batch of texts, in input order. With
+    `workers` > 0 the batches are encoded in that many processes (each loads
+    its own copy of the model), with at most `max_pending` batches queued.
+    """
+    if workers <= 0:
+        embedder.load()
+        for texts in text_batches:
+            yield embedder.encode(texts, batch_size=batch_size)
+        return
+
+    max_pending = max_pending or workers * 2
+    # spawn, not fork: torch and onnxruntime thread pools don't survive fork
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        workers, mp_context=context, initializer=_init_worker, initargs=(embedder.backend,)
+    ) as pool:
+        pending = deque()
+        for texts in text_batches:
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+            pending.append(pool.submit(_encode_in_worker, texts, batch_size))
+        while pending:
+            yield pending.popleft().result()
+
+
+# ---------- Reporting ----------
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class IngestStats:
+    """Counters and stage timings for the end-of-build report."""
+
+    def __init__(self):
+        self.workers = 0
+        self.files = 0
+        self.chunks = 0
+        self.renamed_ids = 0
+        self.encoded = 0
+        self.read_s = 0.0
+        self.encode_s = 0.0
+        self.index_s = 0.0
+
+    def report(self) -> str:
+        rows_per_s = self.chunks / self.read_s if self.read_s else 0.0
+        encoded_per_s = self.encoded / self.encode_s if self.encode_s else 0.0
+        workers_rss = peak_rss_mb(resource.RUSAGE_CHILDREN) if self.workers > 0 else 0.0
+        return (
+            f"Ingest: {self.chunks} chunks from {self.files} files "
+            f"({rows_per_s:,.0f} rows/s), encoded {self.encoded} "
+            f"({encoded_per_s:,.0f} chunks/s), index fill {self.index_s:.2f}s, "
+            f"peak RSS {peak_rss_mb():.0f} MB"
+            + (f" (largest encoder worker {workers_rss:.0f} MB)" if workers_rss else "")
+            + (f", {self.renamed_ids} duplicate chunk ids suffixed" if self.renamed_ids else "")
+        )
+
+
+class Timer:
+    """`with Timer(stats, "read_s"):` adds the elapsed seconds to that field."""
+
+    def __init__(self, stats, field: str):
+        self.stats, self.field = stats, field
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        setattr(self.stats, self.field, getattr(self.stats, self.field) + time.perf_counter() - self.start)
@@ -0,0 +1,181 @@
+# intent_router.py
+"""
+Embedding-based intent router that runs before retrieval and the LLM.
+
+`is_small_talk` only knows exact phrases, so "thanks a lot!" or "hi there"
+used to go through retrieval and a full LLM call. Questions about other
+countries also cost a whole generation just to get a refusal. The router
+compares the query vector the engine already computes with a few prototype
+phrases per intent:
+
+- small_talk: greetings, thanks, goodbyes, acknowledgements -> canned reply
+- off_topic:  other countries, non-travel requests           -> canned refusal
+- travel:     in-scope Sri Lanka travel questions            -> normal RAG turn
+
+A query is only routed away from RAG when its best small-talk / off-topic
+prototype clears that intent's threshold AND beats the best travel
+prototype by `MARGIN`. Queries naming Sri Lanka are never refused.
+
+build_index.py embeds the prototypes with the index's embedder and saves
+them to intents.npz next to faiss.index; without that file the engine
+skips routing. `IntentStats` counts how many LLM calls routing avoided.
+"""
+import os
+import re
+import threading
+
+import numpy as np
+
+ROUTER_ENABLED = os.environ.get("CEYLONTRIP_INTENT_ROUTER", "1") == "1"
+SMALL_TALK_THRESHOLD = float(os.environ.get("CEYLONTRIP_INTENT_SMALL_TALK", "0.75"))
+OFF_TOPIC_THRESHOLD = float(os.environ.get("CEYLONTRIP_INTENT_OFF_TOPIC", "0.60"))
+# Required lead of the best routed prototype over the best travel prototype
+MARGIN = float(os.environ.get("CEYLONTRIP_INTENT_MARGIN", "0.05"))
+
+ROUTED_INTENTS = ("small_talk", "off_topic")
+
+# (intent, reply key in engine.REPLIES, phrase)
+PROTOTYPES = [
+    ("small_talk", "hello", "hi"),
+    ("small_talk", "hello", "hi there"),
+    ("small_talk", "hello", "hello!"),
+    ("small_talk", "hello", "hey, how are you?"),
+    ("small_talk", "hello", "good morning"),
+    ("small_talk", "hello", "good evening"),
+    ("small_talk", "hello", "ayubowan"),
+    ("small_talk", "thanks", "thanks"),
+    ("small_talk", "thanks", "thanks a lot!"),
+    ("small_talk", "thanks", "thank you so much"),
+    ("small_talk", "thanks", "many thanks, that helps"),
+    ("small_talk", "thanks", "cheers, appreciate it"),
+    ("small_talk", "bye", "bye"),
+    ("small_talk", "bye", "goodbye, see you later"),
+    ("small_talk", "bye", "that's all for now, bye"),
+    ("small_talk", "bye", "have a nice day"),
+    ("small_talk", "default", "ok"),
+    ("small_talk", "default", "okay cool"),
+    ("small_talk", "default", "great, nice"),
+    ("small_talk", "default", "awesome, well done"),
+    ("small_talk", "default", "got it"),
+    ("small_talk", "default", "sounds good"),
+    ("off_topic", "off_topic", "What are the best beaches in Thailand?"),
+    ("off_topic", "off_topic", "How do I get a visa for India?"),
+    ("off_topic", "off_topic", "Recommend a hotel in Bali"),
+    ("off_topic", "off_topic", "Plan a week in the Maldives"),
+    ("off_topic", "off_topic", "Things to do in Vietnam in March"),
+    ("off_topic", "off_topic", "Best time to visit Japan"),
+    ("off_topic", "off_topic", "Train from Delhi to Agra"),
+    ("off_topic", "off_topic", "What is the capital of France?"),
+    ("off_topic", "off_topic", "Write me a Python function"),
+    ("off_topic", "off_topic", "Who won the football world cup?"),
+    ("off_topic", "off_topic", "What's the stock price of Apple?"),
+    ("off_topic", "off_topic", "Give me a recipe for chocolate cake"),
+    ("travel", "", "Best beaches in Sri Lanka"),
+    ("travel", "", "Where should I surf in July?"),
+    ("travel", "", "How do I get from Kandy to Ella by train?"),
+    ("travel", "", "Plan a 7 day trip with nature and beaches"),
+    ("travel", "", "Best time to visit the hill country"),
+    ("travel", "", "Where can I see leopards and elephants?"),
+    ("travel", "", "Is Sigiriya worth visiting?"),
+    ("travel", "", "What should I pack for a trip to Sri Lanka?"),
+    ("travel", "", "Do I need a visa for Sri Lanka?"),
+    ("travel", "", "How many days do I need for the cultural triangle?"),
+    ("travel", "", "Quiet east coast beaches in August"),
+    ("travel", "", "Is Sri Lanka better than Thailand for a beach holiday?"),
+]
+
+# Never refuse a question that names the country we cover
+_IN_SCOPE = re.compile(r"\b(sri\s*lanka\w*|lankan|ceylon)\b", re.IGNORECASE)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+
+
+# ---------- Build ----------
+def build_intents(embedder, prototypes=PROTOTYPES) -> dict:
+    """Prototype vectors and labels, embedded with the index's `embedder`."""
+    intents, replies, phrases = zip(*prototypes)
+    vectors = _normalize(np.asarray(embedder.encode(list(phrases)), dtype="float32"))
+    return {
+        "vectors": vectors,
+        "intents": np.array(intents),
+        "replies": np.array(replies),
+        "phrases": np.array(phrases),
+    }
+
+
+def save_intents(data: dict, path: str):
+    np.savez(path, **data)
+
+
+# ---------- Routing ----------
+class IntentRouter:
+    def __init__(self, data):
+        self.vectors = np.ascontiguousarray(data["vectors"], dtype="float32")
+        self.intents = data["intents"].astype(str)
+        self.replies = data["replies"].astype(str)
+        self.phrases = data["phrases"].astype(str)
+        self._rows = {intent: np.flatnonzero(self.intents == intent) for intent in set(self.intents)}
+        self.thresholds = {"small_talk": SMALL_TALK_THRESHOLD, "off_topic": OFF_TOPIC_THRESHOLD}
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls({k: data[k] for k in data.files})
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def route_batch(self, queries, q_vecs: np.ndarray):
+        """
+        One (intent, reply_key, score) per query for small talk / off-topic,
+        or None when the query should go through RAG. `q_vecs` are the
+        normalized query embeddings.
+        """
+        sims = np.asarray(q_vecs, dtype="float32") @ self.vectors.T
+        travel_rows = self._rows.get("travel")
+        out = []
+        for query, row in zip(queries, sims):
+            travel = float(row[travel_rows].max()) if travel_rows is not None else -1.0
+            route = None
+            for intent in ROUTED_INTENTS:
+                rows = self._rows.get(intent)
+                if rows is None or (intent == "off_topic" and _IN_SCOPE.search(query)):
+                    continue
+                best = int(rows[row[rows].argmax()])
+                score = float(row[best])
+                if score >= self.thresholds[intent] and score - travel >= MARGIN:
+                    if route is None or score > route[2]:
+                        route = (intent, str(self.replies[best]), score)
+            out.append(route)
+        return out
+
+    def route(self, query: str, q_vec: np.ndarray):
+        return self.route_batch([query], np.asarray(q_vec).reshape(1, -1))[0]
+
+
+class IntentStats:
+    """Turns routed away from the LLM, shared across threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.routed = {intent: 0 for intent in ROUTED_INTENTS}
+
+    def record(self, intent: str = None):
+        with self._lock:
+            self.turns += 1
+            if intent is not None:
+                self.routed[intent] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            avoided = sum(self.routed.values())
+            return {
+                "turns": self.turns,
+                **self.routed,
+                "llm_avoided": avoided,
+                "llm_avoided_frac": avoided / self.turns if self.turns else 0.0,
+            }
@@ -0,0 +1,119 @@
+# lexical.py
+"""
+BM25 inverted index built next to the FAISS index, plus reciprocal rank
+fusion (RRF) to merge lexical and dense rankings.
+
+Dense MiniLM embeddings are weak on exact names ("Hiriketiya", "Sri Pada",
+"CMB airport"); BM25 scores those tokens directly. The saved index is a
+compact JSON file: token -> postings of [doc, term frequency], where doc is
+a position in `doc_ids` (the FAISS vector ids of the chunks).
+"""
+import os
+import re
+import json
+import math
+import unicodedata
+from collections import Counter, defaultdict
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Fusion weights for retrieve(); 0 disables a retriever.
+DENSE_WEIGHT = float(os.environ.get("CEYLONTRIP_DENSE_WEIGHT", "1.0"))
+LEXICAL_WEIGHT = float(os.environ.get("CEYLONTRIP_LEXICAL_WEIGHT", "1.0"))
+RRF_K = int(os.environ.get("CEYLONTRIP_RRF_K", "60"))
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "best", "by", "can", "do", "for",
+    "from", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "should",
+    "the", "to", "what", "when", "where", "which", "with", "you",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str):
+    # Fold accents/curly quotes so "Adam’s" and "Adams" meet in the middle
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.replace("’", "").replace("'", "")
+    return [t for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+def build_bm25(corpus) -> dict:
+    """Build the serializable BM25 index over chunks that carry a `vid`."""
+    postings = defaultdict(list)
+    doc_len = []
+    for doc, chunk in enumerate(corpus):
+        tokens = tokenize(chunk["text"])
+        doc_len.append(len(tokens))
+        for token, tf in Counter(tokens).items():
+            postings[token].append([doc, tf])
+
+    return {
+        "k1": BM25_K1,
+        "b": BM25_B,
+        "doc_ids": [c["vid"] for c in corpus],
+        "doc_len": doc_len,
+        "postings": dict(postings),
+    }
+
+
+def save_bm25(data: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+class BM25Index:
+    def __init__(self, data: dict):
+        self.k1 = data["k1"]
+        self.b = data["b"]
+        self.doc_ids = data["doc_ids"]
+        self.doc_len = data["doc_len"]
+        self.postings = data["postings"]
+
+        n = len(self.doc_ids)
+        self.avgdl = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {
+            token: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for token, plist in self.postings.items()
+        }
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def search(self, query: str, top_k: int = 10, allowed=None):
+        """
+        Return [(vector_id, score)] best first, optionally restricted to the
+        vector ids in the set `allowed`.
+        """
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            plist = self.postings.get(token)
+            if not plist:
+                continue
+            idf = self.idf[token]
+            for doc, tf in plist:
+                norm = 1 - self.b + self.b * self.doc_len[doc] / (self.avgdl or 1.0)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        if allowed is not None:
+            scores = {d: v for d, v in scores.items() if self.doc_ids[d] in allowed}
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+        return [(self.doc_ids[doc], score) for doc, score in ranked]
+
+
+def rrf_fuse(rankings, weights, k: int = RRF_K):
+    """
+    Reciprocal rank fusion: score(d) = sum_i w_i / (k + rank_i(d)).
+    `rankings` is a list of id lists (best first); returns ids best first.
+    """
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        if weight <= 0:
+            continue
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += weight / (k + rank)
+    return [doc_id for doc_id, _ in sorted(scores.items(), key=lambda kv: kv[1], reverse=True)]
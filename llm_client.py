@@ -0,0 +1,384 @@
+# llm_client.py
+"""
+HTTP client layer for the Ollama chat backend.
+
+`OllamaClient` keeps one keep-alive `requests.Session` per process, uses
+separate connect/read timeouts and retries connection failures and 5xx
+responses with jittered exponential backoff. `AsyncOllamaClient` is the
+asyncio twin (aiohttp) for callers that share one client across tasks.
+
+Every request carries `keep_alive` so Ollama keeps the model loaded between
+questions; `warm_up` loads it (and can prime the KV cache with the static
+prompt prefix) before the first user arrives, and `start_heartbeat` keeps
+it resident through idle periods longer than `keep_alive`.
+
+With OLLAMA_ENDPOINTS set, `create_client` / `create_async_client` return a
+pool over several hosts instead (llm_pool.py) with the same interface.
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import record_llm
+
+# ---------- Config ----------
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+# Several hosts: "url[|model[|max_in_flight]],..." (see llm_pool.py).
+# Overrides OLLAMA_URL when set.
+OLLAMA_ENDPOINTS = os.environ.get("OLLAMA_ENDPOINTS", "")
+
+# IMPORTANT: set this to the model you actually pulled.
+# e.g. "llama3.2:1b" or "llama3.1:3b"
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2:1b")
+
+CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "300"))
+MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "2"))
+POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "16"))
+# How long Ollama keeps the model loaded after each request ("30m", "1h",
+# "-1" = forever). Sent with every request, warm-up and heartbeat.
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Idle seconds after which a heartbeat re-sends keep_alive (0 = off)
+HEARTBEAT_S = float(os.environ.get("OLLAMA_HEARTBEAT_S", "0"))
+
+# Statuses worth a second try: the server is restarting or overloaded.
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+def backoff_delay(attempt: int, base: float = 0.25, cap: float = 4.0) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def extract_content(data: dict) -> str:
+    # Default Ollama chat format
+    if "message" in data and "content" in data["message"]:
+        return data["message"]["content"]
+    return data.get("content") or data.get("response") or str(data)
+
+
+def parse_stream_line(line):
+    """Decode one NDJSON line; returns (piece, done). The final line's stats go to metrics."""
+    data = json.loads(line)
+    if "error" in data:
+        raise RuntimeError(data["error"])
+    piece = data.get("message", {}).get("content", "")
+    done = bool(data.get("done"))
+    if done:
+        record_llm(data)
+    return piece, done
+
+
+# ---------- Sync client ----------
+class OllamaClient:
+    def __init__(
+        self,
+        base_url: str = OLLAMA_URL,
+        model: str = OLLAMA_MODEL,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        pool_size: int = POOL_SIZE,
+        keep_alive: str = KEEP_ALIVE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.keep_alive = keep_alive
+        self.last_request = 0.0
+        self._heartbeat = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _payload(self, messages, stream: bool, options: dict = None):
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+        }
+        if options:
+            payload.update(options)
+        return payload
+
+    def _post(self, payload: dict, stream: bool = False):
+        """
+        POST to /api/chat, retrying connection errors and 5xx responses.
+        Only the request itself is retried: once a streamed body has started,
+        errors propagate so we never emit duplicated text.
+        """
+        url = f"{self.base_url}/api/chat"
+        self.last_request = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                resp = self.session.post(
+                    url, json=payload, stream=stream, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.ConnectTimeout):
+                if last:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            if resp.status_code in RETRY_STATUSES and not last:
+                resp.close()
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            resp.raise_for_status()
+            return resp
+
+    def chat(self, messages, **options) -> str:
+        resp = self._post(self._payload(messages, False, options))
+        data = resp.json()
+        record_llm(data)
+        return extract_content(data)
+
+    def chat_stream(self, messages, **options):
+        """Yield reply text pieces as Ollama produces them (NDJSON stream)."""
+        resp = self._post(self._payload(messages, True, options), stream=True)
+        with resp:
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                piece, done = parse_stream_line(line)
+                if piece:
+                    yield piece
+                if done:
+                    break
+
+    def warm_up(self, prime_messages=None) -> float:
+        """
+        Load the model into memory and return the seconds it took. With
+        `prime_messages` (e.g. the system prompt and a stub question) one
+        token is generated so the prompt prefix is already in the KV cache.
+        """
+        start = time.perf_counter()
+        if prime_messages:
+            self._post(self._payload(prime_messages, False, {"options": {"num_predict": 1}})).close()
+        else:
+            # An empty message list only loads the model
+            self._post(self._payload([], False)).close()
+        return time.perf_counter() - start
+
+    def unload(self):
+        """Ask Ollama to evict the model now (keep_alive 0), e.g. to measure cold starts."""
+        payload = {"model": self.model, "messages": [], "stream": False, "keep_alive": 0}
+        self._post(payload).close()
+
+    def ping(self) -> bool:
+        """True when the server answers GET / ("Ollama is running")."""
+        try:
+            with self.session.get(f"{self.base_url}/", timeout=self.timeout[0]) as resp:
+                return resp.ok
+        except requests.RequestException:
+            return False
+
+    def start_heartbeat(self, interval_s: float = HEARTBEAT_S):
+        """
+        Daemon thread that re-loads the model whenever no request was sent
+        for `interval_s` seconds, so the next question never pays a cold load.
+        """
+        if interval_s <= 0 or self._heartbeat is not None:
+            return self._heartbeat
+
+        def beat():
+            while True:
+                idle = time.monotonic() - self.last_request
+                if idle >= interval_s:
+                    try:
+                        self.warm_up()
+                    except requests.RequestException:
+                        pass  # Ollama down: try again next interval
+                    idle = 0.0
+                time.sleep(interval_s - idle)
+
+        self._heartbeat = threading.Thread(target=beat, name="ollama-heartbeat", daemon=True)
+        self._heartbeat.start()
+        return self._heartbeat
+
+    def close(self):
+        self.session.close()
+
+
+# ---------- Async client ----------
+class AsyncOllamaClient:
+    """
+    asyncio variant built on aiohttp. One instance (and its connection pool)
+    is meant to be shared by all tasks on an event loop.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_URL,
+        model: str = OLLAMA_MODEL,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        pool_size: int = POOL_SIZE,
+        keep_alive: str = KEEP_ALIVE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.last_request = 0.0
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self._session = None
+
+    def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            timeout = aiohttp.ClientTimeout(
+                connect=self.connect_timeout, sock_read=self.read_timeout
+            )
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(
+                timeout=timeout, connector=connector
+            )
+        return self._session
+
+    async def _post(self, payload: dict):
+        import aiohttp
+
+        session = self._get_session()
+        url = f"{self.base_url}/api/chat"
+        self.last_request = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                resp = await session.post(url, json=payload)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if last:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            if resp.status in RETRY_STATUSES and not last:
+                resp.release()
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            resp.raise_for_status()
+            return resp
+
+    def _payload(self, messages, stream: bool, options: dict = None):
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+        }
+        if options:
+            payload.update(options)
+        return payload
+
+    async def chat(self, messages, **options) -> str:
+        payload = self._payload(messages, False, options)
+        resp = await self._post(payload)
+        async with resp:
+            data = await resp.json(content_type=None)
+        record_llm(data)
+        return extract_content(data)
+
+    async def chat_stream(self, messages, **options):
+        payload = self._payload(messages, True, options)
+        resp = await self._post(payload)
+        async with resp:
+            async for line in resp.content:
+                line = line.strip()
+                if not line:
+                    continue
+                piece, done = parse_stream_line(line)
+                if piece:
+                    yield piece
+                if done:
+                    break
+
+    async def warm_up(self, prime_messages=None) -> float:
+        """See `OllamaClient.warm_up`."""
+        start = time.perf_counter()
+        if prime_messages:
+            payload = self._payload(prime_messages, False, {"options": {"num_predict": 1}})
+        else:
+            payload = self._payload([], False)
+        resp = await self._post(payload)
+        resp.release()
+        return time.perf_counter() - start
+
+    async def ping(self) -> bool:
+        """See `OllamaClient.ping`."""
+        import aiohttp
+
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.connect_timeout)
+            async with self._get_session().get(f"{self.base_url}/", timeout=timeout) as resp:
+                return resp.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+# ---------- Shared process-wide client ----------
+_client = None
+_client_lock = threading.Lock()
+
+
+def create_client():
+    """An `LLMPool` over OLLAMA_ENDPOINTS when set, else an `OllamaClient` for OLLAMA_URL."""
+    if OLLAMA_ENDPOINTS:
+        from llm_pool import LLMPool
+
+        return LLMPool.from_spec(OLLAMA_ENDPOINTS)
+    return OllamaClient()
+
+
+def create_async_client():
+    """Async twin of `create_client`."""
+    if OLLAMA_ENDPOINTS:
+        from llm_pool import AsyncLLMPool
+
+        return AsyncLLMPool.from_spec(OLLAMA_ENDPOINTS)
+    return AsyncOllamaClient()
+
+
+def get_client() -> OllamaClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+    return _client
+
+
+def set_client(client):
+    """
+    Replace the process-wide client, e.g. with a stand-in for benchmarks.
+    Anything with `model`, `chat(messages)` and `chat_stream(messages)` works.
+    """
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,612 @@
+# llm_pool.py
+"""
+Several Ollama hosts behind one client.
+
+OLLAMA_ENDPOINTS lists the backends, comma-separated, each as
+`url[|model[|max_in_flight]]` (model defaults to OLLAMA_MODEL, the limit to
+OLLAMA_ENDPOINT_MAX_IN_FLIGHT):
+
+    OLLAMA_ENDPOINTS="http://gpu1:11434|llama3.1:8b|4,http://cpu1:11434|llama3.2:1b|1"
+
+`LLMPool` (and `AsyncLLMPool` for server.py) has the same interface as
+`OllamaClient`, so the engine doesn't know whether it talks to one host or
+several. For every request:
+
+- Routing: the healthy endpoint with the fewest requests in flight gets it
+  (ties go to the one used least recently). An endpoint never has
+  more than its `max_in_flight` requests; when all are full, callers wait.
+- Failover: a request that fails before any text arrived is retried on
+  another endpoint. Once text has been returned, errors propagate, as in
+  `OllamaClient._post`.
+- Ejection: after OLLAMA_EJECT_AFTER consecutive failures an endpoint gets
+  no traffic for at least OLLAMA_EJECT_S (doubling on each ejection, up to
+  OLLAMA_EJECT_MAX_S). Then it is probed with GET / every OLLAMA_PROBE_S
+  and re-admitted once it answers. If every endpoint is ejected, they are
+  tried anyway.
+- Hedging (OLLAMA_HEDGE=1): when the first piece of text (the whole reply
+  without streaming) hasn't arrived after the endpoint's p95 for it, the
+  request is also sent to a second, idle endpoint. The first answer wins
+  and the other call is dropped.
+
+`stats()` gives per-endpoint load, errors, ejections and latency
+percentiles. The same numbers go to /metrics as
+`ceylontrip_llm_endpoint_requests_total` and `ceylontrip_llm_endpoint_seconds`.
+"""
+import os
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+
+import metrics
+from metrics import Histogram, SECONDS_BUCKETS
+from llm_client import (
+    OLLAMA_MODEL, MAX_RETRIES, HEARTBEAT_S, OllamaClient, AsyncOllamaClient, backoff_delay,
+)
+
+# ---------- Config ----------
+ENDPOINT_MAX_IN_FLIGHT = int(os.environ.get("OLLAMA_ENDPOINT_MAX_IN_FLIGHT", "4"))
+# Seconds a caller may wait for a free endpoint slot
+POOL_WAIT_S = float(os.environ.get("OLLAMA_POOL_WAIT_S", "60"))
+EJECT_AFTER = int(os.environ.get("OLLAMA_EJECT_AFTER", "3"))
+EJECT_S = float(os.environ.get("OLLAMA_EJECT_S", "10"))
+EJECT_MAX_S = float(os.environ.get("OLLAMA_EJECT_MAX_S", "120"))
+PROBE_S = float(os.environ.get("OLLAMA_PROBE_S", "2"))
+HEDGE = os.environ.get("OLLAMA_HEDGE", "0") == "1"
+# Never hedge sooner than this, and only once the p95 rests on enough samples
+HEDGE_MIN_S = float(os.environ.get("OLLAMA_HEDGE_MIN_S", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("OLLAMA_HEDGE_MIN_SAMPLES", "20"))
+
+_END = object()  # a stream that ended without any text
+
+
+class NoEndpointAvailable(RuntimeError):
+    """Every endpoint stayed at its in-flight limit for the whole wait."""
+
+
+def parse_endpoints(spec: str, model: str = OLLAMA_MODEL, max_in_flight: int = ENDPOINT_MAX_IN_FLIGHT):
+    """'url|model|4,url2' -> [(url, model, 4), (url2, default model, default limit)]"""
+    endpoints = []
+    for part in spec.split(","):
+        fields = [f.strip() for f in part.strip().split("|")]
+        if not fields[0]:
+            continue
+        endpoints.append((
+            fields[0],
+            fields[1] if len(fields) > 1 and fields[1] else model,
+            int(fields[2]) if len(fields) > 2 and fields[2] else max_in_flight,
+        ))
+    if not endpoints:
+        raise ValueError(f"no endpoints in {spec!r}")
+    return endpoints
+
+
+# ---------- Endpoints ----------
+class Endpoint:
+    """One backend host: its client, in-flight limit, health and latency counters."""
+
+    def __init__(self, client, max_in_flight: int):
+        self.client = client
+        self.name = client.base_url.split("://")[-1]
+        self.max_in_flight = max(1, max_in_flight)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.ejections = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.eject_s = EJECT_S
+        self.last_used = 0.0
+        self.latency = {"ttft": Histogram(SECONDS_BUCKETS), "reply": Histogram(SECONDS_BUCKETS)}
+
+    def ejected(self, now: float) -> bool:
+        # Past the timer, it still waits for a successful probe
+        return self.ejected_until > 0 and (now < self.ejected_until or PROBE_S > 0)
+
+    def due_for_probe(self, now: float) -> bool:
+        return self.ejected_until > 0 and now >= self.ejected_until
+
+    def succeeded(self, kind: str, seconds: float):
+        self.consecutive_failures = 0
+        self.eject_s = EJECT_S
+        self.ejected_until = 0.0
+        self.latency[kind].observe(seconds)
+        if metrics.ENABLED:
+            metrics.registry.count_endpoint(self.name, "ok")
+            metrics.registry.observe(metrics.registry.endpoint_seconds, seconds, (self.name, kind))
+
+    def failed(self, now: float) -> bool:
+        """Count a failure; True when it got the endpoint ejected."""
+        self.errors += 1
+        self.consecutive_failures += 1
+        if metrics.ENABLED:
+            metrics.registry.count_endpoint(self.name, "error")
+        if self.consecutive_failures < EJECT_AFTER or self.ejected(now):
+            return False
+        self.ejected_until = now + self.eject_s
+        self.eject_s = min(self.eject_s * 2, EJECT_MAX_S)
+        self.ejections += 1
+        return True
+
+    def readmit(self):
+        # One more failure ejects it again, for twice as long
+        self.ejected_until = 0.0
+        self.consecutive_failures = EJECT_AFTER - 1
+
+    def hedge_delay(self, kind: str):
+        """Seconds after which to hedge a request on this endpoint, or None (too few samples)."""
+        h = self.latency[kind]
+        if h.count < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_S, h.quantile(0.95))
+
+    def stats(self, now: float) -> dict:
+        out = {
+            "endpoint": self.name,
+            "model": self.client.model,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "healthy": not self.ejected(now),
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.errors / self.requests if self.requests else 0.0,
+            "hedges": self.hedges,
+            "ejections": self.ejections,
+        }
+        for kind, h in self.latency.items():
+            if h.count:
+                out[f"{kind}_p50_ms"] = h.quantile(0.5) * 1000
+                out[f"{kind}_p95_ms"] = h.quantile(0.95) * 1000
+        return out
+
+
+class _PoolBase:
+    """Endpoint selection and stats shared by the sync and async pools."""
+
+    client_class = None
+
+    def __init__(self, endpoints, hedge: bool = HEDGE, max_retries: int = MAX_RETRIES, **client_options):
+        # Retries move to another endpoint, so each client fails fast
+        self.endpoints = [
+            Endpoint(self.client_class(url, model, max_retries=0, **client_options), limit)
+            for url, model, limit in endpoints
+        ]
+        self.hedge = hedge and len(self.endpoints) > 1
+        self.attempts = max_retries + 1
+        self.hedged = 0
+        self.hedge_wins = 0
+        # Namespaces the answer cache like a single client's model name
+        self.model = "+".join(sorted({e.client.model for e in self.endpoints}))
+
+    @classmethod
+    def from_spec(cls, spec: str, **options):
+        return cls(parse_endpoints(spec), **options)
+
+    @property
+    def last_request(self) -> float:
+        return max(e.client.last_request for e in self.endpoints)
+
+    def _choose(self, exclude):
+        """Least-loaded endpoint with a free slot (caller holds the lock); None = wait."""
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude]
+        if not candidates:
+            raise NoEndpointAvailable("no endpoint left to try")
+        # Fail open: with every endpoint ejected, try the one back soonest
+        pool = [e for e in candidates if not e.ejected(now)] or candidates
+        free = [e for e in pool if e.in_flight < e.max_in_flight]
+        if not free:
+            return None
+        endpoint = min(free, key=lambda e: (e.in_flight, e.ejected_until, e.last_used))
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        endpoint.last_used = now
+        return endpoint
+
+    def _next_exclude(self, tried):
+        # Every endpoint failed once: start over rather than give up early
+        return tried if len(tried) < len(self.endpoints) else set()
+
+    def _due_for_probe(self):
+        now = time.monotonic()
+        return [e for e in self.endpoints if e.due_for_probe(now)]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "endpoints": [e.stats(now) for e in self.endpoints],
+            "hedge": self.hedge,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+# ---------- Sync pool ----------
+class LLMPool(_PoolBase):
+    """Thread-safe pool of `OllamaClient`s; a drop-in for `OllamaClient`."""
+
+    client_class = OllamaClient
+
+    def __init__(self, endpoints, **options):
+        super().__init__(endpoints, **options)
+        self._cond = threading.Condition()
+        self._prober = None
+
+    def _acquire(self, exclude, timeout: float = POOL_WAIT_S):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                endpoint = self._choose(exclude)
+                if endpoint is not None:
+                    return endpoint
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if timeout > 0:
+                        raise NoEndpointAvailable(f"all LLM endpoints busy for {timeout:g}s")
+                    return None
+                self._cond.wait(remaining)
+
+    def _release(self, endpoint, error: bool = False):
+        with self._cond:
+            endpoint.in_flight -= 1
+            if error and endpoint.failed(time.monotonic()):
+                self._start_prober()
+            self._cond.notify_all()
+
+    @staticmethod
+    def _call(endpoint, messages, options, stream: bool):
+        if stream:
+            yield from endpoint.client.chat_stream(messages, **options)
+        else:
+            yield endpoint.client.chat(messages, **options)
+
+    def _first(self, endpoint, messages, options, stream: bool):
+        """Send the request; returns (iterator, first piece) or raises."""
+        start = time.perf_counter()
+        it = self._call(endpoint, messages, options, stream)
+        first = next(it, _END)
+        with self._cond:
+            endpoint.succeeded("ttft" if stream else "reply", time.perf_counter() - start)
+        return it, first
+
+    def _start(self, messages, options, stream: bool, tried):
+        """(endpoint, iterator, first piece) from the first endpoint to answer."""
+        endpoint = self._acquire(tried)
+        tried.add(endpoint)
+        delay = endpoint.hedge_delay("ttft" if stream else "reply") if self.hedge else None
+        if delay is None:
+            try:
+                return (endpoint, *self._first(endpoint, messages, options, stream))
+            except Exception:
+                self._release(endpoint, error=True)
+                raise
+        return self._race(endpoint, delay, messages, options, stream, tried)
+
+    def _race(self, endpoint, delay, messages, options, stream, tried):
+        """Run on `endpoint`, and after `delay` also on an idle second endpoint."""
+        results = queue.Queue()
+        lock = threading.Lock()
+        state = {"winner": None}
+
+        def attempt(ep):
+            try:
+                it, first = self._first(ep, messages, options, stream)
+            except Exception as e:
+                self._release(ep, error=True)
+                results.put((ep, None, None, e))
+                return
+            with lock:
+                won = state["winner"] is None
+                if won:
+                    state["winner"] = ep
+            if won:
+                results.put((ep, it, first, None))
+                return
+            # The other call answered first: drop this one
+            it.close()
+            self._release(ep)
+            if metrics.ENABLED:
+                metrics.registry.count_endpoint(ep.name, "hedge_lost")
+
+        def launch(ep):
+            # Copy the context so record_llm reports to the caller's trace
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(attempt, ep), daemon=True).start()
+
+        launch(endpoint)
+        running = 1
+        try:
+            result = results.get(timeout=delay)
+        except queue.Empty:
+            result = None
+            backup = self._acquire(tried, timeout=0)
+            if backup is not None:
+                tried.add(backup)
+                with self._cond:
+                    backup.hedges += 1
+                    self.hedged += 1
+                launch(backup)
+                running += 1
+        error = None
+        while True:
+            if result is None:
+                result = results.get()
+            ep, it, first, error = result
+            running -= 1
+            if error is None:
+                if ep is not endpoint:
+                    with self._cond:
+                        self.hedge_wins += 1
+                return ep, it, first
+            if running == 0:
+                raise error
+            result = None
+
+    def _generate(self, messages, options, stream: bool):
+        tried, error = set(), None
+        for attempt in range(self.attempts):
+            try:
+                endpoint, it, first = self._start(messages, options, stream, tried)
+            except NoEndpointAvailable:
+                if error is not None:
+                    raise error
+                raise
+            except Exception as e:
+                error = e
+                tried = self._next_exclude(tried)
+                if not tried:
+                    time.sleep(backoff_delay(attempt))
+                continue
+            failed = False
+            try:
+                if first is not _END:
+                    yield first
+                yield from it
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._release(endpoint, error=failed)
+            return
+        raise error
+
+    def chat(self, messages, **options) -> str:
+        return "".join(self._generate(messages, options, stream=False))
+
+    def chat_stream(self, messages, **options):
+        """Yield reply text pieces from whichever endpoint serves the request."""
+        yield from self._generate(messages, options, stream=True)
+
+    def warm_up(self, prime_messages=None) -> float:
+        """Warm up every healthy endpoint; returns the slowest one's seconds."""
+        seconds, error = [], None
+        for endpoint in self.endpoints:
+            try:
+                seconds.append(endpoint.client.warm_up(prime_messages))
+            except Exception as e:
+                error = e
+        if not seconds and error is not None:
+            raise error
+        return max(seconds, default=0.0)
+
+    def unload(self):
+        for endpoint in self.endpoints:
+            endpoint.client.unload()
+
+    def start_heartbeat(self, interval_s: float = HEARTBEAT_S):
+        # Each client tracks its own idle time
+        return [endpoint.client.start_heartbeat(interval_s) for endpoint in self.endpoints]
+
+    def _start_prober(self):
+        if self._prober is not None or PROBE_S <= 0:
+            return
+
+        def probe():
+            while True:
+                time.sleep(PROBE_S)
+                for endpoint in self._due_for_probe():
+                    if endpoint.client.ping():
+                        with self._cond:
+                            endpoint.readmit()
+                            self._cond.notify_all()
+
+        self._prober = threading.Thread(target=probe, name="ollama-prober", daemon=True)
+        self._prober.start()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return super().stats()
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+
+# ---------- Async pool ----------
+class AsyncLLMPool(_PoolBase):
+    """asyncio variant over `AsyncOllamaClient`s; one instance per event loop."""
+
+    client_class = AsyncOllamaClient
+
+    def __init__(self, endpoints, **options):
+        super().__init__(endpoints, **options)
+        self._cond = None
+        self._prober = None
+
+    def _condition(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def _acquire(self, exclude, timeout: float = POOL_WAIT_S):
+        cond = self._condition()
+        async with cond:
+            if timeout <= 0:
+                return self._choose(exclude)
+            try:
+                return await asyncio.wait_for(
+                    cond.wait_for(lambda: self._choose(exclude)), timeout
+                )
+            except asyncio.TimeoutError:
+                raise NoEndpointAvailable(f"all LLM endpoints busy for {timeout:g}s") from None
+
+    async def _release(self, endpoint, error: bool = False):
+        cond = self._condition()
+        async with cond:
+            endpoint.in_flight -= 1
+            if error and endpoint.failed(time.monotonic()):
+                self._start_prober()
+            cond.notify_all()
+
+    @staticmethod
+    async def _call(endpoint, messages, options, stream: bool):
+        if stream:
+            # Unlike `yield from`, `async for` doesn't close the inner stream
+            pieces = endpoint.client.chat_stream(messages, **options)
+            try:
+                async for piece in pieces:
+                    yield piece
+            finally:
+                await pieces.aclose()
+        else:
+            yield await endpoint.client.chat(messages, **options)
+
+    async def _first(self, endpoint, messages, options, stream: bool):
+        start = time.perf_counter()
+        it = self._call(endpoint, messages, options, stream)
+        try:
+            first = await it.__anext__()
+        except StopAsyncIteration:
+            first = _END
+        except BaseException:
+            await it.aclose()
+            raise
+        endpoint.succeeded("ttft" if stream else "reply", time.perf_counter() - start)
+        return it, first
+
+    async def _start(self, messages, options, stream: bool, tried):
+        endpoint = await self._acquire(tried)
+        tried.add(endpoint)
+        delay = endpoint.hedge_delay("ttft" if stream else "reply") if self.hedge else None
+        if delay is None:
+            try:
+                return (endpoint, *await self._first(endpoint, messages, options, stream))
+            except Exception:
+                await self._release(endpoint, error=True)
+                raise
+        return await self._race(endpoint, delay, messages, options, stream, tried)
+
+    async def _race(self, endpoint, delay, messages, options, stream, tried):
+        """See `LLMPool._race`; here the slower call is cancelled outright."""
+        first_task = asyncio.ensure_future(self._first(endpoint, messages, options, stream))
+        racers = {first_task: endpoint}
+        done, pending = await asyncio.wait({first_task}, timeout=delay)
+        if pending:
+            backup = await self._acquire(tried, timeout=0)
+            if backup is not None:
+                tried.add(backup)
+                backup.hedges += 1
+                self.hedged += 1
+                task = asyncio.ensure_future(self._first(backup, messages, options, stream))
+                racers[task] = backup
+                pending.add(task)
+        error = None
+        try:
+            while True:
+                for task in done:
+                    ep = racers.pop(task)
+                    if task.exception() is None:
+                        if ep is not endpoint:
+                            self.hedge_wins += 1
+                        return (ep, *task.result())
+                    error = task.exception()
+                    await self._release(ep, error=True)
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Losers (or everything, if the caller went away)
+            for task, ep in racers.items():
+                task.cancel()
+                result, = await asyncio.gather(task, return_exceptions=True)
+                if isinstance(result, tuple):
+                    await result[0].aclose()
+                await self._release(ep)
+                if metrics.ENABLED:
+                    metrics.registry.count_endpoint(ep.name, "hedge_lost")
+
+    async def _generate(self, messages, options, stream: bool):
+        tried, error = set(), None
+        for attempt in range(self.attempts):
+            try:
+                endpoint, it, first = await self._start(messages, options, stream, tried)
+            except NoEndpointAvailable:
+                if error is not None:
+                    raise error
+                raise
+            except Exception as e:
+                error = e
+                tried = self._next_exclude(tried)
+                if not tried:
+                    await asyncio.sleep(backoff_delay(attempt))
+                continue
+            failed = False
+            try:
+                if first is not _END:
+                    yield first
+                async for piece in it:
+                    yield piece
+            except Exception:
+                failed = True
+                raise
+            finally:
+                await it.aclose()
+                await self._release(endpoint, error=failed)
+            return
+        raise error
+
+    async def chat(self, messages, **options) -> str:
+        return "".join([piece async for piece in self._generate(messages, options, stream=False)])
+
+    def chat_stream(self, messages, **options):
+        """Async iterator of reply text pieces, like `AsyncOllamaClient.chat_stream`."""
+        return self._generate(messages, options, stream=True)
+
+    async def warm_up(self, prime_messages=None) -> float:
+        """See `LLMPool.warm_up`; endpoints are warmed up concurrently."""
+        results = await asyncio.gather(
+            *(e.client.warm_up(prime_messages) for e in self.endpoints), return_exceptions=True
+        )
+        seconds = [r for r in results if not isinstance(r, BaseException)]
+        if not seconds:
+            raise results[0]
+        return max(seconds)
+
+    def _start_prober(self):
+        if self._prober is not None or PROBE_S <= 0:
+            return
+
+        async def probe():
+            while True:
+                await asyncio.sleep(PROBE_S)
+                for endpoint in self._due_for_probe():
+                    if await endpoint.client.ping():
+                        async with self._condition():
+                            endpoint.readmit()
+                            self._condition().notify_all()
+
+        self._prober = asyncio.get_running_loop().create_task(probe())
+
+    async def close(self):
+        if self._prober is not None:
+            self._prober.cancel()
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,399 @@
+# llm_scheduler.py
+"""
+Admission control between the chat front ends and the LLM backend.
+
+Without it every session calls Ollama at once. Ollama queues internally,
+everyone's latency grows, and users who refresh add more identical
+requests. `LLMScheduler` (threads: CLI, Streamlit, engine) and
+`AsyncLLMScheduler` (server.py) sit in front of the client:
+
+- Concurrency cap: at most `max_concurrency` generations run at a time.
+- Bounded FIFO: further requests wait in arrival order, up to `max_queue`.
+  A request arriving at a full queue fails at once with `SchedulerBusy`
+  (the engine turns that into a "busy, try again" reply). So does one that
+  is still waiting after its deadline (`deadline_s`).
+- Deduplication: a request with the same model, messages and options as
+  one already queued or running joins that generation instead of starting
+  another. It receives every piece from the first one on.
+- Cancellation: when every caller of a generation has gone away (its
+  stream was closed), it leaves the queue or, if running, is stopped at the
+  next token. Generations always stream from the backend, so stopping one
+  closes the connection and Ollama stops generating.
+
+Queue waits are timed as the `llm_queue` stage. /metrics also has
+`ceylontrip_llm_queue_depth`, `ceylontrip_llm_running` and
+`ceylontrip_llm_admissions_total{outcome=...}`.
+"""
+import os
+import time
+import asyncio
+import weakref
+import threading
+import contextlib
+import contextvars
+from collections import deque
+
+import metrics
+from metrics import Histogram, SECONDS_BUCKETS
+from llm_client import get_client
+from response_cache import response_key
+
+# 0 turns the scheduler off (calls go straight to the client)
+MAX_CONCURRENCY = int(os.environ.get("CEYLONTRIP_LLM_MAX_CONCURRENCY", "4"))
+MAX_QUEUE = int(os.environ.get("CEYLONTRIP_LLM_MAX_QUEUE", "32"))
+QUEUE_DEADLINE_S = float(os.environ.get("CEYLONTRIP_LLM_QUEUE_DEADLINE_S", "30"))
+DEDUP = os.environ.get("CEYLONTRIP_LLM_DEDUP", "1") == "1"
+
+OUTCOMES = ("admitted", "queued", "deduplicated", "rejected", "expired", "cancelled")
+
+# Every live scheduler in the process; the gauges below sum over them, and a
+# scheduler that is dropped (replaced, or its event loop closed) falls out
+_live = weakref.WeakSet()
+_live_lock = threading.Lock()
+
+
+def _live_total(value) -> int:
+    with _live_lock:
+        schedulers = list(_live)
+    return sum(value(scheduler) for scheduler in schedulers)
+
+
+metrics.registry.register_gauge(
+    "ceylontrip_llm_queue_depth", "LLM generations waiting for a slot.",
+    lambda: _live_total(lambda scheduler: len(scheduler._queue)),
+)
+metrics.registry.register_gauge(
+    "ceylontrip_llm_running", "LLM generations running.",
+    lambda: _live_total(lambda scheduler: scheduler.running),
+)
+
+
+class SchedulerBusy(RuntimeError):
+    """The LLM queue was full, or the request's deadline passed while it waited."""
+
+
+class _Flight:
+    """One backend generation, shared by every identical request that joined it."""
+
+    def __init__(self, key: str, deadline: float, call):
+        self.key = key
+        self.deadline = deadline
+        # (client, messages, options, contextvars context of the first caller)
+        self.call = call
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.pieces = []
+        self.done = False
+        self.error = None
+        self.subscribers = 1
+        self.cancelled = False
+        self.wakeup = None  # threading.Condition or asyncio.Event, set by the scheduler
+        self.task = None
+
+
+class _SchedulerBase:
+    """Queue bookkeeping shared by both schedulers; callers hold the lock (if any)."""
+
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_queue: int = MAX_QUEUE,
+        deadline_s: float = QUEUE_DEADLINE_S,
+        dedup: bool = DEDUP,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.deadline_s = deadline_s
+        self.dedup = dedup
+        self.running = 0
+        self.counts = {outcome: 0 for outcome in OUTCOMES}
+        self.wait = Histogram(SECONDS_BUCKETS)
+        self._queue = deque()
+        self._flights = {}
+        with _live_lock:
+            _live.add(self)
+
+    def _count(self, outcome: str):
+        self.counts[outcome] += 1
+        if metrics.ENABLED:
+            metrics.registry.count_admission(outcome)
+
+    def _admit(self, key: str, deadline_s: float, call):
+        """(flight, created, start_now) for a request; raises SchedulerBusy when the queue is full."""
+        flight = self._flights.get(key) if self.dedup else None
+        if flight is not None:
+            flight.subscribers += 1
+            self._count("deduplicated")
+            return flight, False, False
+        start = self.running < self.max_concurrency
+        if not start and len(self._queue) >= self.max_queue:
+            self._count("rejected")
+            raise SchedulerBusy(f"LLM queue full ({len(self._queue)} waiting)")
+        flight = _Flight(key, time.monotonic() + deadline_s, call)
+        if self.dedup:
+            self._flights[key] = flight
+        if start:
+            self.running += 1
+            flight.started_at = flight.queued_at
+            self._count("admitted")
+        else:
+            self._queue.append(flight)
+            self._count("queued")
+        return flight, True, start
+
+    def _forget(self, flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def _expire(self, flight):
+        """A queued flight ran out of time."""
+        self._queue.remove(flight)
+        self._forget(flight)
+        flight.done = True
+        waited = flight.deadline - flight.queued_at
+        flight.error = SchedulerBusy(f"waited {waited:g}s for a free LLM slot")
+        self._count("expired")
+
+    def _finish(self, flight):
+        """A running flight ended; returns the queued flights that take its slot."""
+        self._forget(flight)
+        flight.done = True
+        self.running -= 1
+        starts = []
+        now = time.monotonic()
+        while self.running < self.max_concurrency and self._queue:
+            queued = self._queue.popleft()
+            self.running += 1
+            queued.started_at = now
+            starts.append(queued)
+        return starts
+
+    def _leave(self, flight) -> bool:
+        """A caller stopped reading; True when a running flight should be stopped."""
+        flight.subscribers -= 1
+        if flight.subscribers > 0 or flight.done:
+            return False
+        self._forget(flight)
+        self._count("cancelled")
+        if flight.started_at is None:
+            self._queue.remove(flight)
+            flight.done = True
+            return False
+        flight.cancelled = True
+        return True
+
+    def _observe_wait(self, flight) -> float:
+        """Add the flight's queue wait to `wait` (caller holds the lock); returns it."""
+        seconds = flight.started_at - flight.queued_at
+        self.wait.observe(seconds)
+        return seconds
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queue_depth": len(self._queue),
+            **self.counts,
+            "wait_p50_ms": self.wait.quantile(0.5) * 1000,
+            "wait_p95_ms": self.wait.quantile(0.95) * 1000,
+        }
+
+
+# ---------- Threads ----------
+class LLMScheduler(_SchedulerBase):
+    """
+    Thread-safe scheduler with the client interface (`model`, `chat`,
+    `chat_stream`). Uses `llm_client.get_client()` unless given a client.
+    """
+
+    def __init__(self, client=None, **options):
+        super().__init__(**options)
+        self.client = client
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> str:
+        return (self.client or get_client()).model
+
+    def chat(self, messages, deadline_s: float = None, **options) -> str:
+        return "".join(self.chat_stream(messages, deadline_s, **options))
+
+    def chat_stream(self, messages, deadline_s: float = None, **options):
+        """
+        Admit the request and return an iterator over its reply pieces.
+        Raises SchedulerBusy right away when the queue is full; iterating
+        raises it if the deadline passes before a slot frees up.
+        """
+        client = self.client or get_client()
+        key = response_key(client.model, messages, options)
+        call = (client, messages, options, contextvars.copy_context())
+        with self._lock:
+            flight, created, start = self._admit(key, deadline_s or self.deadline_s, call)
+            if created:
+                flight.wakeup = threading.Condition(self._lock)
+        if start:
+            self._launch(flight)
+        return self._follow(flight, leader=created)
+
+    def _launch(self, flight):
+        context = flight.call[3]
+        threading.Thread(
+            target=context.run, args=(self._run, flight), name="llm-flight", daemon=True
+        ).start()
+
+    def _run(self, flight):
+        client, messages, options, _ = flight.call
+        pieces, error = None, None
+        try:
+            pieces = client.chat_stream(messages, **options)
+            for piece in pieces:
+                with self._lock:
+                    if flight.cancelled:
+                        break
+                    flight.pieces.append(piece)
+                    flight.wakeup.notify_all()
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(pieces, "close", None)
+            if close is not None:
+                close()
+            with self._lock:
+                flight.error = error
+                starts = self._finish(flight)
+                flight.wakeup.notify_all()
+                for queued in starts:
+                    queued.wakeup.notify_all()
+            for queued in starts:
+                self._launch(queued)
+
+    def _follow(self, flight, leader: bool):
+        seen, timed = 0, not leader
+        try:
+            while True:
+                waited = None
+                with self._lock:
+                    while seen == len(flight.pieces) and not flight.done:
+                        if flight.started_at is not None:
+                            flight.wakeup.wait()
+                            continue
+                        remaining = flight.deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._expire(flight)
+                            flight.wakeup.notify_all()
+                            break
+                        flight.wakeup.wait(remaining)
+                    new = flight.pieces[seen:]
+                    if not timed and flight.started_at is not None:
+                        timed = True
+                        waited = self._observe_wait(flight)
+                if waited is not None:
+                    metrics.observe_stage("llm_queue", waited)
+                if new:
+                    seen += len(new)
+                    yield from new
+                    continue
+                if flight.error is not None:
+                    raise flight.error
+                return
+        finally:
+            with self._lock:
+                self._leave(flight)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return super().stats()
+
+
+# ---------- asyncio ----------
+class AsyncLLMScheduler(_SchedulerBase):
+    """asyncio variant in front of an `AsyncOllamaClient` / `AsyncLLMPool`; one per event loop."""
+
+    def __init__(self, client, **options):
+        super().__init__(**options)
+        self.client = client
+
+    @property
+    def model(self) -> str:
+        return self.client.model
+
+    async def chat(self, messages, deadline_s: float = None, **options) -> str:
+        async with contextlib.aclosing(self.chat_stream(messages, deadline_s, **options)) as pieces:
+            return "".join([piece async for piece in pieces])
+
+    def chat_stream(self, messages, deadline_s: float = None, **options):
+        """See `LLMScheduler.chat_stream`; returns an async iterator."""
+        key = response_key(self.client.model, messages, options)
+        call = (self.client, messages, options, contextvars.copy_context())
+        flight, created, start = self._admit(key, deadline_s or self.deadline_s, call)
+        if created:
+            flight.wakeup = asyncio.Event()
+        if start:
+            self._launch(flight)
+        return self._follow(flight, leader=created)
+
+    @staticmethod
+    def _notify(flight):
+        # Waiters hold the old event; the next wait gets a fresh one
+        event, flight.wakeup = flight.wakeup, asyncio.Event()
+        event.set()
+
+    def _launch(self, flight):
+        flight.task = asyncio.get_running_loop().create_task(self._run(flight), context=flight.call[3])
+
+    async def _run(self, flight):
+        client, messages, options, _ = flight.call
+        pieces, error = None, None
+        try:
+            pieces = client.chat_stream(messages, **options)
+            async for piece in pieces:
+                flight.pieces.append(piece)
+                self._notify(flight)
+        except asyncio.CancelledError:
+            pass  # every caller went away
+        except Exception as e:
+            error = e
+        finally:
+            if pieces is not None:
+                await pieces.aclose()
+            flight.error = error
+            starts = self._finish(flight)
+            self._notify(flight)
+            for queued in starts:
+                self._launch(queued)
+                self._notify(queued)
+
+    async def _follow(self, flight, leader: bool):
+        seen, timed = 0, not leader
+        try:
+            while True:
+                while seen == len(flight.pieces) and not flight.done:
+                    event = flight.wakeup
+                    if flight.started_at is not None:
+                        await event.wait()
+                        continue
+                    remaining = flight.deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._expire(flight)
+                        self._notify(flight)
+                        break
+                    try:
+                        await asyncio.wait_for(event.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                if not timed and flight.started_at is not None:
+                    timed = True
+                    metrics.observe_stage("llm_queue", self._observe_wait(flight))
+                new = flight.pieces[seen:]
+                if new:
+                    seen += len(new)
+                    for piece in new:
+                        yield piece
+                    continue
+                if flight.error is not None:
+                    raise flight.error
+                return
+        finally:
+            if self._leave(flight):
+                flight.task.cancel()
@@ -0,0 +1,326 @@
+# loadgen.py
+"""
+Concurrent load generator for CeylonTrip.
+
+Runs N simulated chat sessions (one thread each) that send a realistic mix
+of travel questions, small talk and off-topic questions through
+`engine.answer_question` (or `answer_question_stream` with --stream), and
+reports throughput, latency percentiles and errors per concurrency level.
+Pair it with mock_ollama.py to find capacity without a GPU box:
+
+    python mock_ollama.py --port 11435 --max-concurrency 4 &
+    python loadgen.py --ollama-url http://localhost:11435 --concurrency 1 4 16 64
+
+or let it start the mock itself:
+
+    python loadgen.py --spawn-mock --mock-args "--ttft 0.2 --tps 40 --max-concurrency 4"
+
+Repeat --mock-args to start one mock per value (on consecutive ports) and
+spread the load over them with llm_pool.LLMPool, e.g. a fast host, a slow
+one and a flaky one; per-endpoint stats are printed after the table:
+
+    python loadgen.py --spawn-mock --hedge --mock-args "--ttft 0.2 --slow-rate 0.05" \
+        --mock-args "--ttft 0.6" --mock-args "--ttft 0.2 --error-rate 0.5"
+
+Sessions share one llm_scheduler.LLMScheduler per level, as in the apps.
+Size it with --max-concurrency / --max-queue / --queue-deadline (0 turns it
+off). Turns it answers with the "busy" reply count as `SchedulerBusy` errors, and a
+queue line after the table shows rejections, expiries and queue wait:
+
+    python loadgen.py --spawn-mock --concurrency 64 --max-concurrency 4 --max-queue 16
+
+`prepare` is the time spent before the LLM call (small talk check, cache,
+embedding, retrieval, prompt); if it grows with concurrency while the mock
+is idle, the retrieval path is the bottleneck.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shlex
+import argparse
+import threading
+import subprocess
+from collections import Counter, defaultdict
+
+import numpy as np
+import requests
+
+import engine
+import llm_client
+from llm_client import OllamaClient
+from llm_pool import LLMPool, parse_endpoints
+from llm_scheduler import LLMScheduler, SchedulerBusy
+import llm_scheduler
+from answer_cache import SemanticCache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERY_SET_PATH = os.path.join(BASE_DIR, "data", "eval", "queries_v1.json")
+
+SMALL_TALK = ["hi", "hello", "thanks", "thank you", "ok", "cool", "bye", "good morning"]
+OFF_TOPIC = [
+    "What are the best beaches in Thailand?",
+    "How do I get a visa for India?",
+    "Recommend a hotel in Bali",
+    "What is the capital of France?",
+]
+DEFAULT_MIX = "travel=0.8,small_talk=0.15,off_topic=0.05"
+
+
+def load_questions(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        travel = [q["question"] for q in json.load(f)["queries"]]
+    return {"travel": travel, "small_talk": SMALL_TALK, "off_topic": OFF_TOPIC}
+
+
+def parse_mix(text: str) -> dict:
+    """'travel=0.8,small_talk=0.2' -> {'travel': 0.8, 'small_talk': 0.2}"""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+class Recorder:
+    """Thread-safe collection of per-request samples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []  # (kind, total_s, prepare_s, ttft_s or None)
+        self.errors = Counter()
+
+    def ok(self, kind: str, timings: dict):
+        with self._lock:
+            self.samples.append(
+                (kind, timings["total_s"], timings.get("prepare_s", 0.0), timings.get("ttft_s"))
+            )
+
+    def error(self, kind: str, exc: Exception):
+        with self._lock:
+            self.errors[f"{kind}:{type(exc).__name__}"] += 1
+
+
+def run_session(questions, mix, deadline, recorder, stream, think_s, rng):
+    kinds, weights = zip(*mix.items())
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        question = rng.choice(questions[kind])
+        timings = {}
+        try:
+            if stream:
+                reply = "".join(engine.answer_question_stream(question, timings))
+            else:
+                reply = engine.answer_question(question, timings=timings)
+            if reply == engine.REPLIES["cli"]["busy"]:
+                recorder.error(kind, SchedulerBusy())
+            else:
+                recorder.ok(kind, timings)
+        except Exception as exc:
+            recorder.error(kind, exc)
+        if think_s:
+            time.sleep(rng.uniform(0, 2 * think_s))
+
+
+def run_level(
+    concurrency: int, duration_s: float, questions, mix, stream, think_s, seed, scheduler_options=None,
+) -> dict:
+    recorder = Recorder()
+    # A fresh scheduler per level, so its counters cover this level only
+    engine.llm_scheduler = LLMScheduler(**scheduler_options) if scheduler_options else None
+    deadline = time.perf_counter() + duration_s
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(questions, mix, deadline, recorder, stream, think_s, random.Random(seed + i)),
+            daemon=True,
+        )
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    result = summarize(concurrency, elapsed, recorder)
+    if engine.llm_scheduler is not None:
+        result["scheduler"] = engine.llm_scheduler.stats()
+    return result
+
+
+def _pcts(values_s):
+    if not values_s:
+        return {}
+    ms = np.asarray(values_s) * 1000
+    return {f"p{p}_ms": float(np.percentile(ms, p)) for p in (50, 95, 99)}
+
+
+def summarize(concurrency: int, elapsed: float, recorder: Recorder) -> dict:
+    by_kind = defaultdict(list)
+    for kind, total, _, _ in recorder.samples:
+        by_kind[kind].append(total)
+    n_errors = sum(recorder.errors.values())
+    ttfts = [s[3] for s in recorder.samples if s[3] is not None and s[0] == "travel"]
+    return {
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "requests": len(recorder.samples) + n_errors,
+        "ok": len(recorder.samples),
+        "errors": n_errors,
+        "error_types": dict(recorder.errors),
+        "throughput_rps": len(recorder.samples) / elapsed if elapsed else 0.0,
+        "latency": _pcts([s[1] for s in recorder.samples]),
+        "prepare": _pcts([s[2] for s in recorder.samples if s[0] == "travel"]),
+        "ttft": _pcts(ttfts),
+        "by_kind": {kind: {"n": len(v), **_pcts(v)} for kind, v in by_kind.items()},
+    }
+
+
+def print_table(results):
+    print(f"\n{'conc':>5}{'reqs':>7}{'err':>6}{'req/s':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'prep p50':>10}{'prep p95':>10}")
+    for r in results:
+        lat, prep = r["latency"], r["prepare"]
+        print(
+            f"{r['concurrency']:>5}{r['requests']:>7}{r['errors']:>6}{r['throughput_rps']:>8.2f}"
+            f"{lat.get('p50_ms', float('nan')):>9.0f}{lat.get('p95_ms', float('nan')):>9.0f}"
+            f"{lat.get('p99_ms', float('nan')):>9.0f}"
+            f"{prep.get('p50_ms', float('nan')):>10.1f}{prep.get('p95_ms', float('nan')):>10.1f}"
+        )
+    for r in results:
+        if r["error_types"]:
+            print(f"errors @ {r['concurrency']}: {r['error_types']}")
+    for r in results:
+        q = r.get("scheduler")
+        if q and (q["queued"] or q["rejected"]):
+            print(f"queue @ {r['concurrency']}: {q['queued']} queued, {q['rejected']} rejected, "
+                  f"{q['expired']} expired, {q['deduplicated']} deduplicated, "
+                  f"wait p50 {q['wait_p50_ms']:.0f} ms / p95 {q['wait_p95_ms']:.0f} ms")
+
+
+def print_endpoints(stats: dict):
+    print(f"\n{'endpoint':<24}{'reqs':>7}{'err':>6}{'hedges':>8}{'eject':>7}"
+          f"{'ttft p50':>10}{'ttft p95':>10}{'reply p95':>11}")
+    for e in stats["endpoints"]:
+        print(
+            f"{e['endpoint']:<24}{e['requests']:>7}{e['errors']:>6}{e['hedges']:>8}{e['ejections']:>7}"
+            f"{e.get('ttft_p50_ms', float('nan')):>10.0f}{e.get('ttft_p95_ms', float('nan')):>10.0f}"
+            f"{e.get('reply_p95_ms', float('nan')):>11.0f}"
+        )
+    if stats["hedge"]:
+        print(f"hedged {stats['hedged']} request(s), {stats['hedge_wins']} won by the hedge")
+
+
+def spawn_mock(port: int, extra_args: str):
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BASE_DIR, "mock_ollama.py"), "--port", str(port)]
+        + shlex.split(extra_args),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(url, timeout=0.5)
+            return proc, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit("mock_ollama.py did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CeylonTrip concurrent load generator.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                        help="concurrent sessions; several values run one level each")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="question mix weights")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between turns (s)")
+    parser.add_argument("--stream", action="store_true", help="use answer_question_stream")
+    parser.add_argument("--cache", action="store_true", help="keep the answer and response caches on")
+    parser.add_argument("--ollama-url", default=llm_client.OLLAMA_URL)
+    parser.add_argument("--endpoints", default=llm_client.OLLAMA_ENDPOINTS,
+                        help="several LLM hosts: 'url[|model[|max_in_flight]],...'")
+    parser.add_argument("--hedge", action="store_true", help="hedge slow requests (pool only)")
+    parser.add_argument("--retries", type=int, default=llm_client.MAX_RETRIES)
+    parser.add_argument("--max-concurrency", type=int, default=llm_scheduler.MAX_CONCURRENCY,
+                        help="LLM scheduler: generations at once (0 = no scheduler)")
+    parser.add_argument("--max-queue", type=int, default=llm_scheduler.MAX_QUEUE,
+                        help="LLM scheduler: waiting requests before the busy reply")
+    parser.add_argument("--queue-deadline", type=float, default=llm_scheduler.QUEUE_DEADLINE_S,
+                        help="LLM scheduler: seconds a request may wait for a slot")
+    parser.add_argument("--spawn-mock", action="store_true", help="start mock_ollama.py")
+    parser.add_argument("--mock-port", type=int, default=11435)
+    parser.add_argument("--mock-args", action="append",
+                        help="extra mock_ollama.py arguments; repeat for one mock per value")
+    parser.add_argument("--queries", default=QUERY_SET_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    mocks = []
+    url = args.ollama_url
+    endpoints = parse_endpoints(args.endpoints) if args.endpoints else None
+    try:
+        if args.spawn_mock:
+            urls = []
+            for i, mock_args in enumerate(args.mock_args or [""]):
+                mock, mock_url = spawn_mock(args.mock_port + i, mock_args)
+                mocks.append(mock)
+                urls.append(mock_url)
+            url = ",".join(urls)
+            endpoints = parse_endpoints(url) if len(urls) > 1 else None
+
+        if endpoints:
+            url = ", ".join(endpoint[0] for endpoint in endpoints)
+            client = LLMPool(
+                endpoints, hedge=args.hedge, max_retries=args.retries, pool_size=max(args.concurrency),
+            )
+        else:
+            client = OllamaClient(base_url=url, max_retries=args.retries, pool_size=max(args.concurrency))
+        llm_client.set_client(client)
+        if not args.cache:
+            # Every travel question should reach the LLM
+            engine.answer_cache = SemanticCache(max_entries=0)
+            engine.response_cache = None
+
+        scheduler_options = None
+        if args.max_concurrency > 0:
+            scheduler_options = {
+                "max_concurrency": args.max_concurrency,
+                "max_queue": args.max_queue,
+                "deadline_s": args.queue_deadline,
+            }
+
+        questions = load_questions(args.queries)
+        mix = parse_mix(args.mix)
+        print(f"Warming up (LLM at {url})...")
+        engine.load_all()
+
+        results = []
+        for level in args.concurrency:
+            print(f"Running {level} session(s) for {args.duration:g}s...")
+            results.append(
+                run_level(
+                    level, args.duration, questions, mix, args.stream, args.think, args.seed,
+                    scheduler_options,
+                )
+            )
+        print_table(results)
+        if isinstance(client, LLMPool):
+            print_endpoints(client.stats())
+
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nSaved results to {args.out}")
+    finally:
+        for mock in mocks:
+            mock.terminate()
+            mock.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# meta_store.py
+"""
+Binary chunk metadata that is memory-mapped instead of parsed.
+
+meta.json has to be read and turned into Python objects by every process.
+This format is opened with mmap instead: nothing is parsed up front, pages
+are shared by every process on the host through the OS page cache, and
+opening it costs the same for 80 chunks or 8 million.
+
+Layout (next to faiss.index):
+
+    meta.table.npy    structured array sorted by vid:
+                      vid, text_off, text_len, id_off, id_len, source, hash
+    meta.texts.bin    UTF-8 chunk texts back to back
+    meta.ids.bin      UTF-8 chunk ids back to back
+    meta.header.json  {"format": 1, "count": n, "sources": [...]} (written last)
+
+`MetaStore` behaves like the read-only {vid: chunk dict} mapping the
+engine used to build from meta.json; chunk dicts are decoded on access.
+
+Convert an existing JSON build with:
+    python meta_store.py convert [--index-dir data/index/versions/<version>]
+"""
+import os
+import json
+import mmap
+import argparse
+from collections.abc import Mapping
+
+import numpy as np
+
+from index_versions import current_dir
+
+FORMAT_VERSION = 1
+
+TABLE_FILE = "meta.table.npy"
+TEXTS_FILE = "meta.texts.bin"
+IDS_FILE = "meta.ids.bin"
+HEADER_FILE = "meta.header.json"
+
+TABLE_DTYPE = np.dtype([
+    ("vid", "<i8"),
+    ("text_off", "<i8"),
+    ("text_len", "<i4"),
+    ("id_off", "<i8"),
+    ("id_len", "<i4"),
+    ("source", "u1"),
+    ("hash", "S16"),
+])
+
+
+# ---------- Writing ----------
+def _replace(tmp_path: str, path: str):
+    # New inode, so processes that have the old file mapped keep reading it
+    os.replace(tmp_path, path)
+
+
+def write_meta_store(corpus, index_dir: str):
+    """Write `corpus` (chunk dicts with id/source/text/hash/vid) in the binary layout."""
+    sources = sorted({c["source"] for c in corpus})
+    if len(sources) > 255:
+        raise ValueError("More than 255 chunk sources; widen the source column.")
+    source_code = {s: i for i, s in enumerate(sources)}
+
+    table = np.zeros(len(corpus), dtype=TABLE_DTYPE)
+    text_parts, id_parts = [], []
+    text_off = id_off = 0
+    for row, c in enumerate(sorted(corpus, key=lambda c: c["vid"])):
+        text = c["text"].encode("utf-8")
+        cid = c["id"].encode("utf-8")
+        table[row] = (
+            c["vid"], text_off, len(text), id_off, len(cid),
+            source_code[c["source"]], c["hash"].encode("ascii"),
+        )
+        text_parts.append(text)
+        id_parts.append(cid)
+        text_off += len(text)
+        id_off += len(cid)
+
+    paths = {name: os.path.join(index_dir, name) for name in (TABLE_FILE, TEXTS_FILE, IDS_FILE)}
+    with open(paths[TABLE_FILE] + ".tmp", "wb") as f:
+        np.save(f, table)
+    with open(paths[TEXTS_FILE] + ".tmp", "wb") as f:
+        f.write(b"".join(text_parts))
+    with open(paths[IDS_FILE] + ".tmp", "wb") as f:
+        f.write(b"".join(id_parts))
+    for path in paths.values():
+        _replace(path + ".tmp", path)
+
+    header_path = os.path.join(index_dir, HEADER_FILE)
+    with open(header_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"format": FORMAT_VERSION, "count": len(corpus), "sources": sources}, f)
+    _replace(header_path + ".tmp", header_path)
+
+
+def convert_json(meta_json_path: str, index_dir: str) -> int:
+    """Build the binary store from an existing meta.json; returns the chunk count."""
+    with open(meta_json_path, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    if any("vid" not in c or "hash" not in c for c in corpus):
+        raise ValueError(f"{meta_json_path} predates vector ids; rebuild with build_index.py --full")
+    write_meta_store(corpus, index_dir)
+    return len(corpus)
+
+
+# ---------- Reading ----------
+def has_meta_store(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, HEADER_FILE))
+
+
+def _map(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class MetaStore(Mapping):
+    """Read-only {vid: chunk dict} view over the memory-mapped files."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, HEADER_FILE), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header["format"] != FORMAT_VERSION:
+            raise RuntimeError(f"Unsupported meta store format {header['format']}")
+        self.sources = header["sources"]
+        # Plain ndarray views over the map (np.memmap's per-access overhead
+        # adds up on the hot path)
+        self.table = np.asarray(np.load(os.path.join(index_dir, TABLE_FILE), mmap_mode="r"))
+        self.vids = self.table["vid"]
+        self._texts = _map(os.path.join(index_dir, TEXTS_FILE))
+        self._ids = _map(os.path.join(index_dir, IDS_FILE))
+
+    def _row(self, vid):
+        row = int(self.vids.searchsorted(vid))
+        if row < len(self.vids) and int(self.vids[row]) == vid:
+            return row
+        return None
+
+    def __getitem__(self, vid) -> dict:
+        row = self._row(vid)
+        if row is None:
+            raise KeyError(vid)
+        vid, text_off, text_len, id_off, id_len, source, chunk_hash = self.table[row].item()
+        return {
+            "id": self._ids[id_off:id_off + id_len].decode("utf-8"),
+            "source": self.sources[source],
+            "text": self._texts[text_off:text_off + text_len].decode("utf-8"),
+            "hash": chunk_hash.decode("ascii"),
+            "vid": vid,
+        }
+
+    def __contains__(self, vid) -> bool:
+        return self._row(vid) is not None
+
+    def __iter__(self):
+        return (int(v) for v in self.vids)
+
+    def __len__(self) -> int:
+        return len(self.vids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary chunk metadata utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="build the binary store from meta.json")
+    convert.add_argument(
+        "--index-dir", default=current_dir(os.path.join(os.path.dirname(__file__), "data", "index")),
+        help="index version directory (default: the live one)",
+    )
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        n = convert_json(os.path.join(args.index_dir, "meta.json"), args.index_dir)
+        print(f"Wrote binary metadata for {n} chunks to {args.index_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# metrics.py
+"""
+Per-stage latency and LLM throughput metrics.
+
+Stages are timed with `span(name)` and aggregated into fixed-bucket
+histograms. Those are exported as Prometheus text (`render_prometheus`,
+served by server.py at GET /metrics) or as a dict snapshot (`snapshot`, used
+by the Streamlit debug panel). Ollama's final chat message carries
+`eval_count` / `eval_duration` / `prompt_eval_count`. `record_llm` turns
+these into tokens per second and prompt / output token counts.
+
+A `Trace` groups the spans of one chat turn. The engine returns it in
+`timings["stages"]`, and with CEYLONTRIP_METRICS_LOG=1 each finished turn is
+also logged as one JSON line on the "ceylontrip.metrics" logger.
+
+Set CEYLONTRIP_METRICS=0 to turn everything off: `span` then returns a
+shared no-op context manager and the record functions return at once.
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+
+ENABLED = os.environ.get("CEYLONTRIP_METRICS", "1") == "1"
+LOG_TURNS = os.environ.get("CEYLONTRIP_METRICS_LOG", "0") == "1"
+
+SECONDS_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+TOKENS_PER_S_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+TOKEN_COUNT_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+logger = logging.getLogger("ceylontrip.metrics")
+if LOG_TURNS and not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+# ---------- Histograms ----------
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics) with sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding rank q."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen, lower = 0, 0.0
+        for upper, n in zip(self.buckets, self.counts):
+            if n and seen + n >= rank:
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return self.buckets[-1]
+
+
+class HistogramFamily:
+    """
+    One histogram per label value (e.g. stage="embed"). With several label
+    names, label values are tuples in the same order.
+    """
+
+    def __init__(self, name: str, help_text: str, buckets, label=None):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labels = (label,) if isinstance(label, str) else tuple(label or ())
+        self.children = {}
+
+    def observe(self, value: float, label_value=""):
+        child = self.children.get(label_value)
+        if child is None:
+            child = self.children.setdefault(label_value, Histogram(self.buckets))
+        child.observe(value)
+
+    def _labels(self, label_value, extra: str = "") -> str:
+        values = label_value if isinstance(label_value, tuple) else (label_value,)
+        parts = [f'{name}="{value}"' for name, value in zip(self.labels, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for label_value, h in sorted(self.children.items()):
+            cumulative = 0
+            for upper, n in zip(self.buckets + ("+Inf",), h.counts):
+                cumulative += n
+                le = f'le="{upper}"'
+                yield f"{self.name}_bucket{self._labels(label_value, le)} {cumulative}"
+            yield f"{self.name}_sum{self._labels(label_value)} {h.sum:.6f}"
+            yield f"{self.name}_count{self._labels(label_value)} {h.count}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = HistogramFamily(
+            "ceylontrip_stage_seconds", "Time spent per chat turn stage.", SECONDS_BUCKETS, "stage"
+        )
+        self.llm_tokens_per_s = HistogramFamily(
+            "ceylontrip_llm_tokens_per_second", "LLM generation speed (eval_count / eval_duration).",
+            TOKENS_PER_S_BUCKETS,
+        )
+        self.prompt_tokens = HistogramFamily(
+            "ceylontrip_llm_prompt_tokens", "Prompt tokens evaluated per LLM call (prompt_eval_count).",
+            TOKEN_COUNT_BUCKETS,
+        )
+        self.output_tokens = HistogramFamily(
+            "ceylontrip_llm_output_tokens", "Tokens generated per LLM call (eval_count).",
+            TOKEN_COUNT_BUCKETS,
+        )
+        self.endpoint_seconds = HistogramFamily(
+            "ceylontrip_llm_endpoint_seconds",
+            "Per LLM endpoint: time to first token (ttft) or to the whole reply (reply).",
+            SECONDS_BUCKETS, ("endpoint", "kind"),
+        )
+        self.turns = {}
+        self.endpoint_requests = {}
+        self.admissions = {}
+        # name -> (help, callback); the value is read at scrape time
+        self.gauges = {}
+
+    def observe(self, family: HistogramFamily, value: float, label_value=""):
+        with self._lock:
+            family.observe(value, label_value)
+
+    def count_turn(self, path: str):
+        with self._lock:
+            self.turns[path] = self.turns.get(path, 0) + 1
+
+    def count_endpoint(self, endpoint: str, outcome: str):
+        with self._lock:
+            key = (endpoint, outcome)
+            self.endpoint_requests[key] = self.endpoint_requests.get(key, 0) + 1
+
+    def count_admission(self, outcome: str):
+        with self._lock:
+            self.admissions[outcome] = self.admissions.get(outcome, 0) + 1
+
+    def register_gauge(self, name: str, help_text: str, fn):
+        """Export `fn()` as a gauge; registering a name again replaces its callback."""
+        with self._lock:
+            self.gauges[name] = (help_text, fn)
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP ceylontrip_turns_total Chat turns by how they were answered.",
+                "# TYPE ceylontrip_turns_total counter",
+            ]
+            lines += [f'ceylontrip_turns_total{{path="{p}"}} {n}' for p, n in sorted(self.turns.items())]
+            if self.endpoint_requests:
+                lines += [
+                    "# HELP ceylontrip_llm_endpoint_requests_total LLM requests per endpoint by outcome.",
+                    "# TYPE ceylontrip_llm_endpoint_requests_total counter",
+                ]
+                lines += [
+                    f'ceylontrip_llm_endpoint_requests_total{{endpoint="{e}",outcome="{o}"}} {n}'
+                    for (e, o), n in sorted(self.endpoint_requests.items())
+                ]
+            if self.admissions:
+                lines += [
+                    "# HELP ceylontrip_llm_admissions_total LLM requests by admission outcome.",
+                    "# TYPE ceylontrip_llm_admissions_total counter",
+                ]
+                lines += [
+                    f'ceylontrip_llm_admissions_total{{outcome="{o}"}} {n}'
+                    for o, n in sorted(self.admissions.items())
+                ]
+            for name, (help_text, fn) in sorted(self.gauges.items()):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {fn()}"]
+            for family in (
+                self.stages, self.llm_tokens_per_s, self.prompt_tokens, self.output_tokens,
+                self.endpoint_seconds,
+            ):
+                lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """{"turns": {...}, "stages": {stage: {count, mean_ms, p50_ms, p95_ms}}, "llm": {...}}"""
+
+        def summary(h: Histogram, scale: float = 1.0, unit: str = "") -> dict:
+            return {
+                "count": h.count,
+                f"mean{unit}": h.sum / h.count * scale if h.count else 0.0,
+                f"p50{unit}": h.quantile(0.5) * scale,
+                f"p95{unit}": h.quantile(0.95) * scale,
+            }
+
+        with self._lock:
+            llm = {}
+            for key, family in (
+                ("tokens_per_s", self.llm_tokens_per_s),
+                ("prompt_tokens", self.prompt_tokens),
+                ("output_tokens", self.output_tokens),
+            ):
+                if "" in family.children:
+                    llm[key] = summary(family.children[""])
+            return {
+                "turns": dict(self.turns),
+                "stages": {
+                    stage: summary(h, 1000.0, "_ms") for stage, h in sorted(self.stages.children.items())
+                },
+                "llm": llm,
+            }
+
+
+registry = Registry()
+
+
+# ---------- Spans and traces ----------
+class Trace:
+    """Stage timings and LLM stats for one chat turn."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.llm = {}
+        self.path = None
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def activate(self):
+        """Context manager making this the trace that `span` and `record_llm` report to."""
+        return _Activation(self)
+
+    def finish(self, path: str = None):
+        """Count the turn by `path` (llm / cache / small_talk / no_context) and log it."""
+        if not ENABLED:
+            return
+        path = self.path = path or self.path or "unknown"
+        total = time.perf_counter() - self.start
+        registry.count_turn(path)
+        registry.observe(registry.stages, total, "turn")
+        if LOG_TURNS:
+            logger.info(json.dumps({
+                "event": "turn",
+                "path": path,
+                "total_ms": round(total * 1000, 3),
+                "stages_ms": {k: round(v * 1000, 3) for k, v in self.stages.items()},
+                "llm": self.llm,
+            }))
+
+
+_current = contextvars.ContextVar("ceylontrip_trace", default=None)
+
+
+class _Activation:
+    def __init__(self, trace: Trace):
+        self.trace = trace
+
+    def __enter__(self):
+        self._token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.stage, time.perf_counter() - self.start)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage: str):
+    """`with span("embed"):` times the block into the stage histogram and the active trace."""
+    return _Span(stage) if ENABLED else _NOOP
+
+
+def observe_stage(stage: str, seconds: float):
+    if not ENABLED:
+        return
+    registry.observe(registry.stages, seconds, stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+def mark_path(path: str):
+    """Note how the active trace's turn is being answered (see `Trace.finish`)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.path = path
+
+
+def traced(trace: Trace, iterable):
+    """
+    Iterate `iterable` with `trace` active during each step only, e.g. a
+    streamed LLM reply consumed by a generator that yields in between.
+    """
+    if not ENABLED:
+        yield from iterable
+        return
+    it = iter(iterable)
+    while True:
+        with trace.activate():
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+        yield item
+
+
+def record_llm(data: dict, trace: Trace = None):
+    """Record Ollama's final-message stats (durations are in nanoseconds)."""
+    if not ENABLED:
+        return
+    stats = {}
+    if data.get("eval_count") is not None:
+        stats["output_tokens"] = data["eval_count"]
+        registry.observe(registry.output_tokens, data["eval_count"])
+        if data.get("eval_duration"):
+            stats["tokens_per_s"] = data["eval_count"] / (data["eval_duration"] / 1e9)
+            registry.observe(registry.llm_tokens_per_s, stats["tokens_per_s"])
+    if data.get("prompt_eval_count") is not None:
+        # Ollama leaves this out when the whole prompt came from its cache
+        stats["prompt_tokens"] = data["prompt_eval_count"]
+        registry.observe(registry.prompt_tokens, data["prompt_eval_count"])
+    if data.get("load_duration"):
+        stats["load_ms"] = data["load_duration"] / 1e6
+    trace = trace or _current.get()
+    if trace is not None:
+        trace.llm.update(stats)
@@ -0,0 +1,235 @@
+# mock_ollama.py
+"""
+Local stand-in for Ollama's /api/chat, for load tests without a GPU box.
+
+Speaks the same wire format as Ollama (a single JSON object, or NDJSON
+lines ending with `"done": true` when streaming) with configurable
+time-to-first-token, token rate, error rate and concurrency limit.
+
+    python mock_ollama.py --port 11435 --ttft 0.3 --tps 30 --max-concurrency 4
+    OLLAMA_URL=http://localhost:11435 python chat_demo.py
+
+Requests beyond --max-concurrency wait in line (like Ollama with
+OLLAMA_NUM_PARALLEL), or get a 503 straight away with --reject-when-busy.
+GET /stats returns request counters as JSON.
+
+With --load-time the model behaves like a real one: the first request
+after `keep_alive` expired pays the load, an empty `messages` list only
+loads it and `keep_alive: 0` unloads it. --prefill-ms adds prompt
+processing time per 1000 characters that don't share a prefix with the
+previous prompt, mimicking llama.cpp's KV-cache reuse.
+
+--slow-rate makes that fraction of requests --slow-factor times slower to
+the first token, a latency tail to exercise hedging (llm_pool.py). Several
+instances on different ports stand in for a pool of hosts.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from aiohttp import web
+
+WORDS = (
+    "Sri Lanka offers golden beaches, misty tea country, ancient cities and "
+    "wildlife parks. Travel between regions by scenic train or private driver, "
+    "and plan around the monsoon seasons for the best weather."
+).split()
+
+
+class MockOllama:
+    def __init__(
+        self,
+        ttft_s: float = 0.3,
+        tokens_per_s: float = 30.0,
+        n_tokens: int = 60,
+        error_rate: float = 0.0,
+        max_concurrency: int = 1,
+        reject_when_busy: bool = False,
+        jitter: float = 0.1,
+        load_time_s: float = 0.0,
+        prefill_ms_per_kchar: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_factor: float = 10.0,
+    ):
+        self.ttft_s = ttft_s
+        self.tokens_per_s = tokens_per_s
+        self.n_tokens = n_tokens
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.reject_when_busy = reject_when_busy
+        self.jitter = jitter
+        self.load_time_s = load_time_s
+        self.prefill_ms_per_kchar = prefill_ms_per_kchar
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.loaded_until = 0.0
+        self.last_prompt = ""
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.stats = {
+            "requests": 0, "active": 0, "queued": 0, "errors": 0, "rejected": 0, "loads": 0, "slow": 0,
+        }
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    @staticmethod
+    def _keep_alive_s(value) -> float:
+        """Ollama keep_alive: seconds, or "30s" / "5m" / "1h"; negative = forever."""
+        if value is None:
+            return 300.0
+        if isinstance(value, (int, float)):
+            seconds = float(value)
+        else:
+            units = {"s": 1, "m": 60, "h": 3600}
+            text = str(value).strip()
+            seconds = float(text[:-1]) * units[text[-1]] if text[-1] in units else float(text)
+        return float("inf") if seconds < 0 else seconds
+
+    async def _ensure_loaded(self, keep_alive):
+        now = time.monotonic()
+        if self.load_time_s and now >= self.loaded_until:
+            self.stats["loads"] += 1
+            self.last_prompt = ""
+            await asyncio.sleep(self._jittered(self.load_time_s))
+        self.loaded_until = time.monotonic() + self._keep_alive_s(keep_alive)
+
+    def _prefill_s(self, messages) -> float:
+        prompt = "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in messages)
+        shared = 0
+        for a, b in zip(prompt, self.last_prompt):
+            if a != b:
+                break
+            shared += 1
+        self.last_prompt = prompt
+        return (len(prompt) - shared) / 1000 * self.prefill_ms_per_kchar / 1000
+
+    def _tokens(self):
+        return [WORDS[i % len(WORDS)] + " " for i in range(self.n_tokens)]
+
+    def _chunk(self, model: str, content: str, done: bool, prompt_tokens: int = 0) -> dict:
+        data = {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+        }
+        if done:
+            # Same stats fields as Ollama's final message (durations in ns)
+            data["eval_count"] = self.n_tokens
+            data["eval_duration"] = int(self.n_tokens / self.tokens_per_s * 1e9)
+            data["prompt_eval_count"] = prompt_tokens
+        return data
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        model = payload.get("model", "mock")
+        stream = payload.get("stream", True)  # Ollama streams unless told otherwise
+        self.stats["requests"] += 1
+
+        if self.reject_when_busy and self._slots.locked():
+            self.stats["rejected"] += 1
+            return web.json_response({"error": "server busy"}, status=503)
+
+        self.stats["queued"] += 1
+        async with self._slots:
+            self.stats["queued"] -= 1
+            self.stats["active"] += 1
+            try:
+                if payload.get("keep_alive") in (0, "0", "0s", "0m"):
+                    self.loaded_until = 0.0
+                    return web.json_response(self._chunk(model, "", True))
+                await self._ensure_loaded(payload.get("keep_alive"))
+                messages = payload.get("messages") or []
+                if not messages:
+                    # Load-only request
+                    return web.json_response(self._chunk(model, "", True))
+                await asyncio.sleep(self._prefill_s(messages))
+                # ~4 characters per token, like context_budget's estimate
+                prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+                return await self._generate(request, model, stream, prompt_tokens)
+            finally:
+                self.stats["active"] -= 1
+
+    async def _generate(self, request, model: str, stream: bool, prompt_tokens: int = 0):
+        ttft_s = self.ttft_s
+        if random.random() < self.slow_rate:
+            self.stats["slow"] += 1
+            ttft_s *= self.slow_factor
+        await asyncio.sleep(self._jittered(ttft_s))
+        if random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response({"error": "mock failure"}, status=500)
+
+        tokens = self._tokens()
+        per_token = 1.0 / self.tokens_per_s
+        if not stream:
+            await asyncio.sleep(self._jittered(per_token * (len(tokens) - 1)))
+            return web.json_response(self._chunk(model, "".join(tokens), True, prompt_tokens))
+
+        resp = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await resp.prepare(request)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self._jittered(per_token))
+            await resp.write((json.dumps(self._chunk(model, token, False)) + "\n").encode())
+        await resp.write((json.dumps(self._chunk(model, "", True, prompt_tokens)) + "\n").encode())
+        await resp.write_eof()
+        return resp
+
+    async def root(self, request: web.Request) -> web.Response:
+        return web.Response(text="Ollama is running")
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+
+def make_app(mock: MockOllama) -> web.Application:
+    app = web.Application()
+    app.router.add_get("/", mock.root)
+    app.router.add_post("/api/chat", mock.chat)
+    app.router.add_get("/stats", mock.get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama /api/chat server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds to first token")
+    parser.add_argument("--tps", type=float, default=30.0, help="tokens per second")
+    parser.add_argument("--tokens", type=int, default=60, help="tokens per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 replies")
+    parser.add_argument("--max-concurrency", type=int, default=1, help="parallel generations")
+    parser.add_argument("--reject-when-busy", action="store_true",
+                        help="503 instead of queueing when all slots are busy")
+    parser.add_argument("--load-time", type=float, default=0.0,
+                        help="seconds to load the model after keep_alive expired")
+    parser.add_argument("--prefill-ms", type=float, default=0.0,
+                        help="prompt processing ms per 1000 uncached characters")
+    parser.add_argument("--slow-rate", type=float, default=0.0,
+                        help="fraction of requests with a --slow-factor times longer ttft")
+    parser.add_argument("--slow-factor", type=float, default=10.0)
+    args = parser.parse_args()
+
+    async def build():
+        # The semaphore must be created on the server's event loop
+        return make_app(MockOllama(
+            ttft_s=args.ttft,
+            tokens_per_s=args.tps,
+            n_tokens=args.tokens,
+            error_rate=args.error_rate,
+            max_concurrency=args.max_concurrency,
+            reject_when_busy=args.reject_when_busy,
+            load_time_s=args.load_time,
+            prefill_ms_per_kchar=args.prefill_ms,
+            slow_rate=args.slow_rate,
+            slow_factor=args.slow_factor,
+        ))
+
+    web.run_app(build(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
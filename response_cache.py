@@ -0,0 +1,257 @@
+# response_cache.py
+"""
+Disk-backed LLM response cache shared by every process on the machine.
+
+The semantic answer cache (answer_cache.py) lives in one process and is
+empty after each restart. This one stores finished LLM replies in SQLite,
+so the CLI, every Streamlit replica, server.py and batch jobs reuse each
+other's generations, and a cache filled before a deploy is still warm after it.
+
+Entries are keyed by a hash of the cache namespace (LLM model + index
+content hash, see `engine.cache_namespace`) and the exact messages sent to
+the LLM. Those include the system prompt and the retrieved CONTEXT, so a
+changed prompt, model or index never returns a stale reply.
+
+- Concurrency: WAL journal mode, so readers never block the single writer;
+  each thread opens its own connection and waits up to `BUSY_TIMEOUT_S`
+  for the write lock.
+- Expiry: entries older than `ttl_s` are misses and are deleted by eviction.
+- Size cap: past `max_entries` or `max_mb`, the least recently used entries
+  are evicted (checked every `EVICT_EVERY` writes). A hit refreshes its
+  `accessed_at` at most once per `TOUCH_S`, so reads rarely write.
+
+    python response_cache.py stats      # entries, size, oldest / newest
+    python response_cache.py compact    # evict, checkpoint the WAL, VACUUM
+    python response_cache.py clear
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RESPONSE_CACHE_ENABLED = os.environ.get("CEYLONTRIP_RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_PATH = os.environ.get(
+    "CEYLONTRIP_RESPONSE_CACHE_PATH", os.path.join(BASE_DIR, "data", "cache", "responses.sqlite3")
+)
+RESPONSE_CACHE_TTL_S = float(os.environ.get("CEYLONTRIP_RESPONSE_CACHE_TTL_S", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("CEYLONTRIP_RESPONSE_CACHE_MAX_ENTRIES", "100000"))
+RESPONSE_CACHE_MAX_MB = float(os.environ.get("CEYLONTRIP_RESPONSE_CACHE_MAX_MB", "256"))
+
+BUSY_TIMEOUT_S = 5.0
+EVICT_EVERY = 64
+TOUCH_S = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+
+def response_key(namespace: str, messages, options: dict = None) -> str:
+    """Stable hash of everything that determines the reply."""
+    payload = json.dumps(
+        {"namespace": namespace, "messages": messages, "options": options or {}},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: str = RESPONSE_CACHE_PATH,
+        ttl_s: float = RESPONSE_CACHE_TTL_S,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_mb: float = RESPONSE_CACHE_MAX_MB,
+    ):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # ---------- Connections ----------
+    def _connect(self) -> sqlite3.Connection:
+        """This thread's connection, opened (and the schema created) on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Autocommit: every statement is its own short transaction
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_S, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    # ---------- Lookups ----------
+    def get(self, key: str):
+        """The cached reply for `key`, or None (missing, expired, or the DB is unavailable)."""
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response, created_at, accessed_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_s:
+                self._count("misses")
+                return None
+            if now - row[2] > TOUCH_S:
+                conn.execute(
+                    "UPDATE responses SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (now, key)
+                )
+        except sqlite3.Error:
+            # A cache problem must never fail the chat turn
+            self._count("errors")
+            return None
+        self._count("hits")
+        return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        size = len(response.encode("utf-8")) + len(key)
+        if not response or size > self.max_bytes:
+            return
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+        except sqlite3.Error:
+            self._count("errors")
+            return
+        with self._lock:
+            self.writes += 1
+            evict = self.writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    # ---------- Maintenance ----------
+    def evict(self) -> int:
+        """Delete expired entries, then LRU ones past the size caps; returns how many went."""
+        try:
+            conn = self._connect()
+            removed = conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_s,)
+            ).rowcount
+            # Keep the newest entries that fit both caps
+            removed += conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key,
+                               ROW_NUMBER() OVER (ORDER BY accessed_at DESC) AS rank,
+                               SUM(size) OVER (ORDER BY accessed_at DESC) AS kept_bytes
+                        FROM responses
+                    ) WHERE rank > ? OR kept_bytes > ?
+                )
+                """,
+                (self.max_entries, self.max_bytes),
+            ).rowcount
+        except sqlite3.Error:
+            self._count("errors")
+            return 0
+        return removed
+
+    def compact(self) -> dict:
+        """Evict, VACUUM and fold the WAL back into the database; returns sizes before/after."""
+        before = self.file_bytes()
+        removed = self.evict()
+        conn = self._connect()
+        conn.execute("VACUUM")
+        # VACUUM itself goes through the WAL
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"removed": removed, "bytes_before": before, "bytes_after": self.file_bytes()}
+
+    def clear(self):
+        self._connect().execute("DELETE FROM responses")
+
+    def file_bytes(self) -> int:
+        return sum(
+            os.path.getsize(self.path + suffix)
+            for suffix in ("", "-wal", "-shm") if os.path.exists(self.path + suffix)
+        )
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self) -> dict:
+        """This process's hit counters, plus what is on disk (shared by all processes)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            out = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "errors": self.errors,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+        try:
+            entries, size, oldest, newest = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(created_at), MAX(created_at) FROM responses"
+            ).fetchone()
+        except sqlite3.Error:
+            return out
+        out.update({"entries": entries, "bytes": size, "oldest": oldest, "newest": newest})
+        return out
+
+
+# ---------- CLI ----------
+def _age(timestamp) -> str:
+    if timestamp is None:
+        return "-"
+    return f"{(time.time() - timestamp) / 3600:.1f}h ago"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and maintain the persistent LLM response cache.")
+    parser.add_argument("--path", default=RESPONSE_CACHE_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="entries, size and age of the cache")
+    sub.add_parser("compact", help="evict expired / over-cap entries, checkpoint the WAL and VACUUM")
+    sub.add_parser("clear", help="delete every entry")
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.path)
+    if args.command == "stats":
+        s = cache.stats()
+        print(f"{args.path}: {s.get('entries', 0)} entries, {s.get('bytes', 0) / 1e6:.1f} MB of replies, "
+              f"{cache.file_bytes() / 1e6:.1f} MB on disk")
+        print(f"oldest {_age(s.get('oldest'))}, newest {_age(s.get('newest'))}")
+    elif args.command == "compact":
+        r = cache.compact()
+        print(f"Removed {r['removed']} entries; {r['bytes_before'] / 1e6:.1f} MB -> {r['bytes_after'] / 1e6:.1f} MB")
+    else:
+        cache.clear()
+        print(f"Cleared {args.path}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+# route_graph.py
+"""
+Travel graph over routes.csv.
+
+At index-build time `build_route_graph` turns every route row into an
+undirected edge (weight = midpoint of hours_min/hours_max), runs
+Floyd–Warshall for all-pairs shortest travel times and saves the distance
+and next-hop matrices plus each destination's `recommended_days`.
+
+At query time `RouteGraph.plan` orders a set of destinations into the
+shortest tour that fits a day budget, and `format_plan` turns the result
+into CONTEXT facts so the LLM doesn't have to do route arithmetic.
+"""
+import re
+import csv
+import json
+import itertools
+
+import numpy as np
+
+# Hours of travel that make up one day of the trip
+TRAVEL_HOURS_PER_DAY = 8.0
+# Exact ordering up to this many stops, nearest-neighbour + 2-opt beyond
+MAX_EXACT_STOPS = 6
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "thirteen": 13, "fourteen": 14, "fifteen": 15,
+}
+
+
+# ---------- Build time ----------
+def _read_csv(path: str):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def build_route_graph(routes_path: str, destinations_path: str = None) -> dict:
+    """Return the serializable graph with precomputed all-pairs shortest paths."""
+    rows = _read_csv(routes_path)
+    stay_days = {}
+    if destinations_path:
+        for row in _read_csv(destinations_path):
+            stay_days[row["name"]] = float(row["recommended_days"])
+
+    nodes = sorted({r["from"] for r in rows} | {r["to"] for r in rows} | set(stay_days))
+    pos = {name: i for i, name in enumerate(nodes)}
+    n = len(nodes)
+
+    dist = np.full((n, n), np.inf)
+    np.fill_diagonal(dist, 0.0)
+    edges = {}
+    for r in rows:
+        a, b = pos[r["from"]], pos[r["to"]]
+        hours = (float(r["hours_min"]) + float(r["hours_max"])) / 2
+        if hours < dist[a, b]:
+            dist[a, b] = dist[b, a] = hours
+            edges[f"{min(a, b)}|{max(a, b)}"] = {
+                "transport": r["transport"],
+                "hours_min": float(r["hours_min"]),
+                "hours_max": float(r["hours_max"]),
+                "scenic": r["scenic"].strip().lower() == "yes",
+            }
+
+    nxt = np.where(np.isfinite(dist), np.arange(n)[None, :], -1)
+    for k in range(n):
+        via = dist[:, k:k + 1] + dist[k:k + 1, :]
+        better = via < dist
+        dist = np.where(better, via, dist)
+        nxt = np.where(better, nxt[:, k:k + 1], nxt)
+
+    return {
+        "nodes": nodes,
+        "stay_days": stay_days,
+        "edges": edges,
+        "dist": [[round(float(d), 3) if np.isfinite(d) else None for d in row] for row in dist],
+        "next": nxt.astype(int).tolist(),
+    }
+
+
+def save_route_graph(data: dict, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+# ---------- Name matching ----------
+def name_variants(name: str):
+    """'Adam’s Peak (Sri Pada)' -> {'adam’s peak (sri pada)', 'adam’s peak', 'sri pada'}."""
+    variants = {name.lower()}
+    base, _, inner = name.partition("(")
+    base, inner = base.strip().lower(), inner.strip(" )").lower()
+    variants.add(base)
+    if inner and inner != "fort":
+        variants.add(inner)
+    for part in base.split("/"):
+        variants.add(part.strip())
+    if base.endswith(" national park"):
+        variants.add(base[: -len(" national park")])
+    variants.update({v.replace("’", "'") for v in variants})
+    return {v for v in variants if v}
+
+
+def parse_day_budget(text: str):
+    text = text.lower()
+    m = re.search(r"(\d+|[a-z]+)[\s-]*(day|night)s?\b", text)
+    if m and (m.group(1).isdigit() or m.group(1) in _NUMBER_WORDS):
+        value = m.group(1)
+        return int(value) if value.isdigit() else _NUMBER_WORDS[value]
+    m = re.search(r"(\d+|[a-z]+|a)[\s-]*weeks?\b", text)
+    if m:
+        value = m.group(1)
+        if value.isdigit():
+            return 7 * int(value)
+        if value == "a":
+            return 7
+        if value in _NUMBER_WORDS:
+            return 7 * _NUMBER_WORDS[value]
+    return None
+
+
+# ---------- Query time ----------
+class RouteGraph:
+    def __init__(self, data: dict):
+        self.nodes = data["nodes"]
+        self.pos = {name: i for i, name in enumerate(self.nodes)}
+        self.stay_days = data["stay_days"]
+        self.edges = data["edges"]
+        self.dist = np.array(
+            [[np.inf if d is None else d for d in row] for row in data["dist"]]
+        )
+        self.next = np.array(data["next"], dtype=int)
+
+        self._patterns = []
+        for name in self.nodes:
+            for variant in name_variants(name):
+                pattern = re.compile(r"(?<![a-z])" + re.escape(variant) + r"(?![a-z])")
+                self._patterns.append((pattern, name))
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def find_places(self, text: str):
+        """Known places mentioned in `text`, in order of first mention."""
+        text = text.lower().replace("’", "'")
+        first_seen = {}
+        for pattern, name in self._patterns:
+            m = pattern.search(text)
+            if m and m.start() < first_seen.get(name, len(text) + 1):
+                first_seen[name] = m.start()
+        return sorted(first_seen, key=first_seen.get)
+
+    def hours(self, a: str, b: str) -> float:
+        return float(self.dist[self.pos[a], self.pos[b]])
+
+    def path(self, a: str, b: str):
+        """Shortest path as a list of legs (dicts), or None if unreachable."""
+        i, j = self.pos[a], self.pos[b]
+        if self.next[i, j] < 0:
+            return None
+        legs = []
+        while i != j:
+            k = int(self.next[i, j])
+            edge = self.edges[f"{min(i, k)}|{max(i, k)}"]
+            legs.append({"from": self.nodes[i], "to": self.nodes[k], **edge})
+            i = k
+        return legs
+
+    def _tour_hours(self, order) -> float:
+        return sum(self.hours(a, b) for a, b in zip(order, order[1:]))
+
+    def order_stops(self, stops, start: str = None):
+        """Order `stops` to minimise total travel time (open path)."""
+        stops = list(dict.fromkeys(stops))
+        rest = [s for s in stops if s != start]
+        head = [start] if start else []
+
+        if len(rest) <= MAX_EXACT_STOPS:
+            best = min(
+                (head + list(p) for p in itertools.permutations(rest)),
+                key=self._tour_hours,
+            )
+            return best
+
+        # Nearest neighbour, then 2-opt improvement
+        order = head + [rest.pop(0)] if not head else head
+        while rest:
+            last = order[-1]
+            nearest = min(rest, key=lambda s: self.hours(last, s))
+            order.append(nearest)
+            rest.remove(nearest)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(1 if start else 0, len(order) - 1):
+                for j in range(i + 2, len(order) + 1):
+                    candidate = order[:i] + order[i:j][::-1] + order[j:]
+                    if self._tour_hours(candidate) + 1e-9 < self._tour_hours(order):
+                        order, improved = candidate, True
+        return order
+
+    def _days(self, order) -> float:
+        # Transit-only nodes (e.g. the airport) have no recommended stay
+        stay = sum(self.stay_days.get(s, 0.0) for s in order)
+        return stay + self._tour_hours(order) / TRAVEL_HOURS_PER_DAY
+
+    def plan(self, stops, day_budget: float = None, start: str = None) -> dict:
+        """
+        Order `stops` into the fastest feasible route. If a day budget is
+        given, stops are dropped (largest day saving first, never `start`)
+        until the trip fits.
+        """
+        stops = [s for s in dict.fromkeys(stops) if s in self.pos]
+        # Keep the largest group of mutually reachable stops (the start's group if given)
+        def reach(a):
+            return [s for s in stops if np.isfinite(self.hours(a, s))]
+
+        anchor = start if start in stops else max(stops, key=lambda s: len(reach(s)), default=None)
+        kept = reach(anchor) if anchor else []
+        unreachable = [s for s in stops if s not in kept]
+        stops = kept
+
+        order = self.order_stops(stops, start=start)
+        dropped = []
+        while day_budget is not None and len(order) > 1 and self._days(order) > day_budget:
+            candidates = [s for s in order if s != start]
+            drop = min(
+                candidates,
+                key=lambda s: self._days(self.order_stops([o for o in order if o != s], start)),
+            )
+            dropped.append(drop)
+            order = self.order_stops([o for o in order if o != drop], start=start)
+
+        legs = []
+        for a, b in zip(order, order[1:]):
+            legs.extend(self.path(a, b) or [])
+
+        return {
+            "order": order,
+            "legs": legs,
+            "stay_days": sum(self.stay_days.get(s, 0.0) for s in order),
+            "travel_hours_min": sum(leg["hours_min"] for leg in legs),
+            "travel_hours_max": sum(leg["hours_max"] for leg in legs),
+            "total_days": round(self._days(order), 1),
+            "day_budget": day_budget,
+            "feasible": day_budget is None or self._days(order) <= day_budget,
+            "dropped": dropped,
+            "unreachable": unreachable,
+        }
+
+
+def format_plan(plan: dict) -> str:
+    """Render a plan as a CONTEXT chunk of structured facts."""
+    lines = ["[ROUTE PLAN] Precomputed from the route graph (use these travel times)"]
+    lines.append("Order: " + " → ".join(plan["order"]))
+    for leg in plan["legs"]:
+        scenic = ", scenic" if leg["scenic"] else ""
+        lines.append(
+            f"- {leg['from']} → {leg['to']}: {leg['transport']}, "
+            f"{leg['hours_min']:g}–{leg['hours_max']:g} h{scenic}"
+        )
+    lines.append(
+        f"Total travel: {plan['travel_hours_min']:g}–{plan['travel_hours_max']:g} h; "
+        f"recommended stay: {plan['stay_days']:g} days; "
+        f"estimated trip length: {plan['total_days']:g} days"
+    )
+    if plan["day_budget"] is not None:
+        verdict = "fits" if plan["feasible"] else "does not fit"
+        lines.append(f"Day budget: {plan['day_budget']} days ({verdict})")
+    if plan["dropped"]:
+        lines.append("Dropped to fit the budget: " + ", ".join(plan["dropped"]))
+    if plan["unreachable"]:
+        lines.append("No route data for: " + ", ".join(plan["unreachable"]))
+    return "\n".join(lines)
+
+
+def route_facts(graph: RouteGraph, question: str):
+    """CONTEXT facts for questions naming two or more places, else None."""
+    places = graph.find_places(question)
+    if len(places) < 2:
+        return None
+    start = None
+    m = re.search(r"\b(?:from|starting (?:in|at|from)|arriv\w* (?:in|at))\s+(.+)", question.lower())
+    if m:
+        after = graph.find_places(m.group(1))
+        start = after[0] if after else None
+    plan = graph.plan(places, day_budget=parse_day_budget(question), start=start)
+    if len(plan["order"]) < 2:
+        return None
+    return format_plan(plan)
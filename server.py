@@ -0,0 +1,464 @@
+# server.py
+"""
+Async HTTP API for CeylonTrip (aiohttp).
+
+    POST /chat       {"question": "...", "stream": false, "voice": "web"}
+                     -> {"answer": "...", "timings": {...}}
+                     With "stream": true (or Accept: text/event-stream) the
+                     reply is Server-Sent Events: `data: {"token": "..."}`
+                     per piece, then `event: done` with the full answer.
+                     503 with the "busy" reply when the LLM queue is full
+                     (or, mid-stream, `event: busy` if the wait ran past
+                     its deadline).
+    POST /retrieve   {"query": "...", "top_k": 5} -> {"chunks": [{id, source, text, score}]}
+    GET  /health     200 when the index is loaded, 503 while starting or draining
+    GET  /metrics    per-stage latency and LLM token histograms (Prometheus text)
+
+Concurrent requests are coalesced into micro-batches: questions arriving
+within --window-ms of each other share one `encode` call and one FAISS
+search (engine.prepare_turns / retrieve_scored_batch). That CPU-bound work
+runs on a thread pool so the event loop keeps serving streams; LLM calls go
+through the shared AsyncOllamaClient (or AsyncLLMPool over several hosts
+with OLLAMA_ENDPOINTS), which is warmed up (model loaded,
+prompt prefix primed) right after the index loads and, with
+OLLAMA_HEARTBEAT_S set, kept loaded through idle periods. Chat turns reach
+it through an AsyncLLMScheduler (llm_scheduler.py): a concurrency cap, a
+bounded queue with deadlines, and one generation per identical prompt.
+
+On SIGINT/SIGTERM the server stops accepting requests (503), lets in-flight
+ones finish for up to --shutdown-timeout seconds, then closes the batchers
+and the LLM client.
+
+    python server.py --port 8080 [--window-ms 5] [--max-batch 64] [--workers 2]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import engine
+import metrics
+from llm_client import HEARTBEAT_S, create_async_client
+from llm_scheduler import AsyncLLMScheduler, SchedulerBusy, MAX_CONCURRENCY
+
+BATCH_WINDOW_MS = float(os.environ.get("CEYLONTRIP_BATCH_WINDOW_MS", "5"))
+MAX_BATCH = int(os.environ.get("CEYLONTRIP_MAX_BATCH", "64"))
+CPU_WORKERS = int(os.environ.get("CEYLONTRIP_SERVER_WORKERS", "2"))
+
+CHUNK_FIELDS = ("id", "source", "text")
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many requests and calls `fn(items)` once
+    per batch on `executor`. A batch closes after `window_ms` from its first
+    item or when it reaches `max_batch` items; while one batch runs, the
+    next one fills up.
+    """
+
+    def __init__(self, fn, executor, window_ms: float = BATCH_WINDOW_MS, max_batch: int = MAX_BATCH):
+        self.fn = fn
+        self.executor = executor
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue()
+        self._task = None
+        self.stats = {"batches": 0, "items": 0}
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("server shutting down"))
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, item):
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window_s
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Requests that gave up (client disconnected) are not computed
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                continue
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.fn, [item for item, _ in batch]
+                )
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+
+# ---------- Batch functions (run on the thread pool) ----------
+def prepare_batch(items):
+    """
+    items: [(question, voice)] -> [(reply, messages, q_vec, namespace, response_key)]
+
+    Turns that need the LLM are also looked up in the response cache here,
+    so its SQLite reads stay off the event loop. A hit comes back with both
+    `reply` and `messages` set.
+    """
+    by_voice = {}
+    for i, (question, voice) in enumerate(items):
+        by_voice.setdefault(voice, []).append(i)
+    turns = [None] * len(items)
+    for voice, rows in by_voice.items():
+        for i, (reply, messages, q_vec, namespace) in zip(
+            rows, engine.prepare_turns([items[i][0] for i in rows], voice)
+        ):
+            key = None
+            if reply is None:
+                # Another process may already have generated this exact prompt
+                key, reply = engine.cached_response(messages, namespace)
+            turns[i] = (reply, messages, q_vec, namespace, key)
+    return turns
+
+
+def retrieve_batch(items):
+    """items: [(query, top_k)] -> [[chunk dict]]"""
+    queries = [q for q, _ in items]
+    top_k = max(k for _, k in items)
+    # Pin one version so a hot reload can't pair one embedder with another index
+    bundle = engine.current_bundle()
+    q_vecs = engine.embed_queries(queries, bundle=bundle)
+    results = engine.retrieve_scored_batch(queries, q_vecs, top_k=top_k, bundle=bundle)
+    return [
+        [{**{f: c.get(f) for f in CHUNK_FIELDS}, "score": round(score, 4)} for c, score in scored[:k]]
+        for scored, (_, k) in zip(results, items)
+    ]
+
+
+# ---------- Handlers ----------
+def _sse(data: dict, event: str = None) -> bytes:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _read_json(request: web.Request) -> dict:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="body must be JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="body must be a JSON object")
+    return body
+
+
+def _busy(voice: str, timings: dict) -> web.Response:
+    return web.json_response(
+        {"answer": engine.REPLIES[voice]["busy"], "busy": True, "timings": timings},
+        status=503, headers={"Retry-After": "5"},
+    )
+
+
+def _store_response(app: web.Application, key, reply: str):
+    # SQLite may wait up to BUSY_TIMEOUT_S for the write lock, so write on the
+    # thread pool; the response doesn't wait for it
+    if key is not None:
+        asyncio.get_running_loop().run_in_executor(app["executor"], engine.store_response, key, reply)
+
+
+def _check_serving(app: web.Application):
+    state = app["state"]
+    if state["draining"]:
+        raise web.HTTPServiceUnavailable(text="shutting down")
+    if not state["ready"]:
+        raise web.HTTPServiceUnavailable(text="warming up")
+
+
+async def chat(request: web.Request) -> web.StreamResponse:
+    app = request.app
+    _check_serving(app)
+    body = await _read_json(request)
+    question = str(body.get("question", "")).strip()
+    if not question:
+        raise web.HTTPBadRequest(text="'question' is required")
+    voice = body.get("voice", "web")
+    if voice not in engine.REPLIES:
+        raise web.HTTPBadRequest(text=f"'voice' must be one of {sorted(engine.REPLIES)}")
+    stream = bool(body.get("stream")) or "text/event-stream" in request.headers.get("Accept", "")
+
+    start = time.perf_counter()
+    # Batched turns can't tell small talk, cache hits and "no context" apart
+    trace = metrics.Trace()
+    reply, messages, q_vec, namespace, response_key = await app["prepare"].submit((question, voice))
+    prepared = time.perf_counter()
+    timings = {"prepare_s": prepared - start}
+    llm = app["scheduler"]
+    path = "llm" if messages is not None else "canned"
+    if reply is not None and messages is not None:
+        path = "response_cache"
+        engine.answer_cache.put(q_vec, reply, namespace)
+
+    if not stream:
+        if reply is None:
+            try:
+                with trace.activate():
+                    reply = await llm.chat(messages)
+                    metrics.observe_stage("llm", time.perf_counter() - prepared)
+            except SchedulerBusy:
+                trace.finish("busy")
+                timings["total_s"] = time.perf_counter() - start
+                return _busy(voice, timings)
+            engine.answer_cache.put(q_vec, reply, namespace)
+            _store_response(app, response_key, reply)
+        trace.finish(path)
+        timings["total_s"] = time.perf_counter() - start
+        return web.json_response({"answer": reply, "timings": timings})
+
+    pieces = None
+    if reply is None:
+        # Admitted (or turned away) before the event stream starts
+        try:
+            with trace.activate():
+                pieces = llm.chat_stream(messages)
+        except SchedulerBusy:
+            trace.finish("busy")
+            timings["total_s"] = time.perf_counter() - start
+            return _busy(voice, timings)
+
+    resp = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await resp.prepare(request)
+    parts = []
+    try:
+        if reply is not None:
+            parts.append(reply)
+            timings["ttft_s"] = time.perf_counter() - start
+            await resp.write(_sse({"token": reply}))
+        else:
+            # Closing the stream tells the scheduler when a client went away
+            async with contextlib.aclosing(pieces):
+                with trace.activate():
+                    async for piece in pieces:
+                        if "ttft_s" not in timings:
+                            timings["ttft_s"] = time.perf_counter() - start
+                            metrics.observe_stage("llm_ttft", time.perf_counter() - prepared)
+                        parts.append(piece)
+                        await resp.write(_sse({"token": piece}))
+                    metrics.observe_stage("llm", time.perf_counter() - prepared)
+            # Only complete generations are cached
+            engine.answer_cache.put(q_vec, "".join(parts), namespace)
+            _store_response(app, response_key, "".join(parts))
+        trace.finish(path)
+        timings["total_s"] = time.perf_counter() - start
+        await resp.write(_sse({"answer": "".join(parts), "timings": timings}, event="done"))
+    except ConnectionResetError:
+        # Client went away mid-stream; nothing left to send
+        return resp
+    except SchedulerBusy:
+        # Waited in the LLM queue past the deadline
+        trace.finish("busy")
+        await resp.write(_sse({"answer": engine.REPLIES[voice]["busy"]}, event="busy"))
+    except Exception as e:
+        await resp.write(_sse({"error": str(e)}, event="error"))
+    await resp.write_eof()
+    return resp
+
+
+async def retrieve(request: web.Request) -> web.Response:
+    _check_serving(request.app)
+    body = await _read_json(request)
+    query = str(body.get("query", "")).strip()
+    if not query:
+        raise web.HTTPBadRequest(text="'query' is required")
+    try:
+        top_k = int(body.get("top_k", 5))
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(text="'top_k' must be an integer")
+    if not 1 <= top_k <= 50:
+        raise web.HTTPBadRequest(text="'top_k' must be between 1 and 50")
+    chunks = await request.app["retrieve"].submit((query, top_k))
+    return web.json_response({"chunks": chunks})
+
+
+async def health(request: web.Request) -> web.Response:
+    app = request.app
+    state = app["state"]
+    status = "draining" if state["draining"] else "ok" if state["ready"] else "starting"
+    response_cache = None
+    if engine.response_cache is not None:
+        # stats() scans the SQLite table; a locked WAL must not stall the loop
+        response_cache = await asyncio.get_running_loop().run_in_executor(
+            app["executor"], engine.response_cache.stats
+        )
+    body = {
+        "status": status,
+        "error": state["load_error"],
+        "index_version": engine.current_bundle().version,
+        "batches": {
+            name: {**app[name].stats, "queue_depth": app[name].depth}
+            for name in ("prepare", "retrieve")
+        },
+        "answer_cache": engine.answer_cache.stats(),
+        "response_cache": response_cache,
+        "context": engine.context_stats.stats(),
+        "intents": engine.intent_stats.stats(),
+        "lookup": engine.lookup_stats.stats(),
+    }
+    if hasattr(app["llm"], "stats"):
+        body["llm"] = app["llm"].stats()
+    if app["scheduler"] is not app["llm"]:
+        body["scheduler"] = app["scheduler"].stats()
+    return web.json_response(body, status=200 if status == "ok" else 503)
+
+
+async def metrics_text(request: web.Request) -> web.Response:
+    return web.Response(
+        body=metrics.registry.render_prometheus().encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+# ---------- App lifecycle ----------
+async def _on_startup(app: web.Application):
+    executor = ThreadPoolExecutor(max_workers=app["workers"], thread_name_prefix="ceylontrip-cpu")
+    app["executor"] = executor
+    app["prepare"] = MicroBatcher(prepare_batch, executor, app["window_ms"], app["max_batch"])
+    app["retrieve"] = MicroBatcher(retrieve_batch, executor, app["window_ms"], app["max_batch"])
+    app["prepare"].start()
+    app["retrieve"].start()
+    app["llm"] = create_async_client()
+    # Chat turns only; warm-up and heartbeat requests skip the queue
+    app["scheduler"] = AsyncLLMScheduler(app["llm"]) if MAX_CONCURRENCY > 0 else app["llm"]
+    loop = asyncio.get_running_loop()
+    app["loader"] = loop.create_task(_load(app))
+    app["heartbeat"] = (
+        loop.create_task(_heartbeat(app, HEARTBEAT_S)) if HEARTBEAT_S > 0 else None
+    )
+
+
+async def _load(app: web.Application):
+    try:
+        await asyncio.get_running_loop().run_in_executor(app["executor"], engine.load_all)
+        app["state"]["ready"] = True
+    except Exception as e:
+        app["state"]["load_error"] = str(e)
+        return
+    if engine.LLM_WARMUP:
+        try:
+            # Load the model and prime the static prompt prefix before traffic
+            await app["llm"].warm_up(engine.priming_messages())
+        except Exception as e:
+            print(f"[warm-up] Ollama: {e}", file=sys.stderr)
+
+
+async def _heartbeat(app: web.Application, interval_s: float):
+    """Re-load the model whenever the API was idle for `interval_s`."""
+    llm = app["llm"]
+    while True:
+        idle = time.monotonic() - llm.last_request
+        if idle >= interval_s:
+            try:
+                await llm.warm_up()
+            except Exception:
+                pass  # Ollama down: try again next interval
+            idle = 0.0
+        await asyncio.sleep(interval_s - idle)
+
+
+async def _on_shutdown(app: web.Application):
+    # New requests get 503 while the runner waits for in-flight ones
+    app["state"]["draining"] = True
+
+
+async def _on_cleanup(app: web.Application):
+    app["loader"].cancel()
+    if app["heartbeat"] is not None:
+        app["heartbeat"].cancel()
+    await app["prepare"].stop()
+    await app["retrieve"].stop()
+    await app["llm"].close()
+    app["executor"].shutdown(wait=False)
+
+
+def make_app(window_ms: float = BATCH_WINDOW_MS, max_batch: int = MAX_BATCH,
+             workers: int = CPU_WORKERS) -> web.Application:
+    app = web.Application()
+    app["window_ms"] = window_ms
+    app["max_batch"] = max_batch
+    app["workers"] = workers
+    # Mutable after startup (the app's own mapping is frozen by then)
+    app["state"] = {"ready": False, "draining": False, "load_error": None}
+    app.router.add_post("/chat", chat)
+    app.router.add_post("/retrieve", retrieve)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_text)
+    app.on_startup.append(_on_startup)
+    app.on_shutdown.append(_on_shutdown)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CeylonTrip HTTP API.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS,
+                        help="micro-batch collection window")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--workers", type=int, default=CPU_WORKERS,
+                        help="threads for embedding / search")
+    parser.add_argument("--shutdown-timeout", type=float, default=30.0,
+                        help="seconds to let in-flight requests finish on shutdown")
+    args = parser.parse_args()
+    web.run_app(
+        make_app(args.window_ms, args.max_batch, args.workers),
+        host=args.host,
+        port=args.port,
+        shutdown_timeout=args.shutdown_timeout,
+    )
+
+
+if __name__ == "__main__":
+    main()
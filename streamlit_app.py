@@ -1,150 +1,59 @@
 # streamlit_app.py
-import os
-import json
-import requests
-
 import streamlit as st
-import faiss
-from sentence_transformers import SentenceTransformer
-
-# ---------- Paths ----------
-BASE_DIR = os.path.dirname(__file__)
-DATA_DIR = os.path.join(BASE_DIR, "data")
-INDEX_DIR = os.path.join(DATA_DIR, "index")
-
-INDEX_PATH = os.path.join(INDEX_DIR, "faiss.index")
-META_PATH = os.path.join(INDEX_DIR, "meta.json")
-
-# ---------- Models / Ollama ----------
-EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
-
-# Make sure this matches a model you actually pulled, e.g. "llama3.2:1b" or "llama3.1:3b"
-OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2:1b")
-
-# ---------- System prompt ----------
-SYSTEM_PROMPT = """
-You are CeylonTrip, an AI travel assistant specialized ONLY in Sri Lanka.
-
-RULES:
-- You MUST answer ONLY questions related to travel in Sri Lanka.
-- If the user asks about another country, reply:
-  "I can only answer questions about traveling in Sri Lanka."
-- Use the provided CONTEXT when possible (destinations, routes, tips).
-- Do NOT invent live prices, real-time schedules, or current weather.
-- If something is not covered in the context, say you are not sure and suggest
-  what the traveler can check locally (guesthouses, official sites, operators).
-- Keep itineraries geographically sensible and mention approximate travel times.
-- Prefer clear bullet points and day-by-day plans for itineraries.
-- If the user message is small talk (e.g. "ok", "thanks", "hi"), respond briefly
-  and naturally without giving extra Sri Lanka information.
-""".strip()
-
-
-# ---------- Small-talk helpers ----------
-def is_small_talk(message: str) -> bool:
-    message = message.lower().strip()
-    smalltalk_phrases = {
-        "ok", "okay", "kk", "k",
-        "thanks", "thank you", "tnx", "thx",
-        "great", "nice", "cool", "awesome",
-        "hi", "hello", "hey",
-        "good", "good job", "well done",
-        "bye", "goodbye", "see you"
-    }
-    return message in smalltalk_phrases
-
-
-def small_talk_reply(message: str) -> str:
-    msg = message.lower().strip()
-    if msg in {"thanks", "thank you", "tnx", "thx"}:
-        return "You’re welcome! If you like, I can help you plan more Sri Lanka trips 🥥🌴"
-    if msg in {"hi", "hello", "hey"}:
-        return "Ayubowan! 🙏 I’m CeylonTrip. Ask me anything about traveling in Sri Lanka 🇱🇰"
-    if msg in {"bye", "goodbye", "see you"}:
-        return "Goodbye! Hope you have a beautiful journey in Sri Lanka one day 🐘🏝️"
-    return "Got it! Whenever you’re ready, ask me about Sri Lanka travel plans 🌴"
-
-
-# ---------- Cached resources ----------
-@st.cache_resource
-def load_index_and_meta():
-    if not (os.path.exists(INDEX_PATH) and os.path.exists(META_PATH)):
-        raise RuntimeError("Index not found. Run `python build_index.py` first.")
-    index = faiss.read_index(INDEX_PATH)
-    with open(META_PATH, "r", encoding="utf-8") as f:
-        meta = json.load(f)
-    return index, meta
-
-
-@st.cache_resource
-def get_embedder():
-    return SentenceTransformer(EMBED_MODEL_NAME)
-
-
-# ---------- Retrieval ----------
-def retrieve(query: str, top_k: int = 5):
-    index, meta = load_index_and_meta()
-    model = get_embedder()
-
-    q_vec = model.encode([query]).astype("float32")
-    D, I = index.search(q_vec, k=min(top_k, len(meta)))
-
-    chunks = []
-    for idx in I[0]:
-        idx_int = int(idx)
-        if 0 <= idx_int < len(meta):
-            chunks.append(meta[idx_int]["text"])
-    return chunks
-
-
-# ---------- Call Ollama ----------
-def call_ollama(messages):
-    url = f"{OLLAMA_URL}/api/chat"
-    payload = {
-        "model": OLLAMA_MODEL,
-        "messages": messages,
-        "stream": False,
-    }
-    resp = requests.post(url, json=payload, timeout=300)
-    resp.raise_for_status()
-    data = resp.json()
-    if "message" in data and "content" in data["message"]:
-        return data["message"]["content"]
-    return data.get("content") or data.get("response") or str(data)
-
-
-# ---------- Build answer ----------
-def answer_question(user_question: str) -> str:
-    # Small talk → no RAG
-    if is_small_talk(user_question):
-        return small_talk_reply(user_question)
-
-    context_chunks = retrieve(user_question, top_k=5)
-
-    if not context_chunks:
-        return "I can only help with travel questions related to Sri Lanka 🇱🇰."
-
-    context_text = "\n\n---\n\n".join(context_chunks)
-
-    user_block = f"""
-Use the following CONTEXT about Sri Lanka to answer the QUESTION.
-If the CONTEXT is insufficient, say you are not sure and explain what the traveler
-should check locally (e.g. with accommodation, official sites, or operators).
-
-CONTEXT:
-{context_text}
-
-QUESTION:
-{user_question}
-""".strip()
-
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": user_block},
+
+import engine
+import metrics
+from llm_client import get_client
+
+
+def format_timings(timings: dict) -> str:
+    return (
+        f"⏱️ first token {timings['ttft_s']:.1f}s · "
+        f"total {timings['total_s']:.1f}s"
+    )
+
+
+def format_stages(timings: dict) -> str:
+    stages = " · ".join(f"{k} {v * 1000:.0f}ms" for k, v in timings.get("stages", {}).items())
+    llm = timings.get("llm") or {}
+    if "tokens_per_s" in llm:
+        stages += f" · {llm['tokens_per_s']:.0f} tok/s"
+    if "prompt_tokens" in llm:
+        stages += f" · {llm['prompt_tokens']} prompt tokens"
+    return f"🔧 {stages}" if stages else ""
+
+
+def render_debug_panel():
+    snapshot = metrics.registry.snapshot()
+    st.markdown("**🔧 Latency by stage** (p50 / p95 ms)")
+    rows = [
+        {"stage": stage, "n": s["count"], "p50": round(s["p50_ms"], 1), "p95": round(s["p95_ms"], 1)}
+        for stage, s in snapshot["stages"].items()
     ]
-    reply = call_ollama(messages)
-    return reply
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+    llm = snapshot["llm"]
+    if "tokens_per_s" in llm:
+        st.caption(f"LLM: {llm['tokens_per_s']['p50']:.0f} tok/s p50")
+    if "prompt_tokens" in llm:
+        st.caption(f"Prompt: {llm['prompt_tokens']['mean']:.0f} tokens on average")
+    if snapshot["turns"]:
+        st.caption("Turns: " + ", ".join(f"{k} {v}" for k, v in sorted(snapshot["turns"].items())))
+    client = get_client()
+    if hasattr(client, "stats"):
+        st.markdown("**🖥️ LLM endpoints** (ttft p50 / p95 ms)")
+        st.dataframe(
+            [
+                {
+                    "endpoint": e["endpoint"], "model": e["model"],
+                    "in flight": f"{e['in_flight']}/{e['max_in_flight']}",
+                    "healthy": e["healthy"], "requests": e["requests"], "errors": e["errors"],
+                    "p50": round(e.get("ttft_p50_ms", 0.0)), "p95": round(e.get("ttft_p95_ms", 0.0)),
+                }
+                for e in client.stats()["endpoints"]
+            ],
+            hide_index=True, use_container_width=True,
+        )
 
 
 # ---------- Streamlit basic config ----------
@@ -250,6 +159,9 @@ textarea {
 """
 st.markdown(TROPICAL_CSS, unsafe_allow_html=True)
 
+# Load the embedding model and index in the background while the page draws
+engine.warm_up()
+
 # ---------- Sidebar ----------
 with st.sidebar:
     st.markdown("## 🇱🇰 CeylonTrip")
@@ -276,6 +188,34 @@ _No live prices or real-time schedules – think of me as a smart guidebook._
 - 🚂 *“How to combine Kandy, Ella and the south coast?”*  
         """
     )
+    cache_stats = engine.answer_cache.stats()
+    st.caption(
+        f"⚡ Answer cache: {cache_stats['hits']} hits · "
+        f"{cache_stats['misses']} misses"
+    )
+    if engine.response_cache is not None:
+        response_stats = engine.response_cache.stats()
+        st.caption(
+            f"💾 Response cache: {response_stats['hits']} hits · "
+            f"{response_stats.get('entries', 0)} replies on disk"
+        )
+    if engine.llm_scheduler is not None:
+        queue_stats = engine.llm_scheduler.stats()
+        st.caption(
+            f"🚦 LLM queue: {queue_stats['running']} running · {queue_stats['queue_depth']} waiting · "
+            f"{queue_stats['rejected'] + queue_stats['expired']} turned away"
+        )
+    context_stats = engine.context_stats.stats()
+    st.caption(f"✂️ Context budget: ~{context_stats['saved_tokens']} prompt tokens saved")
+    intent_stats = engine.intent_stats.stats()
+    st.caption(
+        f"🧭 Intent router: {intent_stats['llm_avoided_frac']:.0%} of turns answered without the LLM"
+    )
+    lookup_stats = engine.lookup_stats.stats()
+    st.caption(f"📋 Fast-path lookups: {lookup_stats['hit_rate']:.0%} of questions answered from the tables")
+    debug = metrics.ENABLED and st.toggle("Debug: latency metrics", value=False)
+    if debug:
+        render_debug_panel()
 
 # ---------- Main content ----------
 st.markdown(
@@ -303,6 +243,10 @@ if "messages" not in st.session_state:
 for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
+        if msg.get("timings"):
+            st.caption(format_timings(msg["timings"]))
+            if debug:
+                st.caption(format_stages(msg["timings"]))
 
 # New user input
 user_input = st.chat_input("Ask about Sri Lanka travel… 🌴")
@@ -312,16 +256,32 @@ if user_input:
         st.markdown(user_input)
 
     with st.chat_message("assistant"):
-        # Tropical thinking spinner
+        # Tropical thinking spinner until the first token arrives,
+        # then render the reply live as it streams in.
         spinner_text = (
             '<span class="tropical-thinking">🌴</span>'
             "Brewing your Ceylon travel plan…"
         )
-        with st.spinner(spinner_text):
-            try:
-                reply = answer_question(user_input)
-            except Exception as e:
-                reply = f"Sorry, something went wrong: `{e}`"
-            st.markdown(reply, unsafe_allow_html=False)
-
-    st.session_state.messages.append({"role": "assistant", "content": reply})
+        placeholder = st.empty()
+        timings = {}
+        reply = ""
+        try:
+            pieces = engine.answer_question_stream(user_input, timings, voice="web")
+            with st.spinner(spinner_text):
+                reply = next(pieces, "")
+            placeholder.markdown(reply + "▌", unsafe_allow_html=False)
+            for piece in pieces:
+                reply += piece
+                placeholder.markdown(reply + "▌", unsafe_allow_html=False)
+        except Exception as e:
+            reply = f"Sorry, something went wrong: `{e}`"
+            timings = {}
+        placeholder.markdown(reply, unsafe_allow_html=False)
+        if "total_s" in timings:
+            st.caption(format_timings(timings))
+            if debug:
+                st.caption(format_stages(timings))
+
+    st.session_state.messages.append(
+        {"role": "assistant", "content": reply, "timings": timings or None}
+    )